@@ -0,0 +1,465 @@
+"""End-to-end benchmarks of ingestion, the database, synset lookups, the
+analyzer (against benchmarks.mock_llm_server) and the dashboard callbacks on a
+synthetic corpus. Results are written as JSON to results_directory, compare two
+runs with: python -m benchmarks.compare_results old.json new.json
+
+Run from the repository root with: python -m benchmarks.bench_pipeline
+"""
+import asyncio
+import collections
+import contextlib
+import copy
+import functools
+import importlib
+import io
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+import warnings
+
+import numpy as np
+import openai
+
+import csa_app.ai_processor_openai as ai_processor
+from csa_app import wordnet_snapshot
+from csa_app.contributor_resolution import ContributorCatalog
+from csa_app.database import DatabaseSqlLite
+from csa_app.hypernym_index import HypernymClosureIndex
+from csa_app.ingestion import ingest_file
+from csa_app.metrics import MetricsRecorder
+from csa_app.model import ContentBatch, SummaryBatch, convert_to_id
+from csa_app.near_duplicates import MinHashLshIndex
+from csa_app.sense_ranking import LexicalSenseRanker
+from csa_app.synset_database import SynsetDatabaseWordNet
+
+from . import synthetic_corpus
+from .mock_llm_server import MockLlmServer
+
+
+# Configuration
+
+results_directory = "benchmarks/results"
+seed = 1
+ingestion_rows = 200000
+ingestion_workers = None  # defaults to the number of CPUs
+large_number_of_content = 1000000
+large_summarized_fraction = 0.5
+summary_batch_size = 1000
+hypernym_index_size = 120000
+parent_id_lookups = 20000
+batch_memory_records = 20000
+contributor_catalog_size = 100000
+contributor_lookups = 20000
+analyzer_contents = 400
+analyzer_batch_size = 100
+mock_latency = 0.2
+mock_latency_jitter = 0.1
+mock_error_rate = 0.02
+query_repeats = 20
+
+
+def _timings(func, repeat: int) -> dict:
+    durations = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        durations.append(time.perf_counter() - start)
+    p50, p95 = np.percentile(durations, [50, 95])
+    return {"p50_ms": p50 * 1000, "p95_ms": p95 * 1000, "repeat": repeat}
+
+
+def bench_ingestion(directory: str) -> dict:
+    corpus_path = os.path.join(directory, "corpus.csv")
+    synthetic_corpus.write_corpus(corpus_path, ingestion_rows, seed)
+    results = {}
+    for name, clustered in (("plain", False), ("near_duplicate_clustering", True)):
+        db_file_path = os.path.join(directory, f"ingest_{name}.db")
+        database = DatabaseSqlLite(db_file_path)
+        index = MinHashLshIndex(db_file_path) if clustered else None
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            written = ingest_file(
+                corpus_path, database, synthetic_corpus.FIELD_MAPPING, "twitter", "unknown",
+                workers=ingestion_workers, near_duplicate_index=index,
+            )
+        duration = time.perf_counter() - start
+        results[name] = {"rows": written, "seconds": duration, "rows_per_second": written / duration}
+    return results
+
+
+def _load_large_database(db_file_path: str, synset_ids) -> dict:
+    database = DatabaseSqlLite(db_file_path)
+    rng = random.Random(seed)
+
+    start = time.perf_counter()
+    batch = []
+    for i, row in enumerate(synthetic_corpus.generate_rows(large_number_of_content, seed)):
+        raw_details = json.dumps(row, sort_keys=True)
+        batch.append((convert_to_id(raw_details), row["content"], row["author"], "twitter", raw_details, row["publish_date"], rng.choice(["US", "EU", "APAC"]), None))
+        if len(batch) >= 50000:
+            database.add_content_rows(batch)
+            batch = []
+    if batch:
+        database.add_content_rows(batch)
+    content_seconds = time.perf_counter() - start
+
+    c = database.connections.connection()
+    hashes = [h for (h,) in c.execute("SELECT content_hash FROM content ORDER BY rowid LIMIT ?", (int(large_number_of_content * large_summarized_fraction),))]
+    start = time.perf_counter()
+    batch_durations = []
+    for i in range(0, len(hashes), summary_batch_size):
+        summaries = SummaryBatch.from_summaries(
+            synthetic_corpus.generate_summary(h, rng, synset_ids) for h in hashes[i : i + summary_batch_size]
+        )
+        batch_start = time.perf_counter()
+        database.add_summaries(summaries)
+        batch_durations.append(time.perf_counter() - batch_start)
+    summary_seconds = time.perf_counter() - start
+
+    return {
+        "content_rows": large_number_of_content,
+        "content_rows_per_second": large_number_of_content / content_seconds,
+        "add_summaries": {
+            "summaries": len(hashes),
+            "batch_size": summary_batch_size,
+            "summaries_per_second": len(hashes) / sum(batch_durations),
+            # wall time including generating the synthetic summaries
+            "seconds": summary_seconds,
+            "batch_p50_ms": float(np.percentile(batch_durations, 50) * 1000),
+            "batch_p95_ms": float(np.percentile(batch_durations, 95) * 1000),
+        },
+    }
+
+
+def bench_database(db_file_path: str, synset_ids) -> dict:
+    results = _load_large_database(db_file_path, synset_ids)
+    database = DatabaseSqlLite(db_file_path)
+
+    results["get_unanalyzed_content"] = _timings(lambda: database.get_unanalyzed_content(100), query_repeats)
+    start = time.perf_counter()
+    queued = database.enqueue_content("gpt-4o-mini", "v1")
+    results["enqueue_content"] = {"queued": queued, "seconds": time.perf_counter() - start}
+    results["claim_work"] = _timings(
+        lambda: database.claim_work("bench", "gpt-4o-mini", "v1", 100, 600), query_repeats
+    )
+
+    popular = synset_ids[0]
+    filters = {
+        "unfiltered": {},
+        "topic": {"topic_id": popular},
+        "topic_and_sentiment": {"topic_id": popular, "sentiment": True},
+        "method_and_contributor": {"method_id": popular, "contributor_id": popular},
+        "date_range": {"start_content_datetime": "2021-01-01", "end_content_datetime": "2021-03-31"},
+    }
+    results["lookup_sentiment_summaries"] = {
+        name: _timings(lambda f=f: database.lookup_sentiment_summaries(return_limit=1000, **f), query_repeats)
+        for name, f in filters.items()
+    }
+    results["lookup_sentiment_counts"] = {
+        f"{dimension}_{name}": _timings(
+            lambda d=dimension, f=f: database.lookup_sentiment_counts(
+                d, f.get("topic_id"), f.get("method_id"), f.get("contributor_id"), f.get("sentiment"),
+                f.get("start_content_datetime"), f.get("end_content_datetime"),
+            ),
+            query_repeats,
+        )
+        for dimension in ("sentiment", "topic", "contributor")
+        for name, f in filters.items()
+    }
+    return results
+
+
+def bench_parent_ids(index_path: str, hypernyms) -> dict:
+    start = time.perf_counter()
+    HypernymClosureIndex.build(index_path, hypernyms)
+    results = {"build_seconds": time.perf_counter() - start, "synsets": len(hypernyms)}
+
+    synset_database = SynsetDatabaseWordNet(hypernym_index_path=index_path)
+    ids = random.Random(seed).choices(sorted(hypernyms), k=parent_id_lookups)
+    start = time.perf_counter()
+    for synset_id in ids:
+        synset_database.get_parent_ids(synset_id)
+    results["index_us_per_call"] = (time.perf_counter() - start) / len(ids) * 1e6
+
+    # the WordNet walk is only measured where the corpus is installed
+    try:
+        from nltk.corpus import wordnet as wn
+
+        wordnet_ids = [s._name for s in list(wn.all_synsets(wn.NOUN))[:parent_id_lookups]]
+        walking = SynsetDatabaseWordNet()
+        start = time.perf_counter()
+        for synset_id in wordnet_ids:
+            walking.get_parent_ids(synset_id)
+        results["wordnet_walk_us_per_call"] = (time.perf_counter() - start) / len(wordnet_ids) * 1e6
+    except LookupError:
+        results["wordnet_walk_us_per_call"] = None
+    return results
+
+
+def _traced_bytes(build) -> int:
+    tracemalloc.start()
+    try:
+        before = tracemalloc.get_traced_memory()[0]
+        kept = build()
+        return tracemalloc.get_traced_memory()[0] - before
+    finally:
+        del kept
+        tracemalloc.stop()
+
+
+def bench_batch_memory(synset_ids) -> dict:
+    """Bytes per in-flight record held as dataclasses versus columnar batches,
+    counting what stays alive once the dataclasses have been converted.
+    Summaries carry a message log shaped like the analyzer's.
+    """
+    rng = random.Random(seed)
+    rows = list(synthetic_corpus.generate_rows(batch_memory_records, seed))
+    content_rows = [
+        (convert_to_id(json.dumps(row, sort_keys=True)), row["content"], row["author"], "twitter", json.dumps(row, sort_keys=True), row["publish_date"], "US", None)
+        for row in rows
+    ]
+    summaries = []
+    for content_hash, *_ in content_rows:
+        summary = synthetic_corpus.generate_summary(content_hash, rng, synset_ids)
+        summary.log = [
+            {"role": "system", "content": ai_processor.SENTIMENT_SYSTEM_PROMPT},
+            {"role": "user", "content": content_hash},
+            {"role": "assistant", "content": json.dumps(synthetic_corpus.NAMES)},
+        ]
+        summaries.append(summary)
+
+    results = {"records": batch_memory_records}
+    results["content_list_bytes_per_record"] = _traced_bytes(lambda: [ContentBatch.from_rows([r])[0] for r in content_rows]) / len(rows)
+    results["content_batch_bytes_per_record"] = _traced_bytes(lambda: ContentBatch.from_rows(content_rows)) / len(rows)
+    results["summary_list_bytes_per_record"] = _traced_bytes(lambda: copy.deepcopy(summaries)) / len(rows)
+    results["summary_batch_bytes_per_record"] = _traced_bytes(lambda: SummaryBatch.from_summaries(copy.deepcopy(summaries))) / len(rows)
+    return results
+
+
+def bench_wordnet_snapshot(directory: str, hypernyms) -> dict:
+    """Startup and lookups of SynsetDatabaseWordNet over a synthetic snapshot."""
+    snapshot_path = os.path.join(directory, "synthetic_snapshot")
+    start = time.perf_counter()
+    synthetic_corpus.write_snapshot(snapshot_path, hypernyms)
+    results = {"build_seconds": time.perf_counter() - start}
+
+    start = time.perf_counter()
+    synset_database = SynsetDatabaseWordNet(cache_size=0, snapshot_path=snapshot_path)
+    results["open_ms"] = (time.perf_counter() - start) * 1000
+
+    rng = random.Random(seed)
+    lemmas = [f"term{rng.randrange(len(hypernyms))}" + rng.choice(["", "s"]) for _ in range(parent_id_lookups)]
+    start = time.perf_counter()
+    for lemma in lemmas:
+        synset_database.get_noun_synsets(lemma)
+    results["synsets_us_per_call"] = (time.perf_counter() - start) / len(lemmas) * 1e6
+
+    ids = rng.choices(sorted(hypernyms), k=parent_id_lookups)
+    start = time.perf_counter()
+    for synset_id in ids:
+        synset_database.get_parent_ids(synset_id)
+    results["parent_ids_us_per_call"] = (time.perf_counter() - start) / len(ids) * 1e6
+    return results
+
+
+def bench_contributor_resolution() -> dict:
+    """Resolving known, misspelled and unknown names against a synthetic catalog."""
+    entities = synthetic_corpus.generate_entities(contributor_catalog_size, seed)
+    start = time.perf_counter()
+    catalog = ContributorCatalog(entities)
+    results = {"entities": len(catalog), "build_seconds": time.perf_counter() - start}
+
+    rng = random.Random(seed)
+    names = []
+    for _ in range(contributor_lookups):
+        name = rng.choice(entities).name
+        kind = rng.random()
+        if kind < 0.4:
+            names.append(name)
+        elif kind < 0.8:
+            names.append(synthetic_corpus.misspell(name, rng))
+        else:
+            names.append(f"Unknown Person {rng.randrange(100000)}")
+    start = time.perf_counter()
+    resolutions = catalog.resolve(names)
+    duration = time.perf_counter() - start
+    results["names"] = len(names)
+    results["names_per_second"] = len(names) / duration
+    methods = collections.Counter(r.method for r in resolutions)
+    results["methods"] = dict(methods)
+    # the share of names that would still go to the LLM
+    results["ambiguous_rate"] = methods["ambiguous"] / len(names)
+    return results
+
+
+def bench_analyzer(directory: str, synset_database) -> dict:
+    corpus = list(synthetic_corpus.generate_rows(analyzer_contents, seed + 1, duplicate_rate=0.0))
+    analyzer = importlib.import_module("d_01_analyze_content")
+    results = {}
+    for name, pack_max_records, wsd_questions_per_prompt, pipelined in (
+        ("one_request_per_call", 1, 1, False),
+        ("packed", 8, 8, False),
+        ("pipelined", 8, 8, True),
+    ):
+        server = MockLlmServer(latency=mock_latency, latency_jitter=mock_latency_jitter, error_rate=mock_error_rate, seed=seed).start()
+        aclient = openai.AsyncOpenAI(base_url=server.base_url, api_key="mock", max_retries=0)
+        metrics = MetricsRecorder()
+
+        database = DatabaseSqlLite(os.path.join(directory, f"analyzer_{name}.db"))
+        database.add_content_rows(
+            [
+                (convert_to_id(json.dumps(row, sort_keys=True)), row["content"], row["author"], "twitter", json.dumps(row, sort_keys=True), row["publish_date"], "US", None)
+                for row in corpus
+            ]
+        )
+
+        analyzer.metrics = metrics
+        analyzer.metrics_prometheus_file_path = None
+        analyzer.processor = functools.partial(ai_processor.process_async, model=analyzer.model_id, aclient=aclient, metrics=metrics)
+        analyzer.packed_processor = functools.partial(ai_processor.process_packed_async, model=analyzer.model_id, aclient=aclient, metrics=metrics)
+        analyzer.ambiguity_clarifier = functools.partial(ai_processor.process_multiple_choice_prompt_async, model=analyzer.model_id, aclient=aclient, metrics=metrics)
+        analyzer.batch_ambiguity_clarifier = functools.partial(ai_processor.process_multiple_choice_batch_prompt_async, model=analyzer.model_id, aclient=aclient, metrics=metrics)
+        analyzer.sense_ranker = LexicalSenseRanker(seed=seed)
+        analyzer.contributor_catalog = ContributorCatalog(synthetic_corpus.generate_entities(1000, seed))
+        analyzer.pack_max_records = pack_max_records
+        analyzer.wsd_questions_per_prompt = wsd_questions_per_prompt
+        analyzer.batch_size = analyzer_batch_size
+        analyzer.max_number_of_batches = analyzer_contents // analyzer_batch_size + 1
+        analyzer.use_work_queue = True
+        analyzer.worker_id = f"bench-{name}"
+        database.enqueue_content(analyzer.model_id, analyzer.prompt_strategy)
+
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()), warnings.catch_warnings():
+            # pydantic warns while dumping parsed completion messages into the logs
+            warnings.simplefilter("ignore", UserWarning)
+            if pipelined:
+                asyncio.run(analyzer.analyze_pipelined(database, synset_database))
+            else:
+                asyncio.run(analyzer.analyze_batches(database, synset_database))
+        duration = time.perf_counter() - start
+        server.shutdown()
+
+        with database.connections.connection() as c:
+            analyzed = c.execute("SELECT COUNT(*) FROM sentiment_summaries").fetchone()[0]
+        results[name] = {
+            "contents": analyzer_contents,
+            "analyzed": analyzed,
+            "seconds": duration,
+            "contents_per_second": analyzed / duration,
+            "requests": server.requests,
+            "injected_errors": server.errors,
+            "prompt_tokens": sum(metrics.prompt_tokens.values()),
+            "completion_tokens": sum(metrics.completion_tokens.values()),
+            "sense_ranker": analyzer.sense_ranker.stats(),
+        }
+    results["mock_server"] = {"latency": mock_latency, "latency_jitter": mock_latency_jitter, "error_rate": mock_error_rate}
+    return results
+
+
+def bench_dashboard(directory: str, hypernyms) -> dict:
+    """Imports the dashboard against directory/data.db and the WordNet snapshot
+    next to it, built from the synthetic synsets where WordNet is not installed.
+    """
+    snapshot_path = os.path.join(directory, "wordnet_snapshot")
+    try:
+        wordnet_snapshot.build_from_wordnet(snapshot_path)
+        search_index = "wordnet"
+    except LookupError:
+        synthetic_corpus.write_snapshot(snapshot_path, hypernyms)
+        search_index = "synthetic"
+
+    # the dashboard opens data.db relative to the working directory
+    repository_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    if repository_root not in sys.path:
+        sys.path.insert(0, repository_root)
+    cwd = os.getcwd()
+    os.chdir(directory)
+    try:
+        start = time.perf_counter()
+        dashboard = importlib.import_module("d_02_csa_dashboard")
+        results = {"import_seconds": time.perf_counter() - start, "search_index": search_index}
+
+        filters = dashboard.update_data(dashboard.ANY_VALUE, dashboard.ANY_VALUE, dashboard.ANY_VALUE)
+        for column in ("sentiment", "topic", "method", "contributor"):
+            start = time.perf_counter()
+            dashboard.update_bar_chart(column, filters)
+            results[f"update_bar_chart_{column}_cold_ms"] = (time.perf_counter() - start) * 1000
+            results[f"update_bar_chart_{column}"] = _timings(lambda c=column: dashboard.update_bar_chart(c, filters), query_repeats)
+            results[f"update_pie_chart_{column}"] = _timings(lambda c=column: dashboard.update_pie_chart(c, filters), query_repeats)
+
+        topic_filters = dashboard.update_data(dashboard.ANY_VALUE, dashboard.ANY_VALUE, sorted(hypernyms)[0])
+        results["update_bar_chart_topic_filtered"] = _timings(lambda: dashboard.update_bar_chart("contributor", topic_filters), query_repeats)
+        for term in ("inv", "investment", "investmnet", "concept"):
+            results[f"toggle_topic_search_{term}"] = _timings(lambda t=term: dashboard.toggle_topic_search(t), query_repeats)
+        results["toggle_method_search_term"] = _timings(lambda: dashboard.toggle_method_search("term12"), query_repeats)
+    finally:
+        os.chdir(cwd)
+    return results
+
+
+def _machine() -> dict:
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True).stdout.strip()
+    except OSError:
+        commit = None
+    return {
+        "platform": platform.platform(),
+        "python": sys.version.split()[0],
+        "cpus": os.cpu_count(),
+        "commit": commit,
+    }
+
+
+def run() -> dict:
+    hypernyms = synthetic_corpus.generate_hypernyms(hypernym_index_size, seed)
+    synset_ids = sorted(hypernyms)[:2000]
+
+    report = {
+        "started": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "machine": _machine(),
+        "config": {
+            "ingestion_rows": ingestion_rows,
+            "large_number_of_content": large_number_of_content,
+            "large_summarized_fraction": large_summarized_fraction,
+            "hypernym_index_size": hypernym_index_size,
+            "contributor_catalog_size": contributor_catalog_size,
+            "analyzer_contents": analyzer_contents,
+        },
+    }
+    with tempfile.TemporaryDirectory() as directory:
+        print("Benchmarking ingestion")
+        report["ingestion"] = bench_ingestion(directory)
+        print("Benchmarking database queries")
+        report["database"] = bench_database(os.path.join(directory, "data.db"), synset_ids)
+        print("Benchmarking batch memory")
+        report["batch_memory"] = bench_batch_memory(synset_ids)
+        print("Benchmarking get_parent_ids")
+        index_path = os.path.join(directory, "hypernym_index")
+        report["get_parent_ids"] = bench_parent_ids(index_path, hypernyms)
+        print("Benchmarking the WordNet snapshot")
+        report["wordnet_snapshot"] = bench_wordnet_snapshot(directory, hypernyms)
+        print("Benchmarking contributor resolution")
+        report["contributor_resolution"] = bench_contributor_resolution()
+        print("Benchmarking the analyzer against the mock server")
+        synset_database = synthetic_corpus.SyntheticSynsetDatabase(HypernymClosureIndex(index_path))
+        report["analyzer"] = bench_analyzer(directory, synset_database)
+        print("Benchmarking dashboard callbacks")
+        report["dashboard"] = bench_dashboard(directory, hypernyms)
+    return report
+
+
+if __name__ == "__main__":
+    report = run()
+    os.makedirs(results_directory, exist_ok=True)
+    file_path = os.path.join(results_directory, f"pipeline-{time.strftime('%Y%m%d-%H%M%S')}.json")
+    with open(file_path, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=4)
+    print(json.dumps(report, indent=4))
+    print(f"Saved to {file_path}")
@@ -0,0 +1,126 @@
+"""Concurrent reader/writer throughput of DatabaseSqlLite before and after the
+persistent WAL connection manager.
+
+Run from the repository root with: python -m benchmarks.bench_sqlite_concurrency
+"""
+import json
+import multiprocessing
+import os
+import sqlite3
+import tempfile
+import time
+
+from csa_app.database import DatabaseSqlLite
+from csa_app.model import Content, SentimentSummary
+
+
+# Configuration
+
+number_of_content = 20000
+number_of_readers = 4
+duration_seconds = 10
+write_batch_size = 100
+
+
+def _content(i):
+    return Content(f"c{i}", f"body {i}", "author", "twitter", {}, "2024-01-01", "US")
+
+
+def _summary(content_hash, model_id):
+    return SentimentSummary(
+        content_hash=content_hash,
+        model_id=model_id,
+        prompt_strategy="v1",
+        log=[],
+        discussion_duration=0.0,
+        sentiment=True,
+        justifications=[],
+        location=None,
+        content_datetime=None,
+        topic="topic",
+        topic_lemma="topic",
+        topic_values=["entity.n.01", "topic.n.01"],
+        contributors=[],
+        contributors_values=None,
+        method="method",
+        method_lemma="method",
+        method_values=["act.v.01"],
+    )
+
+
+class _PerCallConnections:
+    """The behaviour before the connection manager: a new connection per call
+    using the default rollback journal."""
+
+    def __init__(self, db_file_path):
+        self.db_file_path = db_file_path
+
+    def connection(self):
+        return sqlite3.connect(self.db_file_path)
+
+    def close(self):
+        pass
+
+
+def _worker(mode, role, db_file_path, worker_id, results):
+    operations = 0
+    errors = 0
+    database = DatabaseSqlLite(db_file_path, read_only=True)
+    if mode == "before":
+        database.connections = _PerCallConnections(db_file_path)
+    elif role == "writer":
+        database = DatabaseSqlLite(db_file_path)
+    end = time.time() + duration_seconds
+    batch = 0
+    while time.time() < end:
+        try:
+            if role == "reader":
+                database.lookup_sentiment_summaries(return_limit=1000)
+            else:
+                summaries = [
+                    _summary(f"c{i}", f"model-{worker_id}-{batch}")
+                    for i in range(write_batch_size)
+                ]
+                database.add_summaries(summaries)
+                batch += 1
+            operations += 1
+        except sqlite3.OperationalError:
+            errors += 1
+    results.put((role, operations, errors))
+
+
+def run(mode, directory):
+    db_file_path = os.path.join(directory, f"{mode}.db")
+    database = DatabaseSqlLite(db_file_path)
+    database.add_content([_content(i) for i in range(number_of_content)])
+    database.add_summaries([_summary(f"c{i}", "seed") for i in range(number_of_content)])
+    database.connections.close()
+    if mode == "before":
+        c = sqlite3.connect(db_file_path)
+        c.execute("PRAGMA journal_mode = DELETE")
+        c.close()
+
+    results = multiprocessing.Queue()
+    processes = [
+        multiprocessing.Process(target=_worker, args=(mode, "writer", db_file_path, 0, results))
+    ] + [
+        multiprocessing.Process(target=_worker, args=(mode, "reader", db_file_path, i + 1, results))
+        for i in range(number_of_readers)
+    ]
+    for p in processes:
+        p.start()
+    outcomes = [results.get() for _ in processes]
+    for p in processes:
+        p.join()
+
+    return {
+        "reads_per_second": sum(o[1] for o in outcomes if o[0] == "reader") / duration_seconds,
+        "write_batches_per_second": sum(o[1] for o in outcomes if o[0] == "writer") / duration_seconds,
+        "lock_errors": sum(o[2] for o in outcomes),
+    }
+
+
+if __name__ == "__main__":
+    with tempfile.TemporaryDirectory() as directory:
+        report = {mode: run(mode, directory) for mode in ("before", "after")}
+    print(json.dumps(report, indent=4))
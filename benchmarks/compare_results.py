@@ -0,0 +1,37 @@
+"""Prints the numeric results of two bench_pipeline runs side by side.
+
+Run from the repository root with:
+python -m benchmarks.compare_results benchmarks/results/old.json benchmarks/results/new.json
+"""
+import json
+import sys
+
+
+def flatten(report: dict, prefix: str = "") -> dict:
+    values = {}
+    for key, value in report.items():
+        name = f"{prefix}.{key}" if prefix else key
+        if isinstance(value, dict):
+            values.update(flatten(value, name))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            values[name] = value
+    return values
+
+
+def compare(old: dict, new: dict) -> str:
+    old_values = flatten({k: v for k, v in old.items() if k not in ("machine", "config")})
+    new_values = flatten({k: v for k, v in new.items() if k not in ("machine", "config")})
+    lines = [f"{'metric':<70}{'old':>14}{'new':>14}{'change':>10}"]
+    for name in sorted(set(old_values) | set(new_values)):
+        a, b = old_values.get(name), new_values.get(name)
+        change = f"{(b - a) / a * 100:+.1f}%" if a and b is not None else ""
+        lines.append(f"{name:<70}{'' if a is None else f'{a:.4g}':>14}{'' if b is None else f'{b:.4g}':>14}{change:>10}")
+    return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    with open(sys.argv[1], encoding="utf-8") as f:
+        old = json.load(f)
+    with open(sys.argv[2], encoding="utf-8") as f:
+        new = json.load(f)
+    print(compare(old, new))
@@ -0,0 +1,149 @@
+"""Local stand-in for the OpenAI chat completions endpoint.
+
+Answers the structured output schemas used by csa_app.ai_processor_openai
+with plausible content after a configurable latency, and fails a configurable
+fraction of requests with 429/500 responses to exercise the retry path. Point
+an openai client at it with base_url=f"http://127.0.0.1:{port}/v1".
+
+Run standalone with: python -m benchmarks.mock_llm_server 8008
+"""
+import http.server
+import json
+import random
+import re
+import sys
+import threading
+import time
+
+
+_QUESTION = re.compile(r"^Question (\d+):", re.MULTILINE)
+_OPTION = re.compile(r"^([A-Z])\) ", re.MULTILINE)
+_PACKED_ID = re.compile(r'<content id="([^"]+)">')
+
+
+def _sentiment_item(rng: random.Random, text: str) -> dict:
+    words = re.findall(r"[a-z]+", text.lower()) or ["thing"]
+    return {
+        "justifications_of_sentiment": ["synthetic justification"],
+        "sentiment": rng.choice(["negative", "positive", "neutral"]),
+        "names_of_contributors_that_cause_sentiment": ["Bob"],
+        "actions_causing_sentiment": "caused",
+        "action_lemma": "cause",
+        "action_tense": "past",
+        "topic": words[-1],
+        "topic_lemma": words[-1],
+        "lat_lng_of_topic_location": None,
+        "datetime_of_topic": None,
+    }
+
+
+def build_response_content(schema_name: str, user_content: str, rng: random.Random) -> dict:
+    if schema_name == "MultipleChoiceResponse":
+        letters = _OPTION.findall(user_content) or ["A"]
+        return {"letter": rng.choice(letters)}
+    if schema_name == "MultipleChoiceBatchResponse":
+        return {
+            "answers": [{"question": int(number), "letter": "A"} for number in _QUESTION.findall(user_content)]
+        }
+    if schema_name == "PackedSentimentResponse":
+        return {
+            "items": [
+                dict(_sentiment_item(rng, user_content), content_id=content_id)
+                for content_id in _PACKED_ID.findall(user_content)
+            ]
+        }
+    return _sentiment_item(rng, user_content)
+
+
+class MockLlmServer(http.server.ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, port: int = 0, latency: float = 0.2, latency_jitter: float = 0.1, error_rate: float = 0.0, seed: int = 1):
+        super().__init__(("127.0.0.1", port), _Handler)
+        self.latency = latency
+        self.latency_jitter = latency_jitter
+        self.error_rate = error_rate
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.errors = 0
+
+    @property
+    def base_url(self) -> str:
+        return f"http://127.0.0.1:{self.server_address[1]}/v1"
+
+    def start(self) -> "MockLlmServer":
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+
+class _Handler(http.server.BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status: int, body: dict, headers: dict = None):
+        payload = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def do_POST(self):
+        server: MockLlmServer = self.server
+        request = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        with server.lock:
+            server.requests += 1
+            failing = server.rng.random() < server.error_rate
+            status = server.rng.choice([429, 500]) if failing else 200
+            server.errors += failing
+            delay = max(0.0, server.latency + server.rng.uniform(-server.latency_jitter, server.latency_jitter))
+            rng = random.Random(server.rng.random())
+        time.sleep(delay)
+
+        if not self.path.endswith("/chat/completions"):
+            self._send(404, {"error": {"message": "not found"}})
+            return
+        if status != 200:
+            self._send(status, {"error": {"message": "mock failure", "type": "mock"}}, {"retry-after": "0.05"})
+            return
+
+        schema_name = request.get("response_format", {}).get("json_schema", {}).get("name", "")
+        messages = request.get("messages", [])
+        user_content = "\n".join(str(m.get("content", "")) for m in messages if m.get("role") == "user")
+        content = json.dumps(build_response_content(schema_name, user_content, rng))
+        prompt_tokens = sum(len(str(m.get("content", ""))) for m in messages) // 4
+        completion_tokens = len(content) // 4
+        self._send(
+            200,
+            {
+                "id": f"chatcmpl-mock-{server.requests}",
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": request.get("model", "mock"),
+                "choices": [
+                    {
+                        "index": 0,
+                        "message": {"role": "assistant", "content": content, "refusal": None},
+                        "finish_reason": "stop",
+                        "logprobs": None,
+                    }
+                ],
+                "usage": {
+                    "prompt_tokens": prompt_tokens,
+                    "completion_tokens": completion_tokens,
+                    "total_tokens": prompt_tokens + completion_tokens,
+                    "prompt_tokens_details": {"cached_tokens": 0},
+                },
+            },
+        )
+
+
+if __name__ == "__main__":
+    server = MockLlmServer(port=int(sys.argv[1]) if len(sys.argv) > 1 else 8008)
+    print(f"Serving mock chat completions at {server.base_url}")
+    server.serve_forever()
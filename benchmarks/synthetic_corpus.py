@@ -0,0 +1,223 @@
+"""Synthetic content, summaries and synset hierarchies for the benchmarks.
+
+Rows use the columns of tests/testdata.csv (author, content, publish_date) so
+they load with the d_00 field mapping. Everything is generated from a seed so
+runs are comparable.
+"""
+import csv
+import datetime
+import gzip
+import json
+import random
+import typing
+
+from csa_app.contributor_resolution import ContributorEntity
+from csa_app.model import SentimentSummary
+from csa_app.synset_database import LruCache
+from csa_app.wordnet_snapshot import WordNetSnapshot
+from csa_app.wse_models import SynsetOption
+
+
+FIELD_MAPPING = {
+    "body": "content",
+    "author": "author",
+    "written_date_time": "publish_date",
+}
+
+NAMES = ["Bob", "Sue", "Oscar", "Alice", "Maria", "Chen", "Priya", "Tom", "the mayor", "the council"]
+ORGANIZATIONS = ["the Department of Oscar", "the city", "the bank", "the school board", "the hospital"]
+VERBS = ["caused", "blocked", "funded", "ignored", "delayed", "improved", "cancelled", "approved"]
+TOPICS = ["investment", "market", "animals", "paychecks", "roads", "budget", "housing", "parks", "taxes", "water"]
+ADJECTIVES = ["terrible", "great", "slow", "surprising", "expensive", "welcome", "late", "careless"]
+TEMPLATES = [
+    "{name} {verb} the {topic} to go sour due to {org} on {date}.",
+    "{org} won't save the {topic}. {name} {verb} it and it was {adjective}.",
+    "Why won't {name} fix the {topic}? {org} {verb} everything, {adjective}.",
+    "So {adjective} that {name} {verb} the {topic} again #{topic} @{handle}",
+    "{name} {verb} the {topic} plan, see https://example.com/{handle} for details.",
+]
+
+
+def generate_rows(
+    number: int,
+    seed: int = 1,
+    duplicate_rate: float = 0.1,
+    start_date: datetime.date = datetime.date(2020, 1, 1),
+    days: int = 1500,
+) -> typing.Iterator[dict]:
+    """Yields social-post-like rows; duplicate_rate of them are reposts of an
+    earlier row with a different handle or link, as near-duplicates appear in
+    real feeds.
+    """
+    rng = random.Random(seed)
+    recent = []
+    for i in range(number):
+        date = start_date + datetime.timedelta(days=rng.randrange(days))
+        if recent and rng.random() < duplicate_rate:
+            body = rng.choice(recent).split(" @")[0] + f" @user{rng.randrange(100000)}"
+        else:
+            body = rng.choice(TEMPLATES).format(
+                name=rng.choice(NAMES),
+                verb=rng.choice(VERBS),
+                topic=rng.choice(TOPICS),
+                org=rng.choice(ORGANIZATIONS),
+                adjective=rng.choice(ADJECTIVES),
+                date=date.isoformat(),
+                handle=f"user{rng.randrange(100000)}",
+            ) + f" ({i})"
+            recent.append(body)
+            if len(recent) > 1000:
+                recent.pop(0)
+        yield {
+            "author": f"author_{rng.randrange(5000)}",
+            "content": body,
+            "publish_date": f"{date.isoformat()} {rng.randrange(24):02d}:{rng.randrange(60):02d}",
+        }
+
+
+def write_corpus(file_path: str, number: int, seed: int = 1, duplicate_rate: float = 0.1):
+    """Writes rows as CSV or JSONL depending on the extension, gzip for ".gz"."""
+    name = file_path[:-3] if file_path.endswith(".gz") else file_path
+    opener = gzip.open if file_path.endswith(".gz") else open
+    with opener(file_path, mode="wt", encoding="utf-8", newline="") as f:
+        if name.endswith(".jsonl"):
+            for row in generate_rows(number, seed, duplicate_rate):
+                f.write(json.dumps(row) + "\n")
+        else:
+            writer = csv.DictWriter(f, fieldnames=["author", "content", "publish_date"])
+            writer.writeheader()
+            writer.writerows(generate_rows(number, seed, duplicate_rate))
+
+
+def generate_hypernyms(number: int, seed: int = 1, max_parents: int = 2) -> typing.Dict[str, typing.List[str]]:
+    """A WordNet-like DAG: synset i picks its hypernyms uniformly among earlier
+    synsets, giving a random recursive tree of logarithmic depth (about 10 to 15
+    levels, as in WordNet) where a tenth of the synsets have several hypernyms.
+    """
+    rng = random.Random(seed)
+    names = [f"concept{i}.{'n' if i % 4 else 'v'}.01" for i in range(number)]
+    hypernyms = {names[0]: []}
+    for i in range(1, number):
+        parents = set()
+        for _ in range(1 if rng.random() < 0.9 else rng.randint(2, max_parents)):
+            parents.add(names[rng.randrange(i)])
+        hypernyms[names[i]] = sorted(parents)
+    return hypernyms
+
+
+def generate_synsets(hypernyms: typing.Dict[str, typing.List[str]]) -> typing.List[typing.Tuple[str, str, typing.List[str]]]:
+    """(synset id, gloss, lemma names) triples as used by SynsetSearchIndex."""
+    synsets = []
+    for i, name in enumerate(sorted(hypernyms)):
+        lemma = TOPICS[i % len(TOPICS)] if i % 7 == 0 else f"term{i}"
+        synsets.append((name, f"a synthetic concept number {i} about {TOPICS[i % len(TOPICS)]}", [lemma, f"alias{i}"]))
+    return synsets
+
+
+def write_snapshot(directory: str, hypernyms: typing.Dict[str, typing.List[str]]):
+    """A WordNetSnapshot of the synthetic synsets, with WordNet's plural rules."""
+    lemma_index = {}
+    for name, gloss, lemmas in generate_synsets(hypernyms):
+        for lemma in lemmas:
+            lemma_index.setdefault((lemma, name.split(".")[1]), []).append(name)
+    WordNetSnapshot.build(
+        directory,
+        {name: (gloss, hypernyms[name]) for name, gloss, lemmas in generate_synsets(hypernyms)},
+        lemma_index,
+        {"n": {"mice": ["mouse"]}, "v": {}},
+        {"n": [("s", ""), ("ses", "s"), ("ies", "y")], "v": [("s", ""), ("ed", ""), ("ing", "")]},
+    )
+
+
+FIRST_NAMES = ["John", "Maria", "Chen", "Priya", "Ahmed", "Olga", "Kofi", "Lucia", "Hiro", "Sven", "Amara", "Diego"]
+LAST_NAMES = ["Smith", "Garcia", "Wang", "Patel", "Hassan", "Ivanova", "Mensah", "Rossi", "Tanaka", "Berg", "Okafor", "Lopez"]
+CONSONANTS = "bcdfghjklmnprstvwz"
+VOWELS = "aeiou"
+
+
+def _surname(rng: random.Random) -> str:
+    syllables = rng.randint(2, 3)
+    return "".join(rng.choice(CONSONANTS) + rng.choice(VOWELS) + (rng.choice(CONSONANTS) if rng.random() < 0.4 else "") for _ in range(syllables))
+
+
+def generate_entities(number: int, seed: int = 1) -> typing.List[ContributorEntity]:
+    """People with a surname-first alias, companies, and the names of the
+    synthetic posts. A fifth of the people have a common surname, so common
+    names are shared by several entities as in real catalogs.
+    """
+    rng = random.Random(seed)
+    entities = [ContributorEntity(f"known{i}", name, "a name used in the synthetic posts") for i, name in enumerate(NAMES + ORGANIZATIONS)]
+    for i in range(number - len(entities)):
+        if rng.random() < 0.2:
+            last = rng.choice(LAST_NAMES)
+        else:
+            last = _surname(rng).capitalize()
+        if i % 5 == 0:
+            entities.append(ContributorEntity(f"org{i}", f"{last} Holdings", "a synthetic company", (f"{last} Inc",)))
+        else:
+            first = rng.choice(FIRST_NAMES)
+            entities.append(ContributorEntity(f"person{i}", f"{first} {last}", "a synthetic person", (f"{last}, {first}",)))
+    return entities
+
+
+def misspell(name: str, rng: random.Random) -> str:
+    """Drops, doubles or swaps one letter, as names are misspelled in posts."""
+    i = rng.randrange(1, max(2, len(name) - 1))
+    edit = rng.randrange(3)
+    if edit == 0:
+        return name[:i] + name[i + 1 :]
+    if edit == 1:
+        return name[:i] + name[i] + name[i:]
+    return name[: i - 1] + name[i] + name[i - 1] + name[i + 1 :]
+
+
+class SyntheticSynsetDatabase:
+    """Stands in for SynsetDatabaseWordNet where the WordNet corpus is not
+    installed, with a few senses per lemma and an array backed hypernym index.
+    """
+
+    def __init__(self, hypernym_index, senses_per_lemma: int = 6):
+        self.hypernym_index = hypernym_index
+        self.senses_per_lemma = senses_per_lemma
+        self.names = hypernym_index.names
+        # lookups are computed, the analyzer only reports its stats
+        self.synset_cache = LruCache()
+
+    def _senses(self, lemma: str, pos: str) -> typing.Tuple[SynsetOption, ...]:
+        start = sum(lemma.encode("utf-8")) % max(1, len(self.names) - self.senses_per_lemma)
+        return tuple(
+            SynsetOption(name, f"{lemma} in the sense of {name}")
+            for name in self.names[start : start + self.senses_per_lemma]
+            if name.split(".")[1] == pos
+        )
+
+    def get_noun_synsets(self, lemma) -> typing.Tuple[SynsetOption, ...]:
+        return self._senses(lemma, "n")
+
+    def get_verb_synsets(self, lemma) -> typing.Tuple[SynsetOption, ...]:
+        return self._senses(lemma, "v")
+
+    def get_parent_ids(self, synset_id) -> typing.List[str]:
+        return self.hypernym_index.get_parent_ids(synset_id)
+
+
+def generate_summary(content_hash: str, rng: random.Random, synset_ids: typing.List[str], model_id: str = "gpt-4o-mini") -> SentimentSummary:
+    return SentimentSummary(
+        content_hash=content_hash,
+        model_id=model_id,
+        prompt_strategy="v1",
+        log=[],
+        discussion_duration=0.0,
+        sentiment=rng.choice([True, False, None]),
+        justifications=["synthetic"],
+        location=None,
+        content_datetime=None,
+        topic="topic",
+        topic_lemma=rng.choice(TOPICS),
+        topic_values=rng.sample(synset_ids, 3),
+        contributors=[rng.choice(NAMES)],
+        contributors_values=None,
+        method="method",
+        method_lemma=rng.choice(VERBS),
+        method_values=rng.sample(synset_ids, 2),
+    )
@@ -1,13 +1,37 @@
+import asyncio
+import collections
+import functools
 import typing
 import openai
 import json
 from pydantic import BaseModel
 import time
 
-from .ambiguty_processor import MultipleChoiceResponse
+from .ambiguty_processor import MultipleChoiceBatchResponse, MultipleChoiceResponse
+from .metrics import STAGE_EXTRACTION, STAGE_WSD, MetricsRecorder
 from .model import Content, SentimentSummary
+from .rate_limiting import AsyncRateLimiter, call_with_retry, estimate_tokens, is_retryable
+from .response_cache import ResponseCacheSqlLite
 
-client = openai.OpenAI()
+
+# Clients are created on first use so importing this module needs no credentials
+@functools.lru_cache(maxsize=None)
+def get_client() -> openai.OpenAI:
+    return openai.OpenAI()
+
+
+@functools.lru_cache(maxsize=None)
+def get_async_client() -> openai.AsyncOpenAI:
+    # retries are handled by call_with_retry so they respect the shared rate limiter
+    return openai.AsyncOpenAI(max_retries=0)
+
+
+PROMPT_STRATEGY = "v1"
+MULTIPLE_CHOICE_PROMPT_STRATEGY = "multiple_choice_v1"
+SENTIMENT_SYSTEM_PROMPT = "Summarize the sentiment expressed in the user content. Reason about the entity that caused the sentiment, how the entity caused the sentiment, the topic affected by the sentiment, and the contextual details. Extract the content as JSON."
+MULTIPLE_CHOICE_SYSTEM_PROMPT = "Given the multiple-choice question provided, responsd with the letter of the most accurate response."
+MULTIPLE_CHOICE_BATCH_PROMPT_STRATEGY = "multiple_choice_batch_v1"
+MULTIPLE_CHOICE_BATCH_SYSTEM_PROMPT = "Given the texts and the numbered multiple-choice questions about them, respond with the number of every question and the letter of its most accurate response."
 
 
 class SentimentResponse(BaseModel):
@@ -25,27 +49,117 @@ class SentimentResponse(BaseModel):
     datetime_of_topic:str | None # or null if not stated,
 
 
+PACKED_SENTIMENT_SYSTEM_PROMPT = SENTIMENT_SYSTEM_PROMPT + " Several contents are given, each introduced by its id. Extract exactly one item per content and copy its id into content_id."
+
+
+class PackedSentimentItem(SentimentResponse):
+    content_id:str
+
+
+class PackedSentimentResponse(BaseModel):
+    items:typing.List[PackedSentimentItem]
+
+
+def _record_metrics(metrics, stage: str, model: str, completion, duration: float, retries: int = 0, items: int = 1):
+    if metrics is not None:
+        metrics.observe(stage, duration, items)
+        metrics.record_request(stage, model, getattr(completion, "usage", None), retries)
+
+
+def build_sentiment_messages(content: Content) -> typing.List[dict]:
+    # TODO address prompt injection attack vector
+    prompt = f"""
+    {content.body}
+    """
+
+    return [
+        {"role": "system", "content": SENTIMENT_SYSTEM_PROMPT},
+        {"role": "user", "content": prompt},
+    ]
+
+
+def build_sentiment_summary(
+    content: Content,
+    sr: SentimentResponse,
+    model: str,
+    duration: float,
+    messages: typing.List,
+    prompt_strategy: str = PROMPT_STRATEGY,
+) -> SentimentSummary:
+    return SentimentSummary(
+        content_hash=content.content_hash,
+        model_id=model,
+        prompt_strategy=prompt_strategy,
+        sentiment=True if sr.sentiment == 'positive' else (False if sr.sentiment == 'negative' else None),
+        justifications=sr.justifications_of_sentiment,
+        topic=sr.topic,
+        topic_lemma=sr.topic_lemma,
+        location=sr.lat_lng_of_topic_location,
+        content_datetime=sr.datetime_of_topic,
+        method=sr.actions_causing_sentiment,
+        method_lemma=sr.action_lemma,
+        contributors=sr.names_of_contributors_that_cause_sentiment,
+        discussion_duration=duration,
+        log=messages,
+        topic_values=None,
+        contributors_values=None,
+        method_values=None,
+    )
+
+
+def _lookup_cached_summary(cache, content: Content, model: str, messages) -> typing.Optional[SentimentSummary]:
+    if cache is None:
+        return None
+    cached = cache.get(model, PROMPT_STRATEGY, messages)
+    if cached is None:
+        return None
+    sr = SentimentResponse(**cached["parsed"])
+    return build_sentiment_summary(content, sr, model, 0, messages + [cached["message"]])
+
+
+def _store_cached_summary(cache, model: str, messages, sr: SentimentResponse):
+    if cache is not None:
+        cache.put(model, PROMPT_STRATEGY, messages[:-1], {"parsed": sr.dict(), "message": messages[-1]})
+
+
+def _lookup_cached_multiple_choice(cache, model: str, messages, prompt_strategy=MULTIPLE_CHOICE_PROMPT_STRATEGY, response_format=MultipleChoiceResponse):
+    if cache is None:
+        return None
+    cached = cache.get(model, prompt_strategy, messages)
+    if cached is None:
+        return None
+    return response_format(**cached["parsed"]), 0, cached["message"]
+
+
+def _store_cached_multiple_choice(cache, model: str, messages, response: BaseModel, message: dict, prompt_strategy=MULTIPLE_CHOICE_PROMPT_STRATEGY):
+    if cache is not None and response is not None:
+        cache.put(model, prompt_strategy, messages, {"parsed": response.dict(), "message": message})
+
+
+async def _cache_call(cache, func, *args):
+    # func(cache, *args) reads and writes SQLite, which must not block the event loop
+    if cache is None:
+        return func(cache, *args)
+    return await asyncio.to_thread(func, cache, *args)
+
+
 def process(
     content: Content,
     model: str = "gpt-3.5-turbo",
     max_tokens=4096,
     temperature=0,
+    cache: typing.Optional[ResponseCacheSqlLite] = None,
+    metrics: typing.Optional[MetricsRecorder] = None,
 ) -> typing.Optional[SentimentSummary]:
-    
-    prompt_strategy = "v1"
 
-    # TODO address prompt injection attack vector
-    prompt = f"""
-    {content.body}
-    """
+    messages = build_sentiment_messages(content)
+    cached = _lookup_cached_summary(cache, content, model, messages)
+    if cached is not None:
+        return cached
 
     # Make an API request to OpenAI's language model
     start = time.time()
-    messages = [
-        {"role": "system", "content": "Summarize the sentiment expressed in the user content. Reason about the entity that caused the sentiment, how the entity caused the sentiment, the topic affected by the sentiment, and the contextual details. Extract the content as JSON."},
-        {"role": "user", "content": prompt},
-    ]
-    completion = client.beta.chat.completions.parse(
+    completion = get_client().beta.chat.completions.parse(
         model=model,
         max_tokens=max_tokens,
         temperature=temperature,
@@ -53,6 +167,7 @@ def process(
         response_format=SentimentResponse,
     )
     duration = time.time() - start
+    _record_metrics(metrics, STAGE_EXTRACTION, model, completion, duration)
 
     try:
         sr = completion.choices[0].message.parsed
@@ -62,40 +177,73 @@ def process(
         print("Valid JSON received:")
         print(json.dumps(sr.dict(), indent=4))  # Print formatted JSON
         messages.append(completion.choices[0].message.dict())
+        _store_cached_summary(cache, model, messages, sr)
 
-        return SentimentSummary(
-            content_hash=content.content_hash,
-            model_id=model,
-            prompt_strategy=prompt_strategy,
-            sentiment=True if sr.sentiment == 'positive' else (False if sr.sentiment == 'negative' else None),
-            justifications=sr.justifications_of_sentiment,
-            topic=sr.topic,
-            topic_lemma=sr.topic_lemma,
-            location=sr.lat_lng_of_topic_location,
-            content_datetime=sr.datetime_of_topic,
-            method=sr.actions_causing_sentiment,
-            method_lemma=sr.action_lemma,
-            contributors=sr.names_of_contributors_that_cause_sentiment,
-            discussion_duration=duration,
-            log=messages,
-            topic_values=None,
-            contributors_values=None,
-            method_values=None,
-        )
+        return build_sentiment_summary(content, sr, model, duration, messages)
     except json.JSONDecodeError as e:
         print(f"The response was not valid JSON. Here is the raw error: {e}")
         return None
 
 
-def process_multiple_choice_prompt(prompt, model, max_tokens=4096,temperature=0) -> typing.Tuple[MultipleChoiceResponse,float,dict]:
+async def process_async(
+    content: Content,
+    model: str = "gpt-3.5-turbo",
+    max_tokens=4096,
+    temperature=0,
+    limiter: typing.Optional[AsyncRateLimiter] = None,
+    aclient: typing.Optional[openai.AsyncOpenAI] = None,
+    max_retries: int = 5,
+    cache: typing.Optional[ResponseCacheSqlLite] = None,
+    metrics: typing.Optional[MetricsRecorder] = None,
+) -> typing.Optional[SentimentSummary]:
+    """Asynchronous counterpart of process; pass a shared limiter to bound
+    concurrency and stay within the account's rate limits. An aclient pointed
+    at another base_url (e.g. a local stand-in server) may be supplied.
+    """
+    aclient = aclient if aclient is not None else get_async_client()
+
+    messages = build_sentiment_messages(content)
+    cached = await _cache_call(cache, _lookup_cached_summary, content, model, messages)
+    if cached is not None:
+        return cached
 
-    system_prompt = "Given the multiple-choice question provided, responsd with the letter of the most accurate response."
     start = time.time()
+    completion, retries = await call_with_retry(
+        lambda: aclient.beta.chat.completions.parse(
+            model=model,
+            max_tokens=max_tokens,
+            temperature=temperature,
+            messages=messages,
+            response_format=SentimentResponse,
+        ),
+        limiter=limiter,
+        estimated_tokens=estimate_tokens(messages),
+        max_retries=max_retries,
+    )
+    duration = time.time() - start
+    _record_metrics(metrics, STAGE_EXTRACTION, model, completion, duration, retries)
+
+    sr = completion.choices[0].message.parsed
+    if sr is None:
+        print(f"The response could not be parsed for content {content.content_hash}")
+        return None
+    messages.append(completion.choices[0].message.dict())
+    await _cache_call(cache, _store_cached_summary, model, messages, sr)
+    return build_sentiment_summary(content, sr, model, duration, messages)
+
+
+def process_multiple_choice_prompt(prompt, model, max_tokens=4096,temperature=0, cache: typing.Optional[ResponseCacheSqlLite] = None, metrics: typing.Optional[MetricsRecorder] = None) -> typing.Tuple[MultipleChoiceResponse,float,dict]:
+
     messages = [
-        {"role": "system", "content": system_prompt},
+        {"role": "system", "content": MULTIPLE_CHOICE_SYSTEM_PROMPT},
         {"role": "user", "content": prompt},
     ]
-    completion = client.beta.chat.completions.parse(
+    cached = _lookup_cached_multiple_choice(cache, model, messages)
+    if cached is not None:
+        return cached
+
+    start = time.time()
+    completion = get_client().beta.chat.completions.parse(
         model=model,
         max_tokens=max_tokens,
         temperature=temperature,
@@ -103,10 +251,318 @@ def process_multiple_choice_prompt(prompt, model, max_tokens=4096,temperature=0)
         response_format=MultipleChoiceResponse,
     )
     duration = time.time() - start
+    _record_metrics(metrics, STAGE_WSD, model, completion, duration)
 
+    message = completion.choices[0].message.dict()
+    _store_cached_multiple_choice(cache, model, messages, completion.choices[0].message.parsed, message)
     return (
         completion.choices[0].message.parsed,
         duration,
-        completion.choices[0].message.dict(),
+        message,
     )
 
+
+async def process_multiple_choice_prompt_async(
+    prompt,
+    model,
+    max_tokens=4096,
+    temperature=0,
+    limiter: typing.Optional[AsyncRateLimiter] = None,
+    aclient: typing.Optional[openai.AsyncOpenAI] = None,
+    max_retries: int = 5,
+    cache: typing.Optional[ResponseCacheSqlLite] = None,
+    metrics: typing.Optional[MetricsRecorder] = None,
+) -> typing.Tuple[MultipleChoiceResponse,float,dict]:
+    aclient = aclient if aclient is not None else get_async_client()
+
+    messages = [
+        {"role": "system", "content": MULTIPLE_CHOICE_SYSTEM_PROMPT},
+        {"role": "user", "content": prompt},
+    ]
+    cached = await _cache_call(cache, _lookup_cached_multiple_choice, model, messages)
+    if cached is not None:
+        return cached
+
+    start = time.time()
+    completion, retries = await call_with_retry(
+        lambda: aclient.beta.chat.completions.parse(
+            model=model,
+            max_tokens=max_tokens,
+            temperature=temperature,
+            messages=messages,
+            response_format=MultipleChoiceResponse,
+        ),
+        limiter=limiter,
+        estimated_tokens=estimate_tokens(messages),
+        max_retries=max_retries,
+    )
+    duration = time.time() - start
+    _record_metrics(metrics, STAGE_WSD, model, completion, duration, retries)
+
+    message = completion.choices[0].message.dict()
+    await _cache_call(cache, _store_cached_multiple_choice, model, messages, completion.choices[0].message.parsed, message)
+    return (
+        completion.choices[0].message.parsed,
+        duration,
+        message,
+    )
+
+
+def process_multiple_choice_batch_prompt(prompt, model, max_tokens=4096, temperature=0, cache: typing.Optional[ResponseCacheSqlLite] = None, metrics: typing.Optional[MetricsRecorder] = None) -> typing.Tuple[MultipleChoiceBatchResponse,float,dict]:
+    """Answers a MultiQuestionWsePrompt, one letter per numbered question."""
+
+    messages = [
+        {"role": "system", "content": MULTIPLE_CHOICE_BATCH_SYSTEM_PROMPT},
+        {"role": "user", "content": prompt},
+    ]
+    cached = _lookup_cached_multiple_choice(cache, model, messages, MULTIPLE_CHOICE_BATCH_PROMPT_STRATEGY, MultipleChoiceBatchResponse)
+    if cached is not None:
+        return cached
+
+    start = time.time()
+    completion = get_client().beta.chat.completions.parse(
+        model=model,
+        max_tokens=max_tokens,
+        temperature=temperature,
+        messages=messages,
+        response_format=MultipleChoiceBatchResponse,
+    )
+    duration = time.time() - start
+    _record_metrics(metrics, STAGE_WSD, model, completion, duration)
+
+    message = completion.choices[0].message.dict()
+    _store_cached_multiple_choice(cache, model, messages, completion.choices[0].message.parsed, message, MULTIPLE_CHOICE_BATCH_PROMPT_STRATEGY)
+    return (
+        completion.choices[0].message.parsed,
+        duration,
+        message,
+    )
+
+
+async def process_multiple_choice_batch_prompt_async(
+    prompt,
+    model,
+    max_tokens=4096,
+    temperature=0,
+    limiter: typing.Optional[AsyncRateLimiter] = None,
+    aclient: typing.Optional[openai.AsyncOpenAI] = None,
+    max_retries: int = 5,
+    cache: typing.Optional[ResponseCacheSqlLite] = None,
+    metrics: typing.Optional[MetricsRecorder] = None,
+) -> typing.Tuple[MultipleChoiceBatchResponse,float,dict]:
+    aclient = aclient if aclient is not None else get_async_client()
+
+    messages = [
+        {"role": "system", "content": MULTIPLE_CHOICE_BATCH_SYSTEM_PROMPT},
+        {"role": "user", "content": prompt},
+    ]
+    cached = await _cache_call(cache, _lookup_cached_multiple_choice, model, messages, MULTIPLE_CHOICE_BATCH_PROMPT_STRATEGY, MultipleChoiceBatchResponse)
+    if cached is not None:
+        return cached
+
+    start = time.time()
+    completion, retries = await call_with_retry(
+        lambda: aclient.beta.chat.completions.parse(
+            model=model,
+            max_tokens=max_tokens,
+            temperature=temperature,
+            messages=messages,
+            response_format=MultipleChoiceBatchResponse,
+        ),
+        limiter=limiter,
+        estimated_tokens=estimate_tokens(messages),
+        max_retries=max_retries,
+    )
+    duration = time.time() - start
+    _record_metrics(metrics, STAGE_WSD, model, completion, duration, retries)
+
+    message = completion.choices[0].message.dict()
+    await _cache_call(cache, _store_cached_multiple_choice, model, messages, completion.choices[0].message.parsed, message, MULTIPLE_CHOICE_BATCH_PROMPT_STRATEGY)
+    return (
+        completion.choices[0].message.parsed,
+        duration,
+        message,
+    )
+
+
+def _packed_block(number: int, content: Content) -> str:
+    # short ids cost fewer tokens than content hashes and are easy to copy back
+    return f'<content id="{number}">\n{content.body}\n</content>'
+
+
+def pack_contents(
+    contents: typing.List[Content],
+    max_records: int = 8,
+    max_input_tokens: int = 3000,
+    max_output_tokens: int = 4096,
+    output_tokens_per_record: int = 300,
+) -> typing.List[typing.List[Content]]:
+    """Greedily groups contents into packs whose prompt stays within
+    max_input_tokens and whose expected output fits in max_output_tokens.
+    Contents too long to share a request get a pack of their own.
+    """
+    max_records = max(1, min(max_records, max_output_tokens // output_tokens_per_record))
+    base_tokens = estimate_tokens([{"role": "system", "content": PACKED_SENTIMENT_SYSTEM_PROMPT}, {"role": "user", "content": ""}])
+    packs = []
+    pack, pack_tokens = [], base_tokens
+    for content in contents:
+        tokens = estimate_tokens([{"content": _packed_block(len(pack) + 1, content)}])
+        if len(pack) > 0 and (len(pack) >= max_records or pack_tokens + tokens > max_input_tokens):
+            packs.append(pack)
+            pack, pack_tokens = [], base_tokens
+        pack.append(content)
+        pack_tokens += tokens
+    if len(pack) > 0:
+        packs.append(pack)
+    return packs
+
+
+def build_packed_sentiment_messages(contents: typing.List[Content]) -> typing.List[dict]:
+    prompt = "\n\n".join(_packed_block(i + 1, content) for i, content in enumerate(contents))
+    return [
+        {"role": "system", "content": PACKED_SENTIMENT_SYSTEM_PROMPT},
+        {"role": "user", "content": prompt},
+    ]
+
+
+def parse_packed_response(
+    contents: typing.List[Content],
+    response: typing.Optional[PackedSentimentResponse],
+    model: str,
+    duration: float,
+    cache: typing.Optional[ResponseCacheSqlLite] = None,
+) -> typing.List[typing.Optional[SentimentSummary]]:
+    """Matches the items back to the contents by id. Contents whose item is
+    missing or ambiguous (duplicated id) map to None. The call duration is
+    apportioned by each content's share of the prompt tokens.
+    """
+    items = collections.defaultdict(list)
+    for item in response.items if response is not None else []:
+        items[item.content_id.strip()].append(item)
+
+    weights = [estimate_tokens([{"content": c.body}]) + 1 for c in contents]
+    summaries = []
+    for i, content in enumerate(contents):
+        matches = items.get(str(i + 1), [])
+        if len(matches) != 1:
+            summaries.append(None)
+            continue
+        sr = SentimentResponse(**matches[0].dict(exclude={"content_id"}))
+        messages = [
+            {"role": "system", "content": PACKED_SENTIMENT_SYSTEM_PROMPT},
+            {"role": "user", "content": _packed_block(i + 1, content)},
+            {"role": "assistant", "content": json.dumps(matches[0].dict())},
+        ]
+        # cached as if it were a single record call, so later lookups hit either way
+        _store_cached_summary(cache, model, build_sentiment_messages(content) + [messages[-1]], sr)
+        summaries.append(
+            build_sentiment_summary(content, sr, model, duration * weights[i] / sum(weights), messages)
+        )
+    return summaries
+
+
+def _lookup_cached_summaries(cache, contents: typing.List[Content], model: str) -> typing.List[typing.Optional[SentimentSummary]]:
+    return [_lookup_cached_summary(cache, content, model, build_sentiment_messages(content)) for content in contents]
+
+
+def process_packed(
+    contents: typing.List[Content],
+    model: str = "gpt-3.5-turbo",
+    max_tokens=4096,
+    temperature=0,
+    cache: typing.Optional[ResponseCacheSqlLite] = None,
+    metrics: typing.Optional[MetricsRecorder] = None,
+) -> typing.List[typing.Optional[SentimentSummary]]:
+    """Extracts several contents in one request (see pack_contents), falling back
+    to process for the contents the packed response does not cover, or for all
+    of them when the packed request fails with an error retrying cannot fix
+    (e.g. a response truncated at max_tokens or refused by the content filter).
+    """
+    summaries = _lookup_cached_summaries(cache, contents, model)
+    pending = [i for i, summary in enumerate(summaries) if summary is None]
+    if len(pending) > 1:
+        pending_contents = [contents[i] for i in pending]
+        start = time.time()
+        try:
+            completion = get_client().beta.chat.completions.parse(
+                model=model,
+                max_tokens=max_tokens,
+                temperature=temperature,
+                messages=build_packed_sentiment_messages(pending_contents),
+                response_format=PackedSentimentResponse,
+            )
+        except Exception as e:
+            # a truncated or refused pack may still succeed one content at a time
+            if is_retryable(e):
+                raise
+            print(f"Packed request of {len(pending_contents)} contents failed: {e}")
+            completion = None
+        if completion is not None:
+            duration = time.time() - start
+            _record_metrics(metrics, STAGE_EXTRACTION, model, completion, duration, items=len(pending_contents))
+            for i, summary in zip(pending, parse_packed_response(pending_contents, completion.choices[0].message.parsed, model, duration, cache)):
+                summaries[i] = summary
+
+    for i in pending:
+        if summaries[i] is None:
+            summaries[i] = process(contents[i], model, max_tokens, temperature, cache, metrics)
+    return summaries
+
+
+async def process_packed_async(
+    contents: typing.List[Content],
+    model: str = "gpt-3.5-turbo",
+    max_tokens=4096,
+    temperature=0,
+    limiter: typing.Optional[AsyncRateLimiter] = None,
+    aclient: typing.Optional[openai.AsyncOpenAI] = None,
+    max_retries: int = 5,
+    cache: typing.Optional[ResponseCacheSqlLite] = None,
+    metrics: typing.Optional[MetricsRecorder] = None,
+) -> typing.List[typing.Optional[SentimentSummary]]:
+    """Asynchronous counterpart of process_packed."""
+    aclient = aclient if aclient is not None else get_async_client()
+
+    summaries = await _cache_call(cache, _lookup_cached_summaries, contents, model)
+    pending = [i for i, summary in enumerate(summaries) if summary is None]
+    if len(pending) > 1:
+        pending_contents = [contents[i] for i in pending]
+        messages = build_packed_sentiment_messages(pending_contents)
+        start = time.time()
+        try:
+            completion, retries = await call_with_retry(
+                lambda: aclient.beta.chat.completions.parse(
+                    model=model,
+                    max_tokens=max_tokens,
+                    temperature=temperature,
+                    messages=messages,
+                    response_format=PackedSentimentResponse,
+                ),
+                limiter=limiter,
+                estimated_tokens=estimate_tokens(messages),
+                max_retries=max_retries,
+            )
+        except Exception as e:
+            # retryable errors that outlasted the retries would hit every single call too
+            if is_retryable(e):
+                raise
+            print(f"Packed request of {len(pending_contents)} contents failed: {e}")
+            completion = None
+        if completion is not None:
+            duration = time.time() - start
+            _record_metrics(metrics, STAGE_EXTRACTION, model, completion, duration, retries, len(pending_contents))
+            parsed = await _cache_call(
+                cache, functools.partial(parse_packed_response, pending_contents, completion.choices[0].message.parsed, model, duration)
+            )
+            for i, summary in zip(pending, parsed):
+                summaries[i] = summary
+
+    fallbacks = [i for i in pending if summaries[i] is None]
+    if len(fallbacks) > 0:
+        print(f"Packed response did not cover {len(fallbacks)} of {len(pending)} contents, extracting them one by one")
+    results = await asyncio.gather(
+        *(process_async(contents[i], model, max_tokens, temperature, limiter, aclient, max_retries, cache, metrics) for i in fallbacks)
+    )
+    for i, summary in zip(fallbacks, results):
+        summaries[i] = summary
+    return summaries
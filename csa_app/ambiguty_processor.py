@@ -1,26 +1,202 @@
 import typing
 from pydantic import BaseModel
 
+from csa_app.contributor_resolution import AMBIGUOUS, Resolution
 from csa_app.model import Content
-from csa_app.wse_models import WordSenseEvaluation, DefaultWsePrompt
+from csa_app.wse_models import SynsetOption, WordSenseEvaluation, DefaultWsePrompt, ContributorPrompt, MultiQuestionWsePrompt
+
+# Bump when the prompts, the sense ranking or the WordNet data change what the
+# disambiguation answers, d_04_reprocess_stages.py then redoes the stored summaries
+WSD_VERSION = 1
 
 class MultipleChoiceResponse(BaseModel):
     letter:str
 
 
-def extract_synset_id(multiple_choice_process_func, content:Content, lemma:str, synset_database, consider_nouns:bool = True, consider_verbs:bool = True) -> typing.Tuple[typing.Optional[str],float, dict|str]:
+class MultipleChoiceAnswer(BaseModel):
+    question:int
+    letter:str
+
+
+class MultipleChoiceBatchResponse(BaseModel):
+    answers:typing.List[MultipleChoiceAnswer]
+
 
+def _lookup_synset_options(synset_database, lemma:str, consider_nouns:bool, consider_verbs:bool):
     synset_options = []
     if consider_nouns:
         synset_options = synset_database.get_noun_synsets(lemma)
     if consider_verbs:
         if len(synset_options) == 0:
             synset_options = synset_database.get_verb_synsets(lemma)
+    return synset_options
+
+
+def _rank_synset_options(ranker, content:Content, synset_options):
+    """Returns (the lexical ranking or None, the options to ask about)."""
+    if ranker is None or len(synset_options) <= 1:
+        return None, synset_options
+    ranking = ranker.rank(content.body, synset_options)
+    if ranking.skip:
+        return ranking, [ranking.best]
+    return ranking, ranker.prompt_options(ranking, synset_options)
+
+
+def extract_synset_id(multiple_choice_process_func, content:Content, lemma:str, synset_database, consider_nouns:bool = True, consider_verbs:bool = True, ranker=None) -> typing.Tuple[typing.Optional[str],float, dict|str]:
+
+    synset_options = _lookup_synset_options(synset_database, lemma, consider_nouns, consider_verbs)
+    ranking, synset_options = _rank_synset_options(ranker, content, synset_options)
+    if ranking is not None and ranking.skip:
+        return (synset_options[0].id, 0, "Lexically dominant synset")
     if len(synset_options) == 1:
         return (synset_options[0].id, 0, "Only 1 synset applicable")
     elif len(synset_options) > 1:
         evaluation = WordSenseEvaluation(content.body,lemma,synset_options)
         prompt = DefaultWsePrompt(evaluation)
         response, duration, message = multiple_choice_process_func(prompt.content)
-        return prompt.letter_option_map[response.letter].id, duration, message
-    return None,0,"No matching synsets"
\ No newline at end of file
+        synset_id = prompt.letter_option_map[response.letter].id
+        if ranking is not None:
+            ranker.record_llm_choice(ranking, synset_id)
+        return synset_id, duration, message
+    return None,0,"No matching synsets"
+
+
+async def extract_synset_id_async(multiple_choice_process_func, content:Content, lemma:str, synset_database, consider_nouns:bool = True, consider_verbs:bool = True, ranker=None) -> typing.Tuple[typing.Optional[str],float, dict|str]:
+    """Same as extract_synset_id but awaits an asynchronous multiple choice function."""
+
+    synset_options = _lookup_synset_options(synset_database, lemma, consider_nouns, consider_verbs)
+    ranking, synset_options = _rank_synset_options(ranker, content, synset_options)
+    if ranking is not None and ranking.skip:
+        return (synset_options[0].id, 0, "Lexically dominant synset")
+    if len(synset_options) == 1:
+        return (synset_options[0].id, 0, "Only 1 synset applicable")
+    elif len(synset_options) > 1:
+        evaluation = WordSenseEvaluation(content.body,lemma,synset_options)
+        prompt = DefaultWsePrompt(evaluation)
+        response, duration, message = await multiple_choice_process_func(prompt.content)
+        synset_id = prompt.letter_option_map[response.letter].id
+        if ranking is not None:
+            ranker.record_llm_choice(ranking, synset_id)
+        return synset_id, duration, message
+    return None,0,"No matching synsets"
+
+
+class SynsetQuestion(typing.NamedTuple):
+    content:Content
+    lemma:str
+    consider_nouns:bool = True
+    consider_verbs:bool = True
+
+
+def _prepare_batch(questions:typing.List[SynsetQuestion], synset_database, ranker):
+    """Resolves the questions that need no LLM and returns (results with None
+    for the ones still open, evaluations and rankings of the open ones).
+    """
+    results = []
+    open_questions = []
+    for index, question in enumerate(questions):
+        synset_options = _lookup_synset_options(synset_database, question.lemma, question.consider_nouns, question.consider_verbs)
+        ranking, synset_options = _rank_synset_options(ranker, question.content, synset_options)
+        if ranking is not None and ranking.skip:
+            results.append((synset_options[0].id, 0, "Lexically dominant synset"))
+        elif len(synset_options) == 1:
+            results.append((synset_options[0].id, 0, "Only 1 synset applicable"))
+        elif len(synset_options) == 0:
+            results.append((None, 0, "No matching synsets"))
+        else:
+            results.append(None)
+            open_questions.append((index, WordSenseEvaluation(question.content.body, question.lemma, synset_options), ranking))
+    return results, open_questions
+
+
+def _apply_batch_answers(results, open_questions, prompt:MultiQuestionWsePrompt, response, duration:float, message, ranker):
+    """Fills in the answered questions, returns the indices left unanswered."""
+    answers = [(a.question, a.letter) for a in response.answers] if response is not None else []
+    unanswered = []
+    for (index, _, ranking), option in zip(open_questions, prompt.answer(answers)):
+        if option is None:
+            unanswered.append(index)
+            continue
+        if ranking is not None:
+            ranker.record_llm_choice(ranking, option.id)
+        # the call is shared, so is its duration
+        results[index] = (option.id, duration / len(open_questions), message)
+    return unanswered
+
+
+def _record_single_answer(prompt:DefaultWsePrompt, response, duration:float, message, ranking, ranker):
+    synset_id = prompt.letter_option_map[response.letter].id
+    if ranking is not None:
+        ranker.record_llm_choice(ranking, synset_id)
+    return synset_id, duration, message
+
+
+def extract_synset_ids(batch_process_func, multiple_choice_process_func, questions:typing.List[SynsetQuestion], synset_database, ranker=None) -> typing.List[typing.Tuple[typing.Optional[str],float, dict|str]]:
+    """Disambiguates several lemmas, of one or more contents, with a single
+    multiple-question prompt. Questions the response leaves unanswered are asked
+    again one at a time with multiple_choice_process_func.
+    """
+    results, open_questions = _prepare_batch(questions, synset_database, ranker)
+    if len(open_questions) == 0:
+        return results
+    prompt = MultiQuestionWsePrompt([evaluation for _, evaluation, _ in open_questions])
+    response, duration, message = batch_process_func(prompt.content)
+    unanswered = set(_apply_batch_answers(results, open_questions, prompt, response, duration, message, ranker))
+    for index, evaluation, ranking in open_questions:
+        if index in unanswered:
+            single_prompt = DefaultWsePrompt(evaluation)
+            single_response, single_duration, single_message = multiple_choice_process_func(single_prompt.content)
+            results[index] = _record_single_answer(single_prompt, single_response, single_duration, single_message, ranking, ranker)
+    return results
+
+
+async def extract_synset_ids_async(batch_process_func, multiple_choice_process_func, questions:typing.List[SynsetQuestion], synset_database, ranker=None) -> typing.List[typing.Tuple[typing.Optional[str],float, dict|str]]:
+    """Same as extract_synset_ids but awaits asynchronous multiple choice functions."""
+    results, open_questions = _prepare_batch(questions, synset_database, ranker)
+    if len(open_questions) == 0:
+        return results
+    prompt = MultiQuestionWsePrompt([evaluation for _, evaluation, _ in open_questions])
+    response, duration, message = await batch_process_func(prompt.content)
+    unanswered = set(_apply_batch_answers(results, open_questions, prompt, response, duration, message, ranker))
+    for index, evaluation, ranking in open_questions:
+        if index in unanswered:
+            single_prompt = DefaultWsePrompt(evaluation)
+            single_response, single_duration, single_message = await multiple_choice_process_func(single_prompt.content)
+            results[index] = _record_single_answer(single_prompt, single_response, single_duration, single_message, ranking, ranker)
+    return results
+
+
+
+# lets the LLM reject every candidate of an ambiguous contributor name
+NO_CONTRIBUTOR_OPTION = SynsetOption(None, "None of these, someone or something else")
+
+
+def _prepare_contributor(content:Content, name:str, resolution:Resolution, ranker):
+    """Returns (the result when no prompt is needed, else None, the ranking, the prompt)."""
+    if resolution.method != AMBIGUOUS:
+        return (resolution.entity_id, 0, f"Contributor {resolution.method}"), None, None
+    options = [SynsetOption(e.id, e.gloss) for e in resolution.candidates]
+    ranking, options = _rank_synset_options(ranker, content, options)
+    if ranking is not None and ranking.skip:
+        return (options[0].id, 0, "Lexically dominant contributor"), ranking, None
+    return None, ranking, ContributorPrompt(WordSenseEvaluation(content.body, name, list(options) + [NO_CONTRIBUTOR_OPTION]))
+
+
+def extract_contributor_id(multiple_choice_process_func, content:Content, name:str, resolution:Resolution, ranker=None) -> typing.Tuple[typing.Optional[str],float, dict|str]:
+    """Settles the catalog entity of a contributor name given its catalog
+    resolution, asking multiple_choice_process_func only when it is ambiguous.
+    """
+    result, ranking, prompt = _prepare_contributor(content, name, resolution, ranker)
+    if result is not None:
+        return result
+    response, duration, message = multiple_choice_process_func(prompt.content)
+    return _record_single_answer(prompt, response, duration, message, ranking, ranker)
+
+
+async def extract_contributor_id_async(multiple_choice_process_func, content:Content, name:str, resolution:Resolution, ranker=None) -> typing.Tuple[typing.Optional[str],float, dict|str]:
+    """Same as extract_contributor_id but awaits an asynchronous multiple choice function."""
+    result, ranking, prompt = _prepare_contributor(content, name, resolution, ranker)
+    if result is not None:
+        return result
+    response, duration, message = await multiple_choice_process_func(prompt.content)
+    return _record_single_answer(prompt, response, duration, message, ranking, ranker)
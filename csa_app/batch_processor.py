@@ -0,0 +1,194 @@
+import io
+import json
+import os
+import shutil
+import time
+import typing
+import uuid
+
+import openai
+import pydantic
+
+from .ai_processor_openai import (
+    SentimentResponse,
+    build_sentiment_messages,
+    build_sentiment_summary,
+)
+from .model import Content, SentimentSummary
+
+
+BATCH_COMPLETED = "completed"
+BATCH_FAILED_STATES = ("failed", "expired", "cancelled")
+
+
+class OpenAIBatchEndpoint:
+    """Submits JSONL request files to the OpenAI Batch API."""
+
+    def __init__(self, client: typing.Optional[openai.OpenAI] = None, completion_window="24h"):
+        self.client = client if client is not None else openai.OpenAI()
+        self.completion_window = completion_window
+
+    def submit(self, request_file_path: str) -> str:
+        with open(request_file_path, "rb") as f:
+            batch_file = self.client.files.create(file=f, purpose="batch")
+        batch = self.client.batches.create(
+            input_file_id=batch_file.id,
+            endpoint="/v1/chat/completions",
+            completion_window=self.completion_window,
+        )
+        return batch.id
+
+    def status(self, job_id: str) -> str:
+        return self.client.batches.retrieve(job_id).status
+
+    def results(self, job_id: str) -> typing.Iterable[str]:
+        batch = self.client.batches.retrieve(job_id)
+        if batch.output_file_id is None:
+            return []
+        return io.StringIO(self.client.files.content(batch.output_file_id).text)
+
+
+class LocalFileBatchEndpoint:
+    """File based stand-in for a batch API. Submitted request files are copied
+    into <directory>/<job_id>/input.jsonl; a job is complete once something
+    (a test, a local model runner) writes <directory>/<job_id>/output.jsonl.
+    """
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        os.makedirs(self.directory, exist_ok=True)
+
+    def submit(self, request_file_path: str) -> str:
+        job_id = f"batch_{uuid.uuid4().hex}"
+        os.makedirs(os.path.join(self.directory, job_id))
+        shutil.copyfile(request_file_path, os.path.join(self.directory, job_id, "input.jsonl"))
+        return job_id
+
+    def status(self, job_id: str) -> str:
+        if os.path.exists(os.path.join(self.directory, job_id, "output.jsonl")):
+            return BATCH_COMPLETED
+        return "in_progress"
+
+    def results(self, job_id: str) -> typing.Iterable[str]:
+        with open(os.path.join(self.directory, job_id, "output.jsonl"), encoding="utf-8") as f:
+            return f.readlines()
+
+
+def _strict_schema(schema: dict) -> dict:
+    # structured outputs only accept closed objects with every property required
+    if schema.get("type") == "object":
+        schema["additionalProperties"] = False
+        schema["required"] = list(schema.get("properties", {}))
+    for key in ("properties", "$defs"):
+        for child in schema.get(key, {}).values():
+            _strict_schema(child)
+    for key in ("anyOf", "allOf"):
+        for child in schema.get(key, []):
+            _strict_schema(child)
+    if isinstance(schema.get("items"), dict):
+        _strict_schema(schema["items"])
+    return schema
+
+
+def build_response_format(response_format: typing.Type[pydantic.BaseModel]) -> dict:
+    """The response_format parameter chat.completions.parse sends for a model,
+    built from its JSON schema for requests written to a file.
+    """
+    return {
+        "type": "json_schema",
+        "json_schema": {
+            "schema": _strict_schema(response_format.model_json_schema()),
+            "name": response_format.__name__,
+            "strict": True,
+        },
+    }
+
+
+def build_batch_request(content: Content, model: str, max_tokens=4096, temperature=0) -> dict:
+    return {
+        "custom_id": content.content_hash,
+        "method": "POST",
+        "url": "/v1/chat/completions",
+        "body": {
+            "model": model,
+            "max_tokens": max_tokens,
+            "temperature": temperature,
+            "messages": build_sentiment_messages(content),
+            "response_format": build_response_format(SentimentResponse),
+        },
+    }
+
+
+def write_batch_request_file(
+    contents: typing.List[Content], request_file_path: str, model: str, max_tokens=4096, temperature=0
+):
+    with open(request_file_path, "w", encoding="utf-8") as f:
+        for content in contents:
+            f.write(json.dumps(build_batch_request(content, model, max_tokens, temperature)))
+            f.write("\n")
+
+
+def parse_batch_results(
+    contents: typing.List[Content], result_lines: typing.Iterable[str], model: str
+) -> typing.List[SentimentSummary]:
+    content_map = {c.content_hash: c for c in contents}
+    summaries = []
+    for line in result_lines:
+        if line.strip() == "":
+            continue
+        result = json.loads(line)
+        content = content_map.get(result["custom_id"])
+        if content is None:
+            print(f"Skipping batch result for unknown content {result['custom_id']}")
+            continue
+        response = result.get("response")
+        if result.get("error") is not None or response is None or response["status_code"] != 200:
+            print(f"Skipping failed batch request for {content.content_hash}: {result.get('error')}")
+            continue
+
+        message = response["body"]["choices"][0]["message"]
+        try:
+            sr = SentimentResponse.model_validate_json(message["content"])
+        except ValueError as e:
+            print(f"The response was not valid JSON for {content.content_hash}: {e}")
+            continue
+
+        messages = build_sentiment_messages(content)
+        messages.append(message)
+        # batched requests have no meaningful per-record latency
+        summaries.append(build_sentiment_summary(content, sr, model, 0, messages))
+    return summaries
+
+
+def process_batch_job(
+    contents: typing.List[Content],
+    endpoint,
+    request_file_path: str,
+    model: str = "gpt-3.5-turbo",
+    max_tokens=4096,
+    temperature=0,
+    poll_interval: float = 60,
+    timeout: typing.Optional[float] = None,
+) -> typing.List[SentimentSummary]:
+    """Submits the contents as one batch job, blocks until the job finishes and
+    returns the parsed summaries; contents whose request failed are left out.
+    Nothing is submitted without contents, the Batch API rejects empty files.
+    """
+    if len(contents) == 0:
+        return []
+    write_batch_request_file(contents, request_file_path, model, max_tokens, temperature)
+    job_id = endpoint.submit(request_file_path)
+    print(f"Submitted batch job {job_id} with {len(contents)} requests")
+
+    start = time.time()
+    while True:
+        status = endpoint.status(job_id)
+        if status == BATCH_COMPLETED:
+            break
+        if status in BATCH_FAILED_STATES:
+            raise RuntimeError(f"Batch job {job_id} ended with status {status}")
+        if timeout is not None and time.time() - start > timeout:
+            raise TimeoutError(f"Batch job {job_id} did not finish within {timeout} seconds")
+        time.sleep(poll_interval)
+
+    return parse_batch_results(contents, endpoint.results(job_id), model)
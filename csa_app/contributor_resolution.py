@@ -0,0 +1,302 @@
+import collections
+import csv
+import hashlib
+import json
+import re
+import typing
+import unicodedata
+
+import numpy as np
+import scipy.sparse
+
+from .synset_search import trigrams
+
+
+_NON_WORD = re.compile(r"[\W_]+")
+_ARTICLES = ("the", "a", "an")
+
+_SOUNDEX_DIGITS = {
+    letter: digit
+    for letters, digit in (("bfpv", "1"), ("cgjkqsxz", "2"), ("dt", "3"), ("l", "4"), ("mn", "5"), ("r", "6"))
+    for letter in letters
+}
+
+# bump when the matching changes, see ContributorCatalog.version
+RESOLUTION_VERSION = 1
+
+RESOLVED_EXACT = "exact"
+RESOLVED_SIMILAR = "similar"
+AMBIGUOUS = "ambiguous"
+UNRESOLVED = "unresolved"
+
+
+def normalize_name(name: str) -> str:
+    """Lower case ASCII words without punctuation or a leading article."""
+    text = unicodedata.normalize("NFKD", name)
+    text = "".join(c for c in text if not unicodedata.combining(c)).lower()
+    tokens = _NON_WORD.sub(" ", text).split()
+    if len(tokens) > 1 and tokens[0] in _ARTICLES:
+        tokens = tokens[1:]
+    return " ".join(tokens)
+
+
+def soundex(token: str) -> str:
+    letters = [c for c in token if "a" <= c <= "z"]
+    if len(letters) == 0:
+        return token
+    code = letters[0].upper()
+    previous = _SOUNDEX_DIGITS.get(letters[0], "")
+    for c in letters[1:]:
+        digit = _SOUNDEX_DIGITS.get(c, "")
+        if digit != "" and digit != previous:
+            code += digit
+        # h and w do not separate letters with the same code, vowels do
+        if c not in "hw":
+            previous = digit
+    return (code + "000")[:4]
+
+
+class ContributorEntity(typing.NamedTuple):
+    # a WordNet synset id for WordNet's named entities
+    id: str
+    name: str
+    description: str = ""
+    aliases: typing.Tuple[str, ...] = ()
+
+    @property
+    def gloss(self) -> str:
+        return f"{self.name}, {self.description}" if self.description != "" else self.name
+
+
+class Resolution(typing.NamedTuple):
+    method: str
+    # set when the name resolved without the LLM
+    entity_id: typing.Optional[str] = None
+    score: float = 0.0
+    # the entities to choose from when ambiguous, best first
+    candidates: typing.Tuple[ContributorEntity, ...] = ()
+
+
+class ContributorCatalog:
+    """Resolves contributor names to known entities without calling the LLM
+    where the catalog alone is conclusive.
+
+    Candidates are blocked on the block_grams rarest character trigrams of a
+    name, and on the Soundex code of its rarest sounding word so misspellings
+    changing too many trigrams are still found. Blocks of more than
+    max_block_size aliases are skipped, but for the rarest trigram, which
+    bounds the comparisons per name whatever the size of the catalog. The dice coefficients between
+    the trigrams of a chunk of names and of their candidates are computed
+    together on sparse matrices, candidates that sound alike get a bonus.
+
+    An exact match of a single entity or a best match of at least
+    accept_similarity, ahead of the runner up by margin, resolves the name.
+    Names with candidates above min_similarity but no clear winner are
+    ambiguous and come with their top_k candidates for the LLM to choose from.
+
+    version identifies the entities and matching parameters, it changes when
+    the catalog is rebuilt from other sources so stored resolutions can be
+    redone by d_04_reprocess_stages.py.
+    """
+
+    def __init__(
+        self,
+        entities: typing.Iterable[ContributorEntity],
+        accept_similarity: float = 0.9,
+        margin: float = 0.15,
+        min_similarity: float = 0.6,
+        phonetic_weight: float = 0.15,
+        top_k: int = 5,
+        block_grams: int = 4,
+        max_block_size: int = 1000,
+        chunk_size: int = 512,
+    ):
+        self.entities = list(entities)
+        self.accept_similarity = accept_similarity
+        self.margin = margin
+        self.min_similarity = min_similarity
+        self.phonetic_weight = phonetic_weight
+        self.top_k = top_k
+        self.block_grams = block_grams
+        self.max_block_size = max_block_size
+        self.chunk_size = chunk_size
+
+        alias_entities = []
+        alias_grams = []
+        alias_codes = []
+        exact = collections.defaultdict(list)
+        blocks = collections.defaultdict(list)
+        self.vocabulary = {}
+        digest = hashlib.sha1(
+            json.dumps([accept_similarity, margin, min_similarity, phonetic_weight, top_k, block_grams, max_block_size]).encode()
+        )
+        for i, entity in enumerate(self.entities):
+            digest.update(json.dumps(list(entity)).encode())
+            for alias in dict.fromkeys(normalize_name(n) for n in (entity.name,) + tuple(entity.aliases)):
+                if alias == "":
+                    continue
+                codes = set(soundex(token) for token in alias.split())
+                for code in codes:
+                    blocks[code].append(len(alias_entities))
+                alias_entities.append(i)
+                alias_codes.append(" ".join(sorted(codes)))
+                exact[alias].append(i)
+                alias_grams.append([self.vocabulary.setdefault(gram, len(self.vocabulary)) for gram in trigrams(alias)])
+
+        self.alias_entities = np.array(alias_entities, dtype=np.int32)
+        # aliases with the same Soundex codes share an id
+        self.code_ids = {}
+        self.alias_code_ids = np.array([self.code_ids.setdefault(codes, len(self.code_ids)) for codes in alias_codes], dtype=np.int32)
+        self.exact = {alias: tuple(dict.fromkeys(ids)) for alias, ids in exact.items()}
+        # Soundex code of a word -> aliases with that word
+        self.phonetic_blocks = {code: np.array(aliases, dtype=np.int32) for code, aliases in blocks.items()}
+        self.alias_grams = self._gram_matrix(alias_grams, len(self.vocabulary))
+        self.alias_gram_counts = np.array([len(grams) for grams in alias_grams], dtype=np.float32)
+        # trigrams x aliases, the postings of every trigram
+        self.gram_aliases = self.alias_grams.T.tocsr()
+        self.gram_frequencies = np.diff(self.gram_aliases.indptr)
+        self.version = f"{RESOLUTION_VERSION}.{digest.hexdigest()[:16]}"
+
+    def __len__(self) -> int:
+        return len(self.entities)
+
+    @staticmethod
+    def _gram_matrix(rows: typing.List[typing.List[int]], columns: int) -> scipy.sparse.csr_matrix:
+        indptr = np.zeros(len(rows) + 1, dtype=np.int64)
+        indptr[1:] = np.cumsum([len(r) for r in rows])
+        indices = np.fromiter((g for r in rows for g in r), dtype=np.int32, count=indptr[-1])
+        return scipy.sparse.csr_matrix((np.ones(len(indices), dtype=np.float32), indices, indptr), shape=(len(rows), columns))
+
+    def _phonetic_block(self, name: str) -> typing.Tuple[str, np.ndarray]:
+        """The smallest block of the words of name, with the Soundex codes of name."""
+        codes = set(soundex(token) for token in name.split())
+        blocks = [self.phonetic_blocks[code] for code in codes if code in self.phonetic_blocks]
+        block = min(blocks, key=len) if len(blocks) > 0 else np.zeros(0, dtype=np.int32)
+        if len(block) > self.max_block_size:
+            block = block[:0]
+        return " ".join(sorted(codes)), block
+
+    def _similar(self, names: typing.List[str]) -> typing.Iterator[typing.Tuple[np.ndarray, np.ndarray]]:
+        """(aliases, similarities) of the candidates of every normalized name."""
+        aliases = len(self.alias_entities)
+        for chunk_start in range(0, len(names), self.chunk_size):
+            chunk = names[chunk_start : chunk_start + self.chunk_size]
+            grams = []
+            block_grams = []
+            gram_counts = np.zeros(len(chunk), dtype=np.float32)
+            code_ids = np.zeros(len(chunk), dtype=np.int32)
+            phonetic_rows = [np.zeros(0, dtype=np.int64)]
+            phonetic_columns = [np.zeros(0, dtype=np.int32)]
+            for n, name in enumerate(chunk):
+                name_grams = trigrams(name)
+                known = [self.vocabulary[g] for g in name_grams if g in self.vocabulary]
+                gram_counts[n] = len(name_grams)
+                grams.append(known)
+                known_blocks = sorted(known, key=lambda g: self.gram_frequencies[g])[: self.block_grams]
+                block_grams.append(known_blocks[:1] + [g for g in known_blocks[1:] if self.gram_frequencies[g] <= self.max_block_size])
+                name_codes, block = self._phonetic_block(name)
+                code_ids[n] = self.code_ids.get(name_codes, -1)
+                phonetic_rows.append(np.full(len(block), n, dtype=np.int64))
+                phonetic_columns.append(block)
+
+            phonetic_columns = np.concatenate(phonetic_columns)
+            candidates = self._gram_matrix(block_grams, len(self.vocabulary)) @ self.gram_aliases + scipy.sparse.csr_matrix(
+                (np.ones(len(phonetic_columns), dtype=np.float32), (np.concatenate(phonetic_rows), phonetic_columns)),
+                shape=(len(chunk), aliases),
+            )
+            candidates.sort_indices()
+            rows = np.repeat(np.arange(len(chunk)), np.diff(candidates.indptr))
+            columns = candidates.indices
+
+            # shared trigrams of every candidate pair at once
+            name_grams = self._gram_matrix(grams, len(self.vocabulary))
+            shared = np.asarray(name_grams[rows].multiply(self.alias_grams[columns]).sum(axis=1)).ravel()
+            scores = 2 * shared / (gram_counts[rows] + self.alias_gram_counts[columns])
+            sound_alike = code_ids[rows] == self.alias_code_ids[columns]
+            scores = np.minimum(scores + self.phonetic_weight * sound_alike, 1.0)
+
+            bounds = candidates.indptr
+            for n in range(len(chunk)):
+                yield columns[bounds[n] : bounds[n + 1]], scores[bounds[n] : bounds[n + 1]]
+
+    def _candidates(self, aliases: np.ndarray, scores: np.ndarray) -> typing.Tuple[np.ndarray, np.ndarray]:
+        """Entities of the aliases with their best score, best first."""
+        keep = scores >= self.min_similarity
+        aliases = aliases[keep]
+        scores = scores[keep]
+        order = np.argsort(-scores, kind="stable")
+        entities = self.alias_entities[aliases[order]]
+        _, first = np.unique(entities, return_index=True)
+        first.sort()
+        return entities[first], scores[order][first]
+
+    def _resolve(self, name: str, aliases: np.ndarray, scores: np.ndarray) -> Resolution:
+        exact = self.exact.get(name)
+        if exact is not None:
+            if len(exact) == 1:
+                return Resolution(RESOLVED_EXACT, self.entities[exact[0]].id, 1.0)
+            return Resolution(AMBIGUOUS, None, 1.0, tuple(self.entities[i] for i in exact[: self.top_k]))
+
+        entities, scores = self._candidates(aliases, scores)
+        if len(entities) == 0:
+            return Resolution(UNRESOLVED)
+        best = float(scores[0])
+        if best >= self.accept_similarity and (len(entities) == 1 or best - scores[1] >= self.margin):
+            return Resolution(RESOLVED_SIMILAR, self.entities[entities[0]].id, best)
+        return Resolution(AMBIGUOUS, None, best, tuple(self.entities[i] for i in entities[: self.top_k]))
+
+    def resolve(self, names: typing.List[str]) -> typing.List[Resolution]:
+        """Resolutions of names in order, each distinct name is scored once."""
+        keys = [normalize_name(name) for name in names]
+        distinct = list(dict.fromkeys(key for key in keys if key != ""))
+        resolutions = {"": Resolution(UNRESOLVED)}
+        no_candidates = (np.zeros(0, dtype=np.int64), np.zeros(0))
+        # exact matches need no similarities
+        scored = [key for key in distinct if key not in self.exact]
+        for key in distinct:
+            if key in self.exact:
+                resolutions[key] = self._resolve(key, *no_candidates)
+        for key, (aliases, scores) in zip(scored, self._similar(scored)):
+            resolutions[key] = self._resolve(key, aliases, scores)
+        return [resolutions[key] for key in keys]
+
+    @classmethod
+    def load(cls, file_path: str, **kwargs) -> "ContributorCatalog":
+        return cls(read_entities(file_path), **kwargs)
+
+
+def read_entities(file_path: str) -> typing.List[ContributorEntity]:
+    with open(file_path, encoding="utf-8") as f:
+        return [ContributorEntity(*row[:3], tuple(row[3])) for row in map(json.loads, f)]
+
+
+def write_entities(file_path: str, entities: typing.Iterable[ContributorEntity]):
+    with open(file_path, "w", encoding="utf-8") as f:
+        for entity in entities:
+            f.write(json.dumps(list(entity)) + "\n")
+
+
+def entities_from_csv(file_path: str) -> typing.List[ContributorEntity]:
+    """Known entities from a CSV with id and name columns, and optionally
+    description and aliases, the aliases separated by "|".
+    """
+    entities = []
+    with open(file_path, encoding="utf-8", newline="") as f:
+        for row in csv.DictReader(f):
+            aliases = tuple(a.strip() for a in (row.get("aliases") or "").split("|") if a.strip() != "")
+            entities.append(ContributorEntity(row["id"], row["name"], row.get("description") or "", aliases))
+    return entities
+
+
+def entities_from_wordnet() -> typing.List[ContributorEntity]:
+    """WordNet's named entities, the noun synsets that are instances of another
+    synset such as people, places and organizations.
+    """
+    from nltk.corpus import wordnet as wn
+
+    entities = []
+    for s in wn.all_synsets(wn.NOUN):
+        if len(s.instance_hypernyms()) > 0:
+            names = [name.replace("_", " ") for name in s.lemma_names()]
+            entities.append(ContributorEntity(s._name, names[0], s._definition, tuple(names[1:])))
+    return entities
@@ -1,18 +1,189 @@
-import sqlite3
+import collections
 import typing
 import json
 import pandas as pd
 import datetime
+import time
 
-from .model import SentimentSummary, Content
+from .model import SentimentSummary, Content, ContentBatch, ContributorResult, StageResult, StageRow, SummaryBatch, join_values
+from .sqlite_connections import SqliteConnectionManager
+
+
+SYNSET_ROLES = ("topic", "method", "contributor")
+
+WORK_PENDING = 0
+WORK_LEASED = 1
+WORK_DONE = 2
+WORK_FAILED = 3
+
+# the synset dimensions count resolved synsets and catalog entities only, the
+# unresolved_* ones the lemmas and names of summaries that were not resolved
+ROLLUP_DIMENSIONS = (
+    "sentiment", "topic", "method", "contributor", "unresolved_topic", "unresolved_method", "unresolved_contributor"
+)
+# sentiment is part of the rollup key, where NULL would never conflict
+ROLLUP_NEUTRAL = -1
+
+CONTENT_COLUMNS = "c.content_hash, c.body, c.author, c.forum, c.raw_details, c.written_date_time, c.region, c.cluster_id"
+# in the order of SummaryBatch columns
+SUMMARY_COLUMNS = """content_hash, model_id, prompt_strategy, sentiment, log, justifications, discussion_duration,
+    location, content_datetime, contributors, contributors_values, method, method_lemma_id, method_values,
+    topic, topic_lemma_id, topic_values, topic_synset_id, method_synset_id, wsd_version, expansion_version,
+    contributor_version"""
+# in the order of snapshot_store.SNAPSHOT_SCHEMA
+SNAPSHOT_COLUMNS = """s.content_hash, s.model_id, s.prompt_strategy, s.sentiment, s.discussion_duration,
+    s.location, s.content_datetime, s.contributors, s.contributors_values, s.method,
+    s.method_lemma_id, s.method_values, s.topic, s.topic_lemma_id, s.topic_values,
+    s.topic_synset_id, s.method_synset_id, s.wsd_version, s.expansion_version, s.contributor_version,
+    c.body, c.author, c.forum, c.region, c.written_date_time"""
+
+
+def _split_values(values: typing.Optional[str]) -> typing.List[str]:
+    # inverse of the space separated "id!" strings stored in the *_values columns
+    if values is None:
+        return []
+    return [v[:-1] for v in values.split(" ") if v.endswith("!")]
+
+
+def _summary_synset_rows(batch: SummaryBatch) -> typing.List[typing.Tuple]:
+    rows = []
+    for role, column in (
+        ("topic", batch.topic_values),
+        ("method", batch.method_values),
+        ("contributor", batch.contributors_values),
+    ):
+        for key, values in zip(batch.keys(), column):
+            if values is not None:
+                rows.extend(key + (role, synset_id) for synset_id in set(_split_values(values)))
+    return rows
+
+
+ROLLUP_SOURCE_COLUMNS = """s.sentiment, s.topic_lemma_id, s.topic_values, s.method_lemma_id, s.method_values,
+    s.contributors, s.contributors_values, c.region, c.forum, c.written_date_time"""
+
+
+def _rollup_entries(row) -> typing.Iterator[typing.Tuple]:
+    """Yields the (dimension, value, sentiment, region, forum, day) rollup keys a
+    summary row contributes to. Topics and methods are keyed on the resolved
+    synset (the last *_values entry) and contributors on their catalog
+    entities, the same ids the synset filters use. Lemmas and names that were
+    never resolved go to the unresolved_* dimensions instead.
+    """
+    (
+        sentiment, topic_lemma, topic_values, method_lemma, method_values,
+        contributors, contributors_values, region, forum, written,
+    ) = row
+    sentiment = ROLLUP_NEUTRAL if sentiment is None else sentiment
+    day = written.strip()[:10]
+
+    yield ("sentiment", "", sentiment, region, forum, day)
+    for dimension, lemma, values in (
+        ("topic", topic_lemma, topic_values),
+        ("method", method_lemma, method_values),
+    ):
+        resolved = _split_values(values)
+        if len(resolved) > 0:
+            yield (dimension, resolved[-1], sentiment, region, forum, day)
+        elif lemma is not None and lemma != "":
+            yield (f"unresolved_{dimension}", lemma, sentiment, region, forum, day)
+    if contributors_values is not None:
+        for entity_id in set(_split_values(contributors_values)):
+            yield ("contributor", entity_id, sentiment, region, forum, day)
+    else:
+        for name in set(json.loads(contributors)):
+            yield ("unresolved_contributor", name, sentiment, region, forum, day)
+
+
+def _update_rollups(cur, keys: typing.List[typing.Tuple[str, str, str]], sign: int = 1):
+    # keys are (content_hash, model_id, prompt_strategy) of newly stored summaries,
+    # sign -1 takes out summaries about to be rewritten
+    counts = collections.Counter()
+    for key in keys:
+        row = cur.execute(
+            f"""SELECT {ROLLUP_SOURCE_COLUMNS} FROM sentiment_summaries s
+            INNER JOIN content c ON c.content_hash = s.content_hash
+            WHERE s.content_hash = ? AND s.model_id = ? AND s.prompt_strategy = ?""",
+            key,
+        ).fetchone()
+        if row is not None:
+            counts.update(_rollup_entries(row))
+    cur.executemany(
+        """INSERT INTO sentiment_rollups VALUES (?,?,?,?,?,?,?)
+        ON CONFLICT (dimension, value, sentiment, region, forum, day) DO UPDATE SET count = count + excluded.count""",
+        [entry + (sign * count,) for entry, count in counts.items()],
+    )
+    if sign < 0:
+        cur.execute("DELETE FROM sentiment_rollups WHERE count <= 0")
+
+
+def _day(value) -> str:
+    if isinstance(value, (datetime.date, datetime.datetime)):
+        return value.strftime("%Y-%m-%d")
+    return str(value)[:10]
+
+
+def _filter_clause(
+    topic_id, method_id, contributor_id, sentiment, start_content_datetime, end_content_datetime
+) -> typing.Tuple[str, typing.List]:
+    """Builds the joins and where clause filtering "sentiment_summaries s INNER
+    JOIN content c", returning the SQL and its parameters.
+    """
+    join_clauses = []
+    where_clauses = []
+    params = []
+
+    # each synset filter joins the covering index of summary_synsets
+    for role, synset_id in (
+        ("topic", topic_id),
+        ("method", method_id),
+        ("contributor", contributor_id),
+    ):
+        if synset_id is not None:
+            alias = f"f_{role}"
+            join_clauses.append(
+                f""" INNER JOIN summary_synsets {alias} ON {alias}.content_hash = s.content_hash
+                AND {alias}.model_id = s.model_id AND {alias}.prompt_strategy = s.prompt_strategy
+                AND {alias}.role = ? AND {alias}.synset_id = ?"""
+            )
+            params.extend([role, synset_id])
+
+    if sentiment is not None:
+        where_clauses.append("s.sentiment = ?")
+        params.append(1 if sentiment else 0)
+
+    if start_content_datetime is not None:
+        where_clauses.append("substr(trim(c.written_date_time), 1, 10) >= ?")
+        params.append(_day(start_content_datetime))
+
+    if end_content_datetime is not None:
+        where_clauses.append("substr(trim(c.written_date_time), 1, 10) <= ?")
+        params.append(_day(end_content_datetime))
+
+    where_clause = ""
+    if len(where_clauses) > 0:
+        where_clause = " WHERE " + " AND ".join(where_clauses)
+    return "".join(join_clauses) + where_clause, params
+
+
+def _add_column_if_missing(cur, table: str, column: str, definition: str):
+    # migrates databases created before the column was introduced
+    columns = [r[1] for r in cur.execute(f"PRAGMA table_info({table})").fetchall()]
+    if column not in columns:
+        cur.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
 
 
 class DatabaseSqlLite:
 
-    def __init__(self, db_file_path="data.db"):
+    def __init__(self, db_file_path="data.db", read_only: bool = False):
         self.db_file_path = db_file_path
+        self.read_only = read_only
+        self.connections = SqliteConnectionManager(db_file_path, read_only=read_only)
 
-        with sqlite3.connect(self.db_file_path) as c:
+        if read_only:
+            # the schema is owned by the writing processes
+            return
+
+        with self.connections.connection() as c:
             cur = c.cursor()
 
             cur.execute(
@@ -24,9 +195,14 @@ class DatabaseSqlLite:
                 raw_details TEXT NOT NULL,
                 written_date_time TEXT NOT NULL,
                 region TEXT NOT NULL,
+                cluster_id TEXT NULL,
                 PRIMARY KEY (content_hash));
             """
             )
+            _add_column_if_missing(cur, "content", "cluster_id", "TEXT NULL")
+            cur.execute(
+                "CREATE INDEX IF NOT EXISTS content_cluster_id ON content (cluster_id);"
+            )
 
             cur.execute(
                 """CREATE TABLE IF NOT EXISTS sentiment_summaries (
@@ -47,37 +223,310 @@ class DatabaseSqlLite:
                 topic TEXT NULL,
                 topic_lemma_id TEXT NULL,
                 topic_values TEXT NULL,
+                topic_synset_id TEXT NULL,
+                method_synset_id TEXT NULL,
+                wsd_version INTEGER NULL,
+                expansion_version INTEGER NULL,
+                contributor_version TEXT NULL,
+                updated_generation INTEGER NULL,
                 PRIMARY KEY (content_hash, model_id, prompt_strategy));
             """
             )
+            for column in ("topic_synset_id", "method_synset_id", "contributor_version"):
+                _add_column_if_missing(cur, "sentiment_summaries", column, "TEXT NULL")
+            for column in ("wsd_version", "expansion_version"):
+                _add_column_if_missing(cur, "sentiment_summaries", column, "INTEGER NULL")
+            # summary_generation of the last in place update, for the snapshot export
+            _add_column_if_missing(cur, "sentiment_summaries", "updated_generation", "INTEGER NULL")
+            cur.execute(
+                """CREATE INDEX IF NOT EXISTS sentiment_summaries_updated ON sentiment_summaries (updated_generation)
+                WHERE updated_generation IS NOT NULL;"""
+            )
+
+            # one row per (summary, role, synset) so filters are index seeks
+            cur.execute(
+                """CREATE TABLE IF NOT EXISTS summary_synsets (
+                content_hash TEXT NOT NULL,
+                model_id TEXT NOT NULL,
+                prompt_strategy TEXT NOT NULL,
+                role TEXT NOT NULL,
+                synset_id TEXT NOT NULL,
+                PRIMARY KEY (content_hash, model_id, prompt_strategy, role, synset_id)) WITHOUT ROWID;
+            """
+            )
+            cur.execute(
+                """CREATE INDEX IF NOT EXISTS summary_synsets_lookup
+                ON summary_synsets (role, synset_id, content_hash, model_id, prompt_strategy);"""
+            )
+
+            # lease based queue so several analyzer processes can share the backlog
+            cur.execute(
+                """CREATE TABLE IF NOT EXISTS work_queue (
+                content_hash TEXT NOT NULL,
+                model_id TEXT NOT NULL,
+                prompt_strategy TEXT NOT NULL,
+                state INTEGER NOT NULL,
+                lease_owner TEXT NULL,
+                lease_expires REAL NULL,
+                attempts INTEGER NOT NULL,
+                PRIMARY KEY (content_hash, model_id, prompt_strategy)) WITHOUT ROWID;
+            """
+            )
+            cur.execute(
+                """CREATE INDEX IF NOT EXISTS work_queue_state
+                ON work_queue (model_id, prompt_strategy, state, lease_expires);"""
+            )
+            cur.execute(
+                """CREATE TABLE IF NOT EXISTS work_queue_watermarks (
+                model_id TEXT NOT NULL,
+                prompt_strategy TEXT NOT NULL,
+                last_content_rowid INTEGER NOT NULL,
+                PRIMARY KEY (model_id, prompt_strategy));
+            """
+            )
+
+            # pre-aggregated sentiment counts maintained by add_summaries
+            cur.execute(
+                """CREATE TABLE IF NOT EXISTS sentiment_rollups (
+                dimension TEXT NOT NULL,
+                value TEXT NOT NULL,
+                sentiment INTEGER NOT NULL,
+                region TEXT NOT NULL,
+                forum TEXT NOT NULL,
+                day TEXT NOT NULL,
+                count INTEGER NOT NULL,
+                PRIMARY KEY (dimension, value, sentiment, region, forum, day)) WITHOUT ROWID;
+            """
+            )
+            cur.execute(
+                """CREATE INDEX IF NOT EXISTS sentiment_rollups_day
+                ON sentiment_rollups (dimension, day, value, sentiment, count);"""
+            )
+
+            # bumped by every write to the summaries so result caches can invalidate
+            cur.execute(
+                """CREATE TABLE IF NOT EXISTS summary_generation (
+                id INTEGER NOT NULL CHECK (id = 0),
+                generation INTEGER NOT NULL,
+                PRIMARY KEY (id));
+            """
+            )
+            cur.execute("INSERT OR IGNORE INTO summary_generation VALUES (0, 0);")
+
+            # one row per stage of each analyzed batch, see metrics.MetricsRecorder
+            cur.execute(
+                """CREATE TABLE IF NOT EXISTS stage_metrics (
+                batch_started REAL NOT NULL,
+                worker_id TEXT NOT NULL,
+                stage TEXT NOT NULL,
+                operations INTEGER NOT NULL,
+                items INTEGER NOT NULL,
+                items_per_second REAL NOT NULL,
+                p50 REAL NOT NULL,
+                p95 REAL NOT NULL,
+                p99 REAL NOT NULL,
+                requests INTEGER NOT NULL,
+                retries INTEGER NOT NULL,
+                prompt_tokens INTEGER NOT NULL,
+                completion_tokens INTEGER NOT NULL,
+                cached_tokens INTEGER NOT NULL,
+                cost REAL NOT NULL,
+                PRIMARY KEY (batch_started, worker_id, stage));
+            """
+            )
+
+            self._migrate(cur)
 
             c.commit()
 
-    def get_unanalyzed_content(self, number: int = 100) -> typing.List[Content]:
-        with sqlite3.connect(self.db_file_path) as c:
+    def _migrate(self, cur):
+        version = cur.execute("PRAGMA user_version").fetchone()[0]
+
+        if version < 1:
+            # backfill summary_synsets from the flattened *_values columns
+            rows = cur.execute(
+                "SELECT content_hash, model_id, prompt_strategy, topic_values, method_values, contributors_values FROM sentiment_summaries"
+            )
+            synset_rows = []
+            for content_hash, model_id, prompt_strategy, *values in rows.fetchall():
+                for role, v in zip(SYNSET_ROLES, values):
+                    synset_rows.extend(
+                        (content_hash, model_id, prompt_strategy, role, synset_id)
+                        for synset_id in set(_split_values(v))
+                    )
+            cur.executemany(
+                "INSERT OR IGNORE INTO summary_synsets VALUES (?,?,?,?,?);",
+                synset_rows,
+            )
+            cur.execute("PRAGMA user_version = 1")
+
+        if version < 2:
+            # backfill the rollups from the summaries stored so far
+            cur.execute("DELETE FROM sentiment_rollups")
+            _update_rollups(
+                cur,
+                cur.execute(
+                    "SELECT content_hash, model_id, prompt_strategy FROM sentiment_summaries"
+                ).fetchall(),
+            )
+            cur.execute("PRAGMA user_version = 2")
+
+        if version < 3:
+            # the resolved synset is the last *_values entry, everything stored so
+            # far came from the first version of the disambiguation and expansion
+            for role in ("topic", "method"):
+                cur.execute(
+                    f"""UPDATE sentiment_summaries SET {role}_synset_id = rtrim(
+                        substr({role}_values, length(rtrim({role}_values, replace({role}_values, ' ', ''))) + 1), '!')
+                    WHERE {role}_values IS NOT NULL AND {role}_values != ''"""
+                )
+            cur.execute("UPDATE sentiment_summaries SET wsd_version = 1, expansion_version = 1")
+            cur.execute(
+                "CREATE INDEX IF NOT EXISTS sentiment_summaries_stage_versions ON sentiment_summaries (wsd_version, expansion_version);"
+            )
+            cur.execute("PRAGMA user_version = 3")
+
+        if version < 4:
+            # contributors are counted by entity, unresolved lemmas apart
+            cur.execute("DELETE FROM sentiment_rollups")
+            _update_rollups(
+                cur,
+                cur.execute(
+                    "SELECT content_hash, model_id, prompt_strategy FROM sentiment_summaries"
+                ).fetchall(),
+            )
+            cur.execute("PRAGMA user_version = 4")
+
+    def get_unanalyzed_content(self, number: int = 100) -> ContentBatch:
+        with self.connections.connection() as c:
             results = c.execute(
-                "SELECT * FROM content c LEFT JOIN sentiment_summaries s ON c.content_hash = s.content_hash WHERE s.content_hash IS NULL LIMIT 0, ?",
+                f"""SELECT {CONTENT_COLUMNS}
+                FROM content c LEFT JOIN sentiment_summaries s ON c.content_hash = s.content_hash WHERE s.content_hash IS NULL LIMIT 0, ?""",
                 (number,),
             ).fetchall()
+            return ContentBatch.from_rows(results)
 
-            if results is not None:
-                return list(
-                    Content(
-                        o[0],
-                        o[1],
-                        o[2],
-                        o[3],
-                        json.loads(o[4]),
-                        o[5],
-                        o[6],
-                    )
-                    for o in results
+    def enqueue_content(self, model_id: str, prompt_strategy: str) -> int:
+        """Adds content ingested since the last call to the work queue of the
+        model/prompt strategy, skipping content already summarized by it.
+        Returns the number of queued items.
+        """
+        with self.connections.connection() as c:
+            cur = c.cursor()
+            cur.execute("BEGIN IMMEDIATE")
+            row = cur.execute(
+                "SELECT last_content_rowid FROM work_queue_watermarks WHERE model_id = ? AND prompt_strategy = ?",
+                (model_id, prompt_strategy),
+            ).fetchone()
+            last_rowid = row[0] if row is not None else 0
+            max_rowid = cur.execute("SELECT COALESCE(MAX(rowid), 0) FROM content").fetchone()[0]
+
+            cur.execute(
+                """INSERT OR IGNORE INTO work_queue
+                SELECT c.content_hash, ?, ?, ?, NULL, NULL, 0 FROM content c
+                WHERE c.rowid > ? AND c.rowid <= ? AND NOT EXISTS (
+                    SELECT 1 FROM sentiment_summaries s WHERE s.content_hash = c.content_hash
+                    AND s.model_id = ? AND s.prompt_strategy = ?)""",
+                (model_id, prompt_strategy, WORK_PENDING, last_rowid, max_rowid, model_id, prompt_strategy),
+            )
+            queued = cur.rowcount
+            cur.execute(
+                "INSERT OR REPLACE INTO work_queue_watermarks VALUES (?,?,?);",
+                (model_id, prompt_strategy, max_rowid),
+            )
+            c.commit()
+            return queued
+
+    def claim_work(
+        self,
+        worker_id: str,
+        model_id: str,
+        prompt_strategy: str,
+        number: int = 100,
+        lease_seconds: float = 600,
+        max_attempts: int = 3,
+    ) -> ContentBatch:
+        """Atomically leases up to number pending (or expired) queue items to the
+        worker and returns their content. Items that exhausted max_attempts,
+        whether released or expired, are marked as failed instead of being
+        handed out again.
+        """
+        now = time.time()
+        with self.connections.connection() as c:
+            cur = c.cursor()
+            # the write lock is taken up front so concurrent claims never overlap
+            cur.execute("BEGIN IMMEDIATE")
+            # released and expired items alike count their attempts
+            cur.execute(
+                """UPDATE work_queue SET state = ?, lease_owner = NULL, lease_expires = NULL
+                WHERE model_id = ? AND prompt_strategy = ? AND attempts >= ?
+                AND (state = ? OR (state = ? AND lease_expires < ?))""",
+                (WORK_FAILED, model_id, prompt_strategy, max_attempts, WORK_PENDING, WORK_LEASED, now),
+            )
+            content_hashes = [
+                r[0]
+                for r in cur.execute(
+                    """SELECT content_hash FROM work_queue WHERE model_id = ? AND prompt_strategy = ?
+                    AND state = ? AND attempts < ? LIMIT 0, ?""",
+                    (model_id, prompt_strategy, WORK_PENDING, max_attempts, number),
+                ).fetchall()
+            ]
+            if len(content_hashes) < number:
+                content_hashes.extend(
+                    r[0]
+                    for r in cur.execute(
+                        """SELECT content_hash FROM work_queue WHERE model_id = ? AND prompt_strategy = ?
+                        AND state = ? AND lease_expires < ? AND attempts < ? LIMIT 0, ?""",
+                        (model_id, prompt_strategy, WORK_LEASED, now, max_attempts, number - len(content_hashes)),
+                    ).fetchall()
                 )
-            else:
-                return None
+            cur.executemany(
+                """UPDATE work_queue SET state = ?, lease_owner = ?, lease_expires = ?, attempts = attempts + 1
+                WHERE content_hash = ? AND model_id = ? AND prompt_strategy = ?""",
+                [
+                    (WORK_LEASED, worker_id, now + lease_seconds, h, model_id, prompt_strategy)
+                    for h in content_hashes
+                ],
+            )
+            c.commit()
+
+            if len(content_hashes) == 0:
+                return ContentBatch()
+            results = cur.execute(
+                f"SELECT {CONTENT_COLUMNS} FROM content c WHERE c.content_hash IN ({','.join('?' * len(content_hashes))})",
+                content_hashes,
+            ).fetchall()
+            return ContentBatch.from_rows(results)
+
+    def heartbeat_work(
+        self, worker_id: str, model_id: str, prompt_strategy: str, lease_seconds: float = 600
+    ) -> int:
+        """Extends the leases held by the worker, returning how many are still held."""
+        with self.connections.connection() as c:
+            cur = c.cursor()
+            cur.execute(
+                """UPDATE work_queue SET lease_expires = ?
+                WHERE model_id = ? AND prompt_strategy = ? AND state = ? AND lease_owner = ?""",
+                (time.time() + lease_seconds, model_id, prompt_strategy, WORK_LEASED, worker_id),
+            )
+            c.commit()
+            return cur.rowcount
+
+    def release_work(self, worker_id: str, model_id: str, prompt_strategy: str, content_hashes: typing.List[str]):
+        """Returns leased items to the queue so another worker can retry them."""
+        with self.connections.connection() as c:
+            c.executemany(
+                """UPDATE work_queue SET state = ?, lease_owner = NULL, lease_expires = NULL
+                WHERE content_hash = ? AND model_id = ? AND prompt_strategy = ? AND state = ? AND lease_owner = ?""",
+                [
+                    (WORK_PENDING, h, model_id, prompt_strategy, WORK_LEASED, worker_id)
+                    for h in content_hashes
+                ],
+            )
+            c.commit()
 
     def add_content(self, lst_content: typing.List[Content]):
-        with sqlite3.connect(self.db_file_path) as c:
+        with self.connections.connection() as c:
             cur = c.cursor()
 
             # Convert list of dataclass instances to list of tuples
@@ -90,64 +539,349 @@ class DatabaseSqlLite:
                     json.dumps(c.raw_details),
                     c.written_date_time,
                     c.region,
+                    c.cluster_id,
                 )
                 for c in lst_content
             ]
 
             cur.executemany(
-                "INSERT INTO content VALUES (?,?,?,?,?,?,?);",
+                "INSERT INTO content (content_hash, body, author, forum, raw_details, written_date_time, region, cluster_id) VALUES (?,?,?,?,?,?,?,?);",
                 data_to_insert,
             )
 
             c.commit()
 
-    def add_summaries(self, lst_summaries: typing.List[SentimentSummary]):
-        with sqlite3.connect(self.db_file_path) as c:
+    def add_content_rows(self, rows: typing.List[typing.Tuple]) -> int:
+        """Bulk inserts pre-serialized content rows in one transaction, ordered as
+        the content table columns with raw_details already JSON encoded. Rows that
+        are already stored are skipped, so re-ingesting a file is harmless.
+        Returns the number of rows inserted.
+        """
+        with self.connections.connection() as c:
+            changes = c.total_changes
+            c.executemany(
+                "INSERT OR IGNORE INTO content (content_hash, body, author, forum, raw_details, written_date_time, region, cluster_id) VALUES (?,?,?,?,?,?,?,?);",
+                rows,
+            )
+            c.commit()
+            return c.total_changes - changes
+
+    def add_summaries(
+        self,
+        summaries: typing.Union[SummaryBatch, typing.List[SentimentSummary]],
+        worker_id: typing.Optional[str] = None,
+    ):
+        """Stores the summaries and completes their work queue items. When a
+        worker_id is given, summaries whose lease is no longer held by that
+        worker are dropped, since another worker has taken the item over.
+        """
+        if not isinstance(summaries, SummaryBatch):
+            summaries = SummaryBatch.from_summaries(summaries)
+
+        with self.connections.connection() as c:
             cur = c.cursor()
+            cur.execute("BEGIN IMMEDIATE")
 
-            # Convert list of dataclass instances to list of tuples
-            data_to_insert = [
-                (
-                    s.content_hash,
-                    s.model_id,
-                    s.prompt_strategy,
-                    (1 if s.sentiment else 0 if s.sentiment is not None else None),
-                    json.dumps(s.log),
-                    json.dumps(s.justifications),
-                    s.discussion_duration,
-                    s.location,
-                    s.content_datetime,
-                    json.dumps(s.contributors),
-                    (
-                        " ".join(st + "!" for st in s.contributors_values)
-                        if s.contributors_values is not None
-                        else None
-                    ),
-                    s.method,
-                    s.method_lemma,
-                    (
-                        " ".join(st + "!" for st in s.method_values)
-                        if s.method_values is not None
-                        else None
-                    ),
-                    s.topic,
-                    s.topic_lemma,
-                    (
-                        " ".join(st + "!" for st in s.topic_values)
-                        if s.topic_values is not None
-                        else None
-                    ),
-                )
-                for s in lst_summaries
+            if worker_id is not None:
+                held = []
+                for i, key in enumerate(summaries.keys()):
+                    if cur.execute(
+                        """SELECT 1 FROM work_queue WHERE content_hash = ? AND model_id = ? AND prompt_strategy = ?
+                        AND state = ? AND lease_owner = ?""",
+                        key + (WORK_LEASED, worker_id),
+                    ).fetchone() is not None:
+                        held.append(i)
+                    else:
+                        print(f"Dropping summary of {key[0]}, its lease was lost")
+                if len(held) < len(summaries):
+                    summaries = summaries.select(held)
+
+            # the batch columns are already in their stored form
+            cur.executemany(
+                f"INSERT INTO sentiment_summaries ({SUMMARY_COLUMNS}) VALUES ({','.join('?' * len(SummaryBatch.__slots__))});",
+                summaries.rows(),
+            )
+            cur.executemany(
+                "INSERT OR IGNORE INTO summary_synsets VALUES (?,?,?,?,?);",
+                _summary_synset_rows(summaries),
+            )
+            keys = summaries.keys()
+            cur.executemany(
+                """UPDATE work_queue SET state = ?, lease_owner = NULL, lease_expires = NULL
+                WHERE content_hash = ? AND model_id = ? AND prompt_strategy = ?""",
+                [(WORK_DONE,) + key for key in keys],
+            )
+            _update_rollups(cur, keys)
+            cur.execute("UPDATE summary_generation SET generation = generation + 1")
+
+            c.commit()
+
+    def fan_out_cluster_summaries(self, lst_content: typing.List[Content]) -> typing.Set[str]:
+        """Copies the summaries of already analyzed clusters to the given
+        near-duplicate members, returning the content hashes that were covered.
+        The summaries of the cluster's representative are copied when it was
+        analyzed, otherwise those of any analyzed member.
+        """
+        members = [c for c in lst_content if c.cluster_id is not None]
+        if len(members) == 0:
+            return set()
+
+        with self.connections.connection() as c:
+            cur = c.cursor()
+            cluster_ids = list(set(m.cluster_id for m in members))
+            sources = {}
+            for cluster_id, content_hash in cur.execute(
+                f"""SELECT DISTINCT c.cluster_id, c.content_hash FROM content c
+                JOIN sentiment_summaries s ON s.content_hash = c.content_hash
+                WHERE c.cluster_id IN ({','.join('?' * len(cluster_ids))})""",
+                cluster_ids,
+            ).fetchall():
+                if cluster_id not in sources or content_hash == cluster_id:
+                    sources[cluster_id] = content_hash
+            covered = [
+                (m, sources[m.cluster_id]) for m in members
+                if m.cluster_id in sources and sources[m.cluster_id] != m.content_hash
             ]
+            new_keys = []
+            for m, source in covered:
+                for model_id, prompt_strategy in cur.execute(
+                    """SELECT s.model_id, s.prompt_strategy FROM sentiment_summaries s WHERE s.content_hash = ?
+                    AND NOT EXISTS (SELECT 1 FROM sentiment_summaries e WHERE e.content_hash = ?
+                        AND e.model_id = s.model_id AND e.prompt_strategy = s.prompt_strategy)""",
+                    (source, m.content_hash),
+                ).fetchall():
+                    new_keys.append((m.content_hash, model_id, prompt_strategy))
+            cur.executemany(
+                f"""INSERT OR IGNORE INTO sentiment_summaries ({SUMMARY_COLUMNS})
+                SELECT ?, s.model_id, s.prompt_strategy, s.sentiment, s.log, s.justifications,
+                    0, s.location, s.content_datetime, s.contributors, s.contributors_values, s.method,
+                    s.method_lemma_id, s.method_values, s.topic, s.topic_lemma_id, s.topic_values,
+                    s.topic_synset_id, s.method_synset_id, s.wsd_version, s.expansion_version, s.contributor_version
+                FROM sentiment_summaries s WHERE s.content_hash = ?""",
+                [(m.content_hash, source) for m, source in covered],
+            )
+            cur.executemany(
+                """INSERT OR IGNORE INTO summary_synsets
+                SELECT ?, model_id, prompt_strategy, role, synset_id FROM summary_synsets WHERE content_hash = ?""",
+                [(m.content_hash, source) for m, source in covered],
+            )
+            cur.executemany(
+                """UPDATE work_queue SET state = ?, lease_owner = NULL, lease_expires = NULL
+                WHERE content_hash = ? AND EXISTS (
+                    SELECT 1 FROM sentiment_summaries s WHERE s.content_hash = work_queue.content_hash
+                    AND s.model_id = work_queue.model_id AND s.prompt_strategy = work_queue.prompt_strategy)""",
+                [(WORK_DONE, m.content_hash) for m, _ in covered],
+            )
+            _update_rollups(cur, new_keys)
+            if len(new_keys) > 0:
+                cur.execute("UPDATE summary_generation SET generation = generation + 1")
+            c.commit()
+            return set(m.content_hash for m, _ in covered)
 
+    def get_stale_stage_rows(
+        self,
+        wsd_version: int,
+        expansion_version: int,
+        after_rowid: int = 0,
+        number: int = 1000,
+        contributor_version: typing.Optional[str] = None,
+    ) -> typing.List[StageRow]:
+        """Returns up to number summaries after after_rowid whose disambiguation
+        or expansion was produced by another version than the given ones, or,
+        given a contributor_version, whose contributors were resolved against
+        another catalog.
+        """
+        with self.connections.connection() as c:
+            rows = c.execute(
+                """SELECT rowid, content_hash, model_id, prompt_strategy, topic_lemma_id, method_lemma_id,
+                    topic_synset_id, method_synset_id, wsd_version, expansion_version, contributors, contributor_version
+                FROM sentiment_summaries WHERE rowid > ? AND (wsd_version IS NOT ? OR expansion_version IS NOT ?
+                    OR (? IS NOT NULL AND contributor_version IS NOT ?))
+                ORDER BY rowid LIMIT ?""",
+                (after_rowid, wsd_version, expansion_version, contributor_version, contributor_version, number),
+            ).fetchall()
+            return [StageRow(*r[:10], json.loads(r[10]), r[11]) for r in rows]
+
+    def get_content(self, content_hashes: typing.List[str]) -> ContentBatch:
+        with self.connections.connection() as c:
+            return ContentBatch.from_rows(
+                c.execute(
+                    f"SELECT {CONTENT_COLUMNS} FROM content c WHERE c.content_hash IN ({','.join('?' * len(content_hashes))})",
+                    content_hashes,
+                ).fetchall()
+            )
+
+    def _rewrite_summaries(
+        self,
+        keys: typing.List[typing.Tuple[str, str, str]],
+        update_sql: str,
+        update_params: typing.List[typing.Tuple],
+        roles: typing.Tuple[str, ...],
+        synset_rows: typing.List[typing.Tuple],
+    ):
+        # update_sql sets the columns of update_params followed by updated_generation
+        # and the key, the summary_synsets rows of roles are replaced by synset_rows
+        with self.connections.connection() as c:
+            cur = c.cursor()
+            cur.execute("BEGIN IMMEDIATE")
+            cur.execute("UPDATE summary_generation SET generation = generation + 1")
+            generation = cur.execute("SELECT generation FROM summary_generation").fetchone()[0]
+            _update_rollups(cur, keys, sign=-1)
             cur.executemany(
-                "INSERT INTO sentiment_summaries VALUES (?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?);",
-                data_to_insert,
+                update_sql,
+                [params + (generation,) + key for params, key in zip(update_params, keys)],
+            )
+            cur.executemany(
+                f"""DELETE FROM summary_synsets WHERE content_hash = ? AND model_id = ? AND prompt_strategy = ?
+                AND role IN ({','.join('?' * len(roles))})""",
+                [key + roles for key in keys],
             )
+            cur.executemany("INSERT OR IGNORE INTO summary_synsets VALUES (?,?,?,?,?);", synset_rows)
+            _update_rollups(cur, keys)
+            c.commit()
+
+    def update_stage_results(self, results: typing.List[StageResult]):
+        """Replaces the disambiguation and expansion results of stored summaries,
+        keeping their synset index and rollups consistent.
+        """
+        keys = [(r.content_hash, r.model_id, r.prompt_strategy) for r in results]
+        self._rewrite_summaries(
+            keys,
+            """UPDATE sentiment_summaries SET topic_synset_id = ?, topic_values = ?, method_synset_id = ?,
+                method_values = ?, wsd_version = ?, expansion_version = ?, updated_generation = ?
+            WHERE content_hash = ? AND model_id = ? AND prompt_strategy = ?""",
+            [
+                (
+                    r.topic_synset_id, join_values(r.topic_values), r.method_synset_id,
+                    join_values(r.method_values), r.wsd_version, r.expansion_version,
+                )
+                for r in results
+            ],
+            ("topic", "method"),
+            [
+                key + (role, synset_id)
+                for r, key in zip(results, keys)
+                for role, values in (("topic", r.topic_values), ("method", r.method_values))
+                for synset_id in set(values or [])
+            ],
+        )
+
+    def update_contributor_results(self, results: typing.List[ContributorResult]):
+        """Replaces the contributor resolutions of stored summaries, keeping
+        their synset index and rollups consistent.
+        """
+        keys = [(r.content_hash, r.model_id, r.prompt_strategy) for r in results]
+        self._rewrite_summaries(
+            keys,
+            """UPDATE sentiment_summaries SET contributors_values = ?, contributor_version = ?, updated_generation = ?
+            WHERE content_hash = ? AND model_id = ? AND prompt_strategy = ?""",
+            [(join_values(r.contributors_values), r.contributor_version) for r in results],
+            ("contributor",),
+            [
+                key + ("contributor", entity_id)
+                for r, key in zip(results, keys)
+                for entity_id in set(r.contributors_values)
+            ],
+        )
+
+    def iter_snapshot_rows(
+        self, after_rowid: int, chunk_rows: int = 100000
+    ) -> typing.Iterator[typing.Tuple[int, typing.List[typing.Tuple]]]:
+        """Yields (last summary rowid, rows) chunks of the joined content and
+        summaries inserted after after_rowid, in the column order of
+        snapshot_store.SNAPSHOT_SCHEMA without the derived date columns.
+        """
+        c = self.connections.connection()
+        cur = c.execute(
+            f"""SELECT s.rowid, {SNAPSHOT_COLUMNS}
+            FROM sentiment_summaries s INNER JOIN content c ON c.content_hash = s.content_hash
+            WHERE s.rowid > ? ORDER BY s.rowid""",
+            (after_rowid,),
+        )
+        while True:
+            rows = cur.fetchmany(chunk_rows)
+            if len(rows) == 0:
+                break
+            yield rows[-1][0], [r[1:] for r in rows]
+
+    def iter_updated_snapshot_rows(
+        self,
+        after_generation: int,
+        appended_after_rowid: int,
+        up_to_rowid: int,
+        appended_generation: int,
+        chunk_rows: int = 100000,
+    ) -> typing.Iterator[typing.Tuple[int, typing.List[typing.Tuple]]]:
+        """Yields (highest updated generation, rows) chunks, as iter_snapshot_rows
+        does, of the summaries up to up_to_rowid that were updated in place
+        after after_generation, ordered by forum and month. The summaries after
+        appended_after_rowid were just appended, read at appended_generation or
+        later, and are only yielded when updated after it.
+        """
+        c = self.connections.connection()
+        cur = c.execute(
+            f"""SELECT s.updated_generation, {SNAPSHOT_COLUMNS}
+            FROM sentiment_summaries s INNER JOIN content c ON c.content_hash = s.content_hash
+            WHERE s.updated_generation > ? AND s.rowid <= ? AND (s.rowid <= ? OR s.updated_generation > ?)
+            ORDER BY c.forum, substr(trim(c.written_date_time), 1, 7)""",
+            (after_generation, up_to_rowid, appended_after_rowid, appended_generation),
+        )
+        while True:
+            rows = cur.fetchmany(chunk_rows)
+            if len(rows) == 0:
+                break
+            yield max(r[0] for r in rows), [r[1:] for r in rows]
 
+    def export_parquet_snapshot(self, root_dir: str = "snapshots", chunk_rows: int = 100000) -> int:
+        """Incrementally exports the summaries to a partitioned Parquet snapshot,
+        see snapshot_store.ParquetSnapshotStore for reading it back.
+        """
+        from .snapshot_store import ParquetSnapshotStore
+
+        return ParquetSnapshotStore(root_dir).export(self, chunk_rows)
+
+    def add_stage_metrics(self, batch_started: float, worker_id: str, rows: typing.List[dict]):
+        """Stores the rows of MetricsRecorder.batch_summary."""
+        with self.connections.connection() as c:
+            c.executemany(
+                "INSERT OR REPLACE INTO stage_metrics VALUES (?,?,?,?,?,?,?,?,?,?,?,?,?,?,?);",
+                [
+                    (
+                        batch_started, worker_id, r["stage"], r["operations"], r["items"], r["items_per_second"],
+                        r["p50"], r["p95"], r["p99"], r["requests"], r["retries"],
+                        r["prompt_tokens"], r["completion_tokens"], r["cached_tokens"], r["cost"],
+                    )
+                    for r in rows
+                ],
+            )
             c.commit()
 
+    def get_summary_generation(self) -> int:
+        with self.connections.connection() as c:
+            return c.execute("SELECT generation FROM summary_generation").fetchone()[0]
+
+    def get_frequent_lemmas(self, number: int = 10000) -> typing.List[typing.Tuple[str, str]]:
+        """Returns the most frequent (lemma, role) pairs, role being "topic" or "method"."""
+        with self.connections.connection() as c:
+            return c.execute(
+                """SELECT lemma, role FROM (
+                    SELECT topic_lemma_id AS lemma, 'topic' AS role FROM sentiment_summaries WHERE topic_lemma_id IS NOT NULL AND topic_lemma_id != ''
+                    UNION ALL
+                    SELECT method_lemma_id AS lemma, 'method' AS role FROM sentiment_summaries WHERE method_lemma_id IS NOT NULL AND method_lemma_id != ''
+                ) GROUP BY lemma, role ORDER BY COUNT(*) DESC LIMIT 0, ?""",
+                (number,),
+            ).fetchall()
+
+    def get_synset_frequencies(self) -> typing.Dict[str, typing.Dict[str, int]]:
+        """Returns role -> synset_id -> number of summaries indexed with it."""
+        frequencies = {role: {} for role in SYNSET_ROLES}
+        with self.connections.connection() as c:
+            for role, synset_id, count in c.execute(
+                "SELECT role, synset_id, COUNT(*) FROM summary_synsets GROUP BY role, synset_id"
+            ):
+                frequencies.setdefault(role, {})[synset_id] = count
+        return frequencies
+
     def lookup_sentiment_summaries(
         self,
         topic_id: typing.Optional[str] = None,
@@ -158,7 +892,7 @@ class DatabaseSqlLite:
         end_content_datetime: typing.Optional[datetime.datetime] = None,
         return_limit: typing.Optional[int] = None,
     ) -> pd.DataFrame:
-        with sqlite3.connect(self.db_file_path) as c:
+        with self.connections.connection() as c:
             base_query = """SELECT 
                 c.content_hash AS content_hash, 
                 s.sentiment AS sentiment,
@@ -169,34 +903,77 @@ class DatabaseSqlLite:
                 c.region as region
               FROM sentiment_summaries s INNER JOIN content c ON c.content_hash = s.content_hash
             """
-            where_clauses = []
-            params = []
-
-            if topic_id is not None:
-                where_clauses.append("s.topic_values LIKE ?")
-                params.append(f"{topic_id}!")
-
-            if method_id is not None:
-                where_clauses.append("s.method_values LIKE ?")
-                params.append(f"{method_id}!")
-
-            if contributor_id is not None:
-                where_clauses.append("s.contributors_values LIKE ?")
-                params.append(f"{contributor_id}!")
-
-            if sentiment is not None:
-                where_clauses.append("s.sentiment = ?")
-                params.append(f"{1 if sentiment else 0}!")
-
-            where_clause = ""
-            if len(where_clauses) > 0:
-                where_clause = " WHERE " + " AND ".join(where_clauses)
+            filter_clause, params = _filter_clause(
+                topic_id, method_id, contributor_id, sentiment, start_content_datetime, end_content_datetime
+            )
 
             limit_clause = ""
             if return_limit is not None:
                 limit_clause = " LIMIT 0,?"
                 params.append(return_limit)
             df = pd.read_sql_query(
-                base_query + where_clause + limit_clause, c, params=params
+                base_query + filter_clause + limit_clause, c, params=params
             )
             return df
+
+    def lookup_sentiment_counts(
+        self,
+        dimension: str,
+        topic_id: typing.Optional[str] = None,
+        method_id: typing.Optional[str] = None,
+        contributor_id: typing.Optional[str] = None,
+        sentiment: typing.Optional[bool] = None,
+        start_content_datetime: typing.Optional[datetime.datetime] = None,
+        end_content_datetime: typing.Optional[datetime.datetime] = None,
+    ) -> pd.DataFrame:
+        """Returns summary counts per dimension value and sentiment as columns
+        (dimension, "sentiment", "Count"), or ("sentiment", "Count") when the
+        dimension is the sentiment itself. Without synset filters the counts come
+        straight from sentiment_rollups; with them the matching summaries are
+        aggregated, which costs in proportion to the number of matches.
+        """
+        if dimension not in ROLLUP_DIMENSIONS:
+            raise ValueError(f"Unknown dimension {dimension}")
+
+        with self.connections.connection() as c:
+            if topic_id is None and method_id is None and contributor_id is None:
+                where_clauses = ["dimension = ?"]
+                params = [dimension]
+                if sentiment is not None:
+                    where_clauses.append("sentiment = ?")
+                    params.append(1 if sentiment else 0)
+                if start_content_datetime is not None:
+                    where_clauses.append("day >= ?")
+                    params.append(_day(start_content_datetime))
+                if end_content_datetime is not None:
+                    where_clauses.append("day <= ?")
+                    params.append(_day(end_content_datetime))
+                rows = c.execute(
+                    f"""SELECT value, sentiment, SUM(count) FROM sentiment_rollups
+                    WHERE {" AND ".join(where_clauses)} GROUP BY value, sentiment""",
+                    params,
+                ).fetchall()
+            else:
+                filter_clause, params = _filter_clause(
+                    topic_id, method_id, contributor_id, sentiment, start_content_datetime, end_content_datetime
+                )
+                counts = collections.Counter()
+                for row in c.execute(
+                    f"""SELECT {ROLLUP_SOURCE_COLUMNS}
+                    FROM sentiment_summaries s INNER JOIN content c ON c.content_hash = s.content_hash""" + filter_clause,
+                    params,
+                ):
+                    counts.update(
+                        (value, row_sentiment)
+                        for d, value, row_sentiment, *_ in _rollup_entries(row)
+                        if d == dimension
+                    )
+                rows = [key + (count,) for key, count in counts.items()]
+
+        rows = [
+            (value, None if row_sentiment == ROLLUP_NEUTRAL else row_sentiment, count)
+            for value, row_sentiment, count in rows
+        ]
+        if dimension == "sentiment":
+            return pd.DataFrame([(r[1], r[2]) for r in rows], columns=["sentiment", "Count"])
+        return pd.DataFrame(rows, columns=[dimension, "sentiment", "Count"])
@@ -0,0 +1,129 @@
+import os
+import typing
+
+import numpy as np
+
+
+NAMES_FILE = "names.txt"
+OFFSETS_FILE = "offsets.npy"
+ANCESTORS_FILE = "ancestors.npy"
+TREE_IN_FILE = "tree_in.npy"
+TREE_OUT_FILE = "tree_out.npy"
+
+
+class HypernymClosureIndex:
+    """Array backed transitive closure of the WordNet hypernym relation.
+
+    Synsets are numbered by their sorted names. The ancestors of synset i are the
+    sorted slice ancestors[offsets[i]:offsets[i + 1]]. Because WordNet allows
+    several hypernyms, the Euler tour intervals (tree_in, tree_out) cover a
+    spanning tree only; they answer most ancestor checks in constant time and the
+    remaining ones fall back to a binary search of the ancestor slice. All arrays
+    are memory-mapped so forked workers share the same pages.
+    """
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        with open(os.path.join(directory, NAMES_FILE), encoding="utf-8") as f:
+            self.names = f.read().split("\n")
+        self.ids = {name: i for i, name in enumerate(self.names)}
+        self.offsets = np.load(os.path.join(directory, OFFSETS_FILE), mmap_mode="r")
+        self.ancestors = np.load(os.path.join(directory, ANCESTORS_FILE), mmap_mode="r")
+        self.tree_in = np.load(os.path.join(directory, TREE_IN_FILE), mmap_mode="r")
+        self.tree_out = np.load(os.path.join(directory, TREE_OUT_FILE), mmap_mode="r")
+
+    def __contains__(self, synset_id: str) -> bool:
+        return synset_id in self.ids
+
+    def _ancestor_slice(self, i: int) -> np.ndarray:
+        return self.ancestors[self.offsets[i] : self.offsets[i + 1]]
+
+    def get_parent_ids(self, synset_id: str) -> typing.List[str]:
+        return [self.names[a] for a in self._ancestor_slice(self.ids[synset_id])]
+
+    def is_ancestor(self, ancestor_id: str, synset_id: str) -> bool:
+        a = self.ids[ancestor_id]
+        d = self.ids[synset_id]
+        if a == d:
+            return False
+        if self.tree_in[a] <= self.tree_in[d] and self.tree_out[d] <= self.tree_out[a]:
+            return True
+        ancestors = self._ancestor_slice(d)
+        position = np.searchsorted(ancestors, a)
+        return bool(position < len(ancestors) and ancestors[position] == a)
+
+    @staticmethod
+    def build(directory: str, hypernyms: typing.Dict[str, typing.List[str]]):
+        """Writes the index for a synset name -> hypernym names mapping."""
+        names = sorted(hypernyms.keys())
+        ids = {name: i for i, name in enumerate(names)}
+        parents = [sorted(ids[p] for p in hypernyms[name] if p in ids) for name in names]
+
+        # transitive closure, memoized over an iterative post-order walk
+        closure: typing.List[typing.Optional[frozenset]] = [None] * len(names)
+        for start in range(len(names)):
+            stack = [start]
+            while stack:
+                i = stack[-1]
+                if closure[i] is not None:
+                    stack.pop()
+                    continue
+                pending = [p for p in parents[i] if closure[p] is None]
+                if pending:
+                    stack.extend(pending)
+                    continue
+                result = set(parents[i])
+                for p in parents[i]:
+                    result.update(closure[p])
+                closure[i] = frozenset(result)
+                stack.pop()
+
+        offsets = np.zeros(len(names) + 1, dtype=np.int64)
+        for i, ancestors in enumerate(closure):
+            offsets[i + 1] = offsets[i] + len(ancestors)
+        flat = np.empty(offsets[-1], dtype=np.int32)
+        for i, ancestors in enumerate(closure):
+            flat[offsets[i] : offsets[i + 1]] = sorted(ancestors)
+
+        # Euler tour over the spanning tree formed by each synset's first hypernym
+        children = [[] for _ in names]
+        roots = []
+        for i, ps in enumerate(parents):
+            if ps:
+                children[ps[0]].append(i)
+            else:
+                roots.append(i)
+        tree_in = np.zeros(len(names), dtype=np.int32)
+        tree_out = np.zeros(len(names), dtype=np.int32)
+        clock = 0
+        for root in roots:
+            stack = [(root, False)]
+            while stack:
+                i, visited = stack.pop()
+                if visited:
+                    tree_out[i] = clock
+                    clock += 1
+                    continue
+                tree_in[i] = clock
+                clock += 1
+                stack.append((i, True))
+                stack.extend((c, False) for c in reversed(children[i]))
+
+        os.makedirs(directory, exist_ok=True)
+        with open(os.path.join(directory, NAMES_FILE), "w", encoding="utf-8") as f:
+            f.write("\n".join(names))
+        np.save(os.path.join(directory, OFFSETS_FILE), offsets)
+        np.save(os.path.join(directory, ANCESTORS_FILE), flat)
+        np.save(os.path.join(directory, TREE_IN_FILE), tree_in)
+        np.save(os.path.join(directory, TREE_OUT_FILE), tree_out)
+
+
+def build_from_wordnet(directory: str):
+    from nltk.corpus import wordnet as wn
+
+    hypernyms = {}
+    for pos in (wn.NOUN, wn.VERB):
+        for s in wn.all_synsets(pos):
+            # same relation walked by SynsetDatabaseWordNet.get_parent_ids
+            hypernyms[s._name] = [p._name for p in s.hypernyms()]
+    HypernymClosureIndex.build(directory, hypernyms)
@@ -0,0 +1,146 @@
+import collections
+import concurrent.futures
+import csv
+import gzip
+import json
+import os
+import time
+import typing
+
+from .model import convert_to_id
+
+
+def open_records(file_path: str) -> typing.Iterator[dict]:
+    """Yields the rows of a CSV or JSONL file, optionally gzip-compressed."""
+    name = file_path[:-3] if file_path.endswith(".gz") else file_path
+    opener = gzip.open if file_path.endswith(".gz") else open
+    with opener(file_path, mode="rt", encoding="utf-8", newline="") as f:
+        if name.endswith(".jsonl") or name.endswith(".ndjson"):
+            for line in f:
+                if line.strip() != "":
+                    yield json.loads(line)
+        else:
+            yield from csv.DictReader(f)
+
+
+def read_chunks(file_path: str, chunk_rows: int) -> typing.Iterator[typing.List[dict]]:
+    chunk = []
+    for row in open_records(file_path):
+        chunk.append(row)
+        if len(chunk) >= chunk_rows:
+            yield chunk
+            chunk = []
+    if len(chunk) > 0:
+        yield chunk
+
+
+def serialize_chunk(rows: typing.List[dict], field_mapping: dict, forum: str, region: str, hasher=None):
+    """Turns raw rows into content table tuples, serializing each row once.
+
+    Runs in worker processes. Returns (content rows, minhash signatures or None,
+    number of skipped rows).
+    """
+    content_rows = []
+    signatures = [] if hasher is not None else None
+    skipped = 0
+    for row in rows:
+        try:
+            # same digest as model.create_content_id, reusing the serialized row
+            raw_details = json.dumps(row, sort_keys=True)
+            body = row[field_mapping["body"]]
+            signature = hasher.signature(body) if hasher is not None else None
+            content_rows.append(
+                (
+                    convert_to_id(raw_details),
+                    body,
+                    row[field_mapping["author"]],
+                    forum,
+                    raw_details,
+                    row[field_mapping["written_date_time"]],
+                    row[field_mapping["region"]] if "region" in field_mapping else region,
+                    None,
+                )
+            )
+            if hasher is not None:
+                signatures.append(signature)
+        except Exception as e:
+            print(f"Skipping row due to parsing exception: {e}")
+            skipped += 1
+    return content_rows, signatures, skipped
+
+
+def ingest_file(
+    file_path: str,
+    database,
+    field_mapping: dict,
+    forum: str,
+    region: str,
+    workers: typing.Optional[int] = None,
+    chunk_rows: int = 5000,
+    write_batch_rows: int = 50000,
+    near_duplicate_index=None,
+    report_interval: float = 10,
+) -> int:
+    """Ingests a CSV/JSONL(.gz) file with hashing and serialization spread over a
+    process pool and a single writer committing large batches. Returns the number
+    of rows written, leaving out rows that were already stored.
+    """
+    workers = workers if workers is not None else os.cpu_count()
+    hasher = near_duplicate_index.hasher if near_duplicate_index is not None else None
+    start = time.time()
+    last_report = start
+    written = 0
+    skipped = 0
+    duplicates = 0
+    pending_rows = []
+    pending_signatures = []
+
+    def flush():
+        nonlocal written, duplicates
+        if near_duplicate_index is not None:
+            cluster_ids = near_duplicate_index.assign_signed(
+                [(r[0], sig) for r, sig in zip(pending_rows, pending_signatures)]
+            )
+            pending_rows[:] = [r[:-1] + (cluster_id,) for r, cluster_id in zip(pending_rows, cluster_ids)]
+        inserted = database.add_content_rows(pending_rows)
+        written += inserted
+        duplicates += len(pending_rows) - inserted
+        pending_rows.clear()
+        pending_signatures.clear()
+
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as executor:
+        # bound the chunks in flight so memory stays flat for very large files
+        max_in_flight = 2 * workers
+        in_flight = collections.deque()
+        chunks = read_chunks(file_path, chunk_rows)
+        exhausted = False
+        while True:
+            while not exhausted and len(in_flight) < max_in_flight:
+                chunk = next(chunks, None)
+                if chunk is None:
+                    exhausted = True
+                    break
+                in_flight.append(
+                    executor.submit(serialize_chunk, chunk, field_mapping, forum, region, hasher)
+                )
+            if len(in_flight) == 0:
+                break
+
+            content_rows, signatures, chunk_skipped = in_flight.popleft().result()
+            pending_rows.extend(content_rows)
+            if signatures is not None:
+                pending_signatures.extend(signatures)
+            skipped += chunk_skipped
+            if len(pending_rows) >= write_batch_rows:
+                flush()
+
+            now = time.time()
+            if now - last_report >= report_interval:
+                print(f"{file_path}: {written} rows written, {duplicates} already stored, {skipped} skipped, {written / (now - start):.0f} rows/s")
+                last_report = now
+
+    if len(pending_rows) > 0:
+        flush()
+    duration = time.time() - start
+    print(f"{file_path}: finished {written} rows ({duplicates} already stored, {skipped} skipped) in {duration:.1f}s, {written / max(duration, 1e-9):.0f} rows/s")
+    return written
@@ -0,0 +1,179 @@
+import collections
+import contextlib
+import os
+import threading
+import time
+import typing
+
+import numpy as np
+
+
+STAGE_EXTRACTION = "extraction"
+STAGE_WSD = "wsd"
+STAGE_HYPERNYM_EXPANSION = "hypernym_expansion"
+STAGE_DB_WRITE = "db_write"
+
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+# USD per million (input, output, cached input) tokens
+MODEL_PRICES = {
+    "gpt-4o-mini": (0.15, 0.60, 0.075),
+    "gpt-4o": (2.50, 10.00, 1.25),
+    "gpt-3.5-turbo": (0.50, 1.50, 0.50),
+}
+
+
+def _labels(**labels) -> str:
+    return "{" + ",".join(f'{k}="{v}"' for k, v in labels.items()) + "}"
+
+
+class MetricsRecorder:
+    """Collects per-stage latencies, token usage, retries and cost.
+
+    Totals accumulate for the whole run and are exported in the Prometheus text
+    format, while the raw latencies of the current batch give the percentiles of
+    batch_summary.
+    """
+
+    def __init__(self, prices: typing.Optional[typing.Dict[str, typing.Tuple[float, float, float]]] = None):
+        self.prices = prices if prices is not None else MODEL_PRICES
+        self.bucket_counts = collections.defaultdict(lambda: np.zeros(len(LATENCY_BUCKETS) + 1, dtype=np.int64))
+        self.latency_sums = collections.defaultdict(float)
+        self.latency_counts = collections.defaultdict(int)
+        self.items = collections.defaultdict(int)
+        # (stage, model) -> totals
+        self.prompt_tokens = collections.defaultdict(int)
+        self.completion_tokens = collections.defaultdict(int)
+        self.cached_tokens = collections.defaultdict(int)
+        self.requests = collections.defaultdict(int)
+        self.retries = collections.defaultdict(int)
+        self.cost = collections.defaultdict(float)
+        # observe is also called from the expansion and writer threads of the pipeline
+        self._lock = threading.Lock()
+        self.start_batch()
+
+    def start_batch(self):
+        self.batch_started = time.time()
+        self.batch_latencies = collections.defaultdict(list)
+        self.batch_items = collections.defaultdict(int)
+        self.batch_usage = collections.defaultdict(lambda: collections.Counter())
+
+    def observe(self, stage: str, seconds: float, items: int = 1):
+        """Records one operation of the stage covering items records."""
+        with self._lock:
+            self.bucket_counts[stage][np.searchsorted(LATENCY_BUCKETS, seconds)] += 1
+            self.latency_sums[stage] += seconds
+            self.latency_counts[stage] += 1
+            self.items[stage] += items
+            self.batch_latencies[stage].append(seconds)
+            self.batch_items[stage] += items
+
+    @contextlib.contextmanager
+    def time(self, stage: str, items: int = 1):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(stage, time.perf_counter() - start, items)
+
+    def record_request(self, stage: str, model: str, usage=None, retries: int = 0):
+        """Records an API request given the usage object of its completion."""
+        key = (stage, model)
+        self.requests[key] += 1
+        self.retries[key] += retries
+        self.batch_usage[stage]["requests"] += 1
+        self.batch_usage[stage]["retries"] += retries
+        if usage is None:
+            return
+        prompt = usage.prompt_tokens or 0
+        completion = usage.completion_tokens or 0
+        details = getattr(usage, "prompt_tokens_details", None)
+        cached = (getattr(details, "cached_tokens", None) or 0) if details is not None else 0
+        self.prompt_tokens[key] += prompt
+        self.completion_tokens[key] += completion
+        self.cached_tokens[key] += cached
+
+        input_price, output_price, cached_price = self.prices.get(model, (0.0, 0.0, 0.0))
+        cost = ((prompt - cached) * input_price + cached * cached_price + completion * output_price) / 1e6
+        self.cost[key] += cost
+        self.batch_usage[stage]["prompt_tokens"] += prompt
+        self.batch_usage[stage]["completion_tokens"] += completion
+        self.batch_usage[stage]["cached_tokens"] += cached
+        self.batch_usage[stage]["cost"] += cost
+
+    def batch_summary(self) -> typing.List[dict]:
+        """One row per stage seen in the current batch."""
+        elapsed = max(time.time() - self.batch_started, 1e-9)
+        rows = []
+        for stage in sorted(set(self.batch_latencies) | set(self.batch_usage)):
+            latencies = np.array(self.batch_latencies.get(stage, [0.0]))
+            p50, p95, p99 = np.percentile(latencies, [50, 95, 99])
+            usage = self.batch_usage[stage]
+            rows.append(
+                {
+                    "stage": stage,
+                    "operations": len(self.batch_latencies.get(stage, [])),
+                    "items": self.batch_items.get(stage, 0),
+                    "items_per_second": self.batch_items.get(stage, 0) / elapsed,
+                    "p50": float(p50),
+                    "p95": float(p95),
+                    "p99": float(p99),
+                    "requests": usage["requests"],
+                    "retries": usage["retries"],
+                    "prompt_tokens": usage["prompt_tokens"],
+                    "completion_tokens": usage["completion_tokens"],
+                    "cached_tokens": usage["cached_tokens"],
+                    "cost": usage["cost"],
+                }
+            )
+        return rows
+
+    def format_batch_summary(self) -> str:
+        lines = [
+            f"{'stage':<20}{'items':>8}{'items/s':>10}{'p50 s':>9}{'p95 s':>9}{'p99 s':>9}{'tokens':>10}{'retries':>9}{'cost $':>10}"
+        ]
+        for row in self.batch_summary():
+            lines.append(
+                f"{row['stage']:<20}{row['items']:>8}{row['items_per_second']:>10.2f}{row['p50']:>9.3f}{row['p95']:>9.3f}{row['p99']:>9.3f}"
+                f"{row['prompt_tokens'] + row['completion_tokens']:>10}{row['retries']:>9}{row['cost']:>10.4f}"
+            )
+        return "\n".join(lines)
+
+    def prometheus_text(self) -> str:
+        lines = [
+            "# HELP csa_stage_latency_seconds Latency of pipeline stage operations.",
+            "# TYPE csa_stage_latency_seconds histogram",
+        ]
+        for stage, counts in sorted(self.bucket_counts.items()):
+            cumulative = np.cumsum(counts)
+            for bound, count in zip(LATENCY_BUCKETS, cumulative):
+                lines.append(f"csa_stage_latency_seconds_bucket{_labels(stage=stage, le=bound)} {count}")
+            lines.append(f"csa_stage_latency_seconds_bucket{_labels(stage=stage, le='+Inf')} {cumulative[-1]}")
+            lines.append(f"csa_stage_latency_seconds_sum{_labels(stage=stage)} {self.latency_sums[stage]}")
+            lines.append(f"csa_stage_latency_seconds_count{_labels(stage=stage)} {self.latency_counts[stage]}")
+
+        lines += ["# HELP csa_stage_items_total Records processed per stage.", "# TYPE csa_stage_items_total counter"]
+        for stage, count in sorted(self.items.items()):
+            lines.append(f"csa_stage_items_total{_labels(stage=stage)} {count}")
+
+        lines += ["# HELP csa_llm_tokens_total LLM tokens by kind.", "# TYPE csa_llm_tokens_total counter"]
+        for kind, totals in (("prompt", self.prompt_tokens), ("completion", self.completion_tokens), ("cached", self.cached_tokens)):
+            for (stage, model), count in sorted(totals.items()):
+                lines.append(f"csa_llm_tokens_total{_labels(stage=stage, model=model, kind=kind)} {count}")
+
+        for name, help_text, totals in (
+            ("csa_llm_requests_total", "LLM requests.", self.requests),
+            ("csa_llm_retries_total", "Retried LLM requests.", self.retries),
+            ("csa_llm_cost_usd_total", "Estimated LLM cost in USD.", self.cost),
+        ):
+            lines += [f"# HELP {name} {help_text}", f"# TYPE {name} counter"]
+            for (stage, model), value in sorted(totals.items()):
+                lines.append(f"{name}{_labels(stage=stage, model=model)} {value}")
+        return "\n".join(lines) + "\n"
+
+    def write_prometheus(self, file_path: str):
+        """Writes the metrics atomically, e.g. for node_exporter's textfile collector."""
+        tmp_path = file_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(self.prometheus_text())
+        os.replace(tmp_path, file_path)
@@ -1,7 +1,9 @@
+import array
 import typing
 import dataclasses
 import hashlib
 import json
+import sys
 
 
 def convert_to_id(wse_str):
@@ -22,6 +24,8 @@ class Content:
     raw_details: dict
     written_date_time: str
     region: str
+    # content_hash of the near-duplicate cluster representative, if clustered
+    cluster_id: typing.Optional[str] = None
 
 
 @dataclasses.dataclass
@@ -44,8 +48,215 @@ class SentimentSummary:
     topic_values: typing.Optional[typing.List[str]]
 
     contributors: typing.List[str]
-    contributors_values: typing.Optional[str]
+    # catalog entities of the contributors, see contributor_resolution.py
+    contributors_values: typing.Optional[typing.List[str]]
 
     method: str
     method_lemma: typing.Optional[str]
     method_values: typing.Optional[typing.List[str]]
+
+    # output of the disambiguation stage, *_values adds the expanded hypernyms
+    topic_synset_id: typing.Optional[str] = None
+    method_synset_id: typing.Optional[str] = None
+    # versions of the stages that produced the values, see d_04_reprocess_stages.py
+    wsd_version: typing.Optional[int] = None
+    expansion_version: typing.Optional[int] = None
+    # ContributorCatalog.version the contributors were resolved against
+    contributor_version: typing.Optional[str] = None
+
+
+class StageRow(typing.NamedTuple):
+    """A stored summary with the extraction output its later stages start from."""
+
+    rowid: int
+    content_hash: str
+    model_id: str
+    prompt_strategy: str
+    topic_lemma: typing.Optional[str]
+    method_lemma: typing.Optional[str]
+    topic_synset_id: typing.Optional[str]
+    method_synset_id: typing.Optional[str]
+    wsd_version: typing.Optional[int]
+    expansion_version: typing.Optional[int]
+    contributors: typing.List[str]
+    contributor_version: typing.Optional[str]
+
+
+class StageResult(typing.NamedTuple):
+    """New disambiguation and expansion results of a stored summary."""
+
+    content_hash: str
+    model_id: str
+    prompt_strategy: str
+    topic_synset_id: typing.Optional[str]
+    topic_values: typing.Optional[typing.List[str]]
+    method_synset_id: typing.Optional[str]
+    method_values: typing.Optional[typing.List[str]]
+    wsd_version: int
+    expansion_version: int
+
+
+class ContributorResult(typing.NamedTuple):
+    """New contributor resolutions of a stored summary."""
+
+    content_hash: str
+    model_id: str
+    prompt_strategy: str
+    contributors_values: typing.List[str]
+    contributor_version: str
+
+
+def join_values(values: typing.Optional[typing.List[str]]) -> typing.Optional[str]:
+    # space separated "id!" string stored in the *_values columns
+    return " ".join(v + "!" for v in values) if values is not None else None
+
+
+def _intern(value: typing.Optional[str]) -> typing.Optional[str]:
+    return sys.intern(value) if value is not None else None
+
+
+class ContentBatch:
+    """Content rows as parallel columns, raw_details kept as the stored JSON.
+
+    Indexing builds the Content of a row on demand, so a batch waiting for
+    analysis holds a few strings per record instead of a dataclass and a dict.
+    """
+
+    __slots__ = ("content_hash", "body", "author", "forum", "raw_details", "written_date_time", "region", "cluster_id")
+
+    def __init__(self):
+        for column in self.__slots__:
+            setattr(self, column, [])
+
+    @classmethod
+    def from_rows(cls, rows: typing.Iterable[typing.Tuple]) -> "ContentBatch":
+        """Rows ordered as the content table columns, e.g. database.CONTENT_COLUMNS."""
+        batch = cls()
+        for row in rows:
+            batch.content_hash.append(row[0])
+            batch.body.append(row[1])
+            batch.author.append(_intern(row[2]))
+            batch.forum.append(_intern(row[3]))
+            batch.raw_details.append(row[4])
+            batch.written_date_time.append(row[5])
+            batch.region.append(_intern(row[6]))
+            batch.cluster_id.append(row[7])
+        return batch
+
+    def __len__(self) -> int:
+        return len(self.content_hash)
+
+    def __getitem__(self, i: int) -> Content:
+        return Content(
+            self.content_hash[i],
+            self.body[i],
+            self.author[i],
+            self.forum[i],
+            json.loads(self.raw_details[i]),
+            self.written_date_time[i],
+            self.region[i],
+            self.cluster_id[i],
+        )
+
+    def __iter__(self) -> typing.Iterator[Content]:
+        return (self[i] for i in range(len(self)))
+
+
+class SummaryBatch:
+    """Summaries as parallel columns holding the values stored in
+    sentiment_summaries, in its column order: lists are already JSON or "id!"
+    encoded, repeated strings are interned, sentiment is 1, 0 or -1 (neutral) in
+    an int8 array and durations are in a float array.
+
+    The analyzer appends each summary once it is complete, which drops its
+    message log and lists, and add_summaries inserts the columns as they are.
+    """
+
+    __slots__ = (
+        "content_hash",
+        "model_id",
+        "prompt_strategy",
+        "sentiment",
+        "log",
+        "justifications",
+        "discussion_duration",
+        "location",
+        "content_datetime",
+        "contributors",
+        "contributors_values",
+        "method",
+        "method_lemma",
+        "method_values",
+        "topic",
+        "topic_lemma",
+        "topic_values",
+        "topic_synset_id",
+        "method_synset_id",
+        "wsd_version",
+        "expansion_version",
+        "contributor_version",
+    )
+
+    def __init__(self):
+        for column in self.__slots__:
+            setattr(self, column, [])
+        self.sentiment = array.array("b")
+        self.discussion_duration = array.array("d")
+
+    @classmethod
+    def from_summaries(cls, summaries: typing.Iterable[SentimentSummary]) -> "SummaryBatch":
+        batch = cls()
+        for s in summaries:
+            batch.append(s)
+        return batch
+
+    def append(self, s: SentimentSummary):
+        self.content_hash.append(s.content_hash)
+        self.model_id.append(sys.intern(s.model_id))
+        self.prompt_strategy.append(sys.intern(s.prompt_strategy))
+        self.sentiment.append(1 if s.sentiment else 0 if s.sentiment is not None else -1)
+        self.log.append(json.dumps(s.log))
+        self.justifications.append(json.dumps(s.justifications))
+        self.discussion_duration.append(s.discussion_duration)
+        self.location.append(s.location)
+        self.content_datetime.append(s.content_datetime)
+        self.contributors.append(json.dumps(s.contributors))
+        self.contributors_values.append(join_values(s.contributors_values))
+        self.method.append(s.method)
+        self.method_lemma.append(_intern(s.method_lemma))
+        self.method_values.append(join_values(s.method_values))
+        self.topic.append(s.topic)
+        self.topic_lemma.append(_intern(s.topic_lemma))
+        self.topic_values.append(join_values(s.topic_values))
+        self.topic_synset_id.append(s.topic_synset_id)
+        self.method_synset_id.append(s.method_synset_id)
+        self.wsd_version.append(s.wsd_version)
+        self.expansion_version.append(s.expansion_version)
+        self.contributor_version.append(s.contributor_version)
+
+    def append_copy(self, i: int, content_hash: str, discussion_duration: float = 0.0):
+        """Appends row i again for another content, e.g. a near-duplicate."""
+        for column in self.__slots__:
+            values = getattr(self, column)
+            values.append(values[i])
+        self.content_hash[-1] = content_hash
+        self.discussion_duration[-1] = discussion_duration
+
+    def select(self, indices: typing.Iterable[int]) -> "SummaryBatch":
+        batch = SummaryBatch()
+        for i in indices:
+            for column in self.__slots__:
+                getattr(batch, column).append(getattr(self, column)[i])
+        return batch
+
+    def __len__(self) -> int:
+        return len(self.content_hash)
+
+    def keys(self) -> typing.List[typing.Tuple[str, str, str]]:
+        return list(zip(self.content_hash, self.model_id, self.prompt_strategy))
+
+    def rows(self) -> typing.Iterator[typing.Tuple]:
+        """Rows for INSERT INTO sentiment_summaries."""
+        columns = [getattr(self, column) for column in self.__slots__]
+        columns[3] = (v if v >= 0 else None for v in self.sentiment)
+        return zip(*columns)
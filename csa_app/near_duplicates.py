@@ -0,0 +1,163 @@
+import hashlib
+import re
+import typing
+import zlib
+
+import numpy as np
+
+from .model import Content
+from .sqlite_connections import SqliteConnectionManager
+
+
+_URL = re.compile(r"https?://\S+|www\.\S+")
+_HANDLE = re.compile(r"[@#]\w+")
+_TOKEN = re.compile(r"\w+")
+
+_MERSENNE_PRIME = (1 << 31) - 1
+
+
+def shingles(body: str, shingle_size: int = 3) -> typing.Set[str]:
+    # handles, hashtags and urls are the parts that typically change between copies
+    text = _HANDLE.sub(" ", _URL.sub(" ", body.lower()))
+    tokens = _TOKEN.findall(text)
+    if len(tokens) < shingle_size:
+        return set(tokens)
+    return set(
+        " ".join(tokens[i : i + shingle_size])
+        for i in range(len(tokens) - shingle_size + 1)
+    )
+
+
+class MinHasher:
+    """Computes MinHash signatures; picklable so signing can run in worker processes."""
+
+    def __init__(self, num_permutations: int = 64, seed: int = 1):
+        # the permutations must be identical between runs for a persisted index to stay valid
+        rng = np.random.RandomState(seed)
+        self.a = rng.randint(1, _MERSENNE_PRIME, size=num_permutations).astype(np.uint64)
+        self.b = rng.randint(0, _MERSENNE_PRIME, size=num_permutations).astype(np.uint64)
+
+    def signature(self, body: str) -> typing.Optional[np.ndarray]:
+        s = shingles(body)
+        if len(s) == 0:
+            return None
+        hashes = np.fromiter(
+            (zlib.crc32(sh.encode("utf-8")) for sh in s), dtype=np.uint64, count=len(s)
+        )
+        # (a * x + b) mod p for every permutation/shingle pair, then the column minimum
+        permuted = (np.outer(self.a, hashes) + self.b[:, None]) % _MERSENNE_PRIME
+        return permuted.min(axis=1).astype(np.uint32)
+
+
+class MinHashLshIndex:
+    """Incremental MinHash/LSH index assigning near-duplicate content to clusters.
+
+    The index is persisted in the given SQLite database so it can be extended as
+    new files are ingested. Each cluster is identified by the content_hash of its
+    first member (the representative) and only the representative's signature is
+    indexed, new content joins the best matching cluster whose estimated Jaccard
+    similarity is at least the threshold.
+    """
+
+    def __init__(
+        self,
+        db_file_path="data.db",
+        num_permutations: int = 64,
+        bands: int = 16,
+        threshold: float = 0.7,
+        seed: int = 1,
+    ):
+        if num_permutations % bands != 0:
+            raise ValueError("num_permutations must be divisible by bands")
+        self.db_file_path = db_file_path
+        self.connections = SqliteConnectionManager(db_file_path)
+        self.num_permutations = num_permutations
+        self.bands = bands
+        self.rows = num_permutations // bands
+        self.threshold = threshold
+        self.hasher = MinHasher(num_permutations, seed)
+
+        with self.connections.connection() as c:
+            c.execute(
+                """CREATE TABLE IF NOT EXISTS minhash_clusters (
+                cluster_id TEXT NOT NULL,
+                signature BLOB NOT NULL,
+                PRIMARY KEY (cluster_id));
+            """
+            )
+            c.execute(
+                """CREATE TABLE IF NOT EXISTS minhash_buckets (
+                band INTEGER NOT NULL,
+                bucket TEXT NOT NULL,
+                cluster_id TEXT NOT NULL,
+                PRIMARY KEY (band, bucket, cluster_id));
+            """
+            )
+            c.commit()
+
+    def signature(self, body: str) -> typing.Optional[np.ndarray]:
+        return self.hasher.signature(body)
+
+    def _band_keys(self, signature: np.ndarray) -> typing.List[str]:
+        return [
+            hashlib.blake2b(signature[i * self.rows : (i + 1) * self.rows].tobytes(), digest_size=8).hexdigest()
+            for i in range(self.bands)
+        ]
+
+    def assign_clusters(self, lst_content: typing.List[Content]):
+        """Sets cluster_id on each content in place, persisting new clusters."""
+        cluster_ids = self.assign_signed(
+            [(content.content_hash, self.signature(content.body)) for content in lst_content]
+        )
+        for content, cluster_id in zip(lst_content, cluster_ids):
+            content.cluster_id = cluster_id
+
+    def assign_signed(
+        self, signed: typing.List[typing.Tuple[str, typing.Optional[np.ndarray]]]
+    ) -> typing.List[str]:
+        """Returns the cluster id of each (content_hash, signature) pair, where the
+        signatures come from this index's hasher, persisting new clusters.
+        """
+        with self.connections.connection() as c:
+            cur = c.cursor()
+            cluster_ids = [
+                self._assign(cur, content_hash, signature)
+                for content_hash, signature in signed
+            ]
+            c.commit()
+        return cluster_ids
+
+    def _assign(self, cur, content_hash: str, signature: typing.Optional[np.ndarray]) -> str:
+        if signature is None:
+            return content_hash
+        band_keys = self._band_keys(signature)
+
+        candidates = set()
+        for band, key in enumerate(band_keys):
+            for (cluster_id,) in cur.execute(
+                "SELECT cluster_id FROM minhash_buckets WHERE band = ? AND bucket = ?",
+                (band, key),
+            ):
+                candidates.add(cluster_id)
+
+        best_cluster, best_similarity = None, self.threshold
+        for cluster_id in candidates:
+            row = cur.execute(
+                "SELECT signature FROM minhash_clusters WHERE cluster_id = ?",
+                (cluster_id,),
+            ).fetchone()
+            similarity = float(np.mean(np.frombuffer(row[0], dtype=np.uint32) == signature))
+            if similarity >= best_similarity:
+                best_cluster, best_similarity = cluster_id, similarity
+        if best_cluster is not None:
+            return best_cluster
+
+        cur.execute(
+            "INSERT OR IGNORE INTO minhash_clusters VALUES (?,?);",
+            (content_hash, signature.tobytes()),
+        )
+        cur.executemany(
+            "INSERT OR IGNORE INTO minhash_buckets VALUES (?,?,?);",
+            [(band, key, content_hash) for band, key in enumerate(band_keys)],
+        )
+        return content_hash
@@ -0,0 +1,177 @@
+import asyncio
+import collections
+import concurrent.futures
+import inspect
+import time
+import typing
+
+
+_DONE = object()
+
+
+class PipelineStage(typing.NamedTuple):
+    """One step of a StagePipeline.
+
+    func receives an item and returns the item for the next stage, a coroutine
+    function is awaited and, with an executor, a plain function runs on it (for
+    CPU bound steps). With many=True func returns a list of items instead.
+    Items for which func returns None are dropped.
+    """
+
+    name: str
+    func: typing.Callable
+    concurrency: int = 1
+    executor: typing.Optional[concurrent.futures.Executor] = None
+    many: bool = False
+
+
+class GroupCommitWriter:
+    """Final stage of a StagePipeline, passes the items to flush in groups of at
+    most max_items, and at the latest max_seconds after the first item of a
+    group arrived. flush runs on a single thread of its own, so a slow commit
+    holds back the pipeline only once the queue in front of it is full. A
+    failing flush fails only its group, which is passed as one item to
+    on_error("write", items, exception).
+    """
+
+    def __init__(self, flush: typing.Callable[[typing.List], typing.Any], max_items: int = 500, max_seconds: float = 5.0):
+        self.flush = flush
+        self.max_items = max_items
+        self.max_seconds = max_seconds
+        self.flushes = 0
+        self.items = 0
+        self.failed = 0
+
+    async def _flush(self, executor: concurrent.futures.Executor, items: typing.List, on_error):
+        try:
+            await asyncio.get_running_loop().run_in_executor(executor, self.flush, items)
+        except Exception as e:
+            self.failed += len(items)
+            if on_error is not None:
+                on_error("write", items, e)
+            return
+        self.flushes += 1
+        self.items += len(items)
+
+    async def run(self, queue: asyncio.Queue, on_error: typing.Optional[typing.Callable[[str, typing.Any, Exception], None]] = None):
+        loop = asyncio.get_running_loop()
+        executor = concurrent.futures.ThreadPoolExecutor(max_workers=1, thread_name_prefix="group-commit")
+        items = []
+        deadline = None
+        try:
+            while True:
+                timeout = None if deadline is None else max(0.0, deadline - loop.time())
+                try:
+                    item = await asyncio.wait_for(queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    item = None
+                if item is not None and item is not _DONE:
+                    items.append(item)
+                    if deadline is None:
+                        deadline = loop.time() + self.max_seconds
+                if len(items) > 0 and (item is None or item is _DONE or len(items) >= self.max_items):
+                    await self._flush(executor, items, on_error)
+                    items = []
+                    deadline = None
+                if item is _DONE:
+                    return
+        finally:
+            # a flush still running when cancelled finishes on its thread
+            executor.shutdown(wait=False)
+
+
+class StagePipeline:
+    """Streams items through stages connected by bounded queues into a writer.
+
+    Every stage runs as many workers as its concurrency, so all stages overlap,
+    and a full queue blocks the stage feeding it, which bounds the items in
+    flight to about the queue sizes plus the concurrency of each stage,
+    whatever the number of items. An exception fails only its item, which is
+    passed to on_error(stage name, item, exception), or its group of items for
+    the writer.
+    """
+
+    def __init__(
+        self,
+        stages: typing.List[PipelineStage],
+        writer: GroupCommitWriter,
+        queue_size: int = 100,
+        on_error: typing.Optional[typing.Callable[[str, typing.Any, Exception], None]] = None,
+    ):
+        self.stages = stages
+        self.writer = writer
+        self.queue_size = queue_size
+        self.on_error = on_error
+        self.processed = collections.Counter()
+        self.failed = collections.Counter()
+        self.busy_seconds = collections.Counter()
+
+    async def _call(self, stage: PipelineStage, item):
+        if stage.executor is not None:
+            return await asyncio.get_running_loop().run_in_executor(stage.executor, stage.func, item)
+        result = stage.func(item)
+        if inspect.isawaitable(result):
+            result = await result
+        return result
+
+    async def _worker(self, stage: PipelineStage, inbox: asyncio.Queue, outbox: asyncio.Queue):
+        while True:
+            item = await inbox.get()
+            if item is _DONE:
+                return
+            start = time.perf_counter()
+            try:
+                result = await self._call(stage, item)
+            except Exception as e:
+                self.failed[stage.name] += 1
+                if self.on_error is not None:
+                    self.on_error(stage.name, item, e)
+                continue
+            finally:
+                self.busy_seconds[stage.name] += time.perf_counter() - start
+            self.processed[stage.name] += 1
+            for output in (result if stage.many else [result]):
+                if output is not None:
+                    await outbox.put(output)
+
+    async def _stage(self, stage: PipelineStage, inbox: asyncio.Queue, outbox: asyncio.Queue, downstream_workers: int):
+        await asyncio.gather(*(self._worker(stage, inbox, outbox) for _ in range(stage.concurrency)))
+        for _ in range(downstream_workers):
+            await outbox.put(_DONE)
+
+    async def _feed(self, source, outbox: asyncio.Queue, downstream_workers: int):
+        if hasattr(source, "__aiter__"):
+            async for item in source:
+                await outbox.put(item)
+        else:
+            for item in source:
+                await outbox.put(item)
+        for _ in range(downstream_workers):
+            await outbox.put(_DONE)
+
+    async def run(self, source: typing.Union[typing.Iterable, typing.AsyncIterable]):
+        """Consumes source, which may be an async generator that fetches more
+        work only as the first queue has room, until every item is written.
+        """
+        queues = [asyncio.Queue(self.queue_size) for _ in range(len(self.stages) + 1)]
+        workers = [stage.concurrency for stage in self.stages] + [1]
+        tasks = [asyncio.create_task(self._feed(source, queues[0], workers[0]))]
+        for i, stage in enumerate(self.stages):
+            tasks.append(asyncio.create_task(self._stage(stage, queues[i], queues[i + 1], workers[i + 1])))
+        tasks.append(asyncio.create_task(self.writer.run(queues[-1], self.on_error)))
+        try:
+            await asyncio.gather(*tasks)
+        except BaseException:
+            for task in tasks:
+                task.cancel()
+            raise
+
+    def stats(self) -> dict:
+        return {
+            stage.name: {
+                "processed": self.processed[stage.name],
+                "failed": self.failed[stage.name],
+                "busy_seconds": round(self.busy_seconds[stage.name], 3),
+            }
+            for stage in self.stages
+        } | {"writer": {"flushes": self.writer.flushes, "items": self.writer.items, "failed": self.writer.failed}}
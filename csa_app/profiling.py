@@ -0,0 +1,186 @@
+import collections
+import contextlib
+import datetime
+import functools
+import os
+import re
+import sys
+import threading
+import time
+import tracemalloc
+import typing
+
+
+PROFILE_DIRECTORY_ENV = "CSA_PROFILE_DIR"
+
+
+def _frame_name(frame) -> str:
+    code = frame.f_code
+    return f"{os.path.basename(code.co_filename)}:{code.co_name}:{code.co_firstlineno}"
+
+
+class SamplingProfiler:
+    """Samples the call stack of one thread from a background thread.
+
+    Unlike cProfile the profiled code runs untouched, so the cost is paid by the
+    sampling thread and is bounded by the interval.
+    """
+
+    def __init__(self, thread_id: int, interval: float = 0.005, max_depth: int = 64):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.max_depth = max_depth
+        self.stacks = collections.Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _sample(self):
+        own_id = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None or self.thread_id == own_id:
+                continue
+            stack = []
+            while frame is not None and len(stack) < self.max_depth:
+                stack.append(_frame_name(frame))
+                frame = frame.f_back
+            self.stacks[tuple(reversed(stack))] += 1
+            self.samples += 1
+
+    def start(self):
+        self._thread = threading.Thread(target=self._sample, name="csa-sampling-profiler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def collapsed(self) -> str:
+        """Stacks in the collapsed format read by flamegraph.pl and speedscope."""
+        return "".join(f"{';'.join(stack)} {count}\n" for stack, count in self.stacks.most_common())
+
+    def top_functions(self, limit: int = 30) -> typing.List[typing.Tuple[str, int, int]]:
+        """(function, self samples, cumulative samples) by cumulative samples."""
+        own = collections.Counter()
+        cumulative = collections.Counter()
+        for stack, count in self.stacks.items():
+            own[stack[-1]] += count
+            for name in set(stack):
+                cumulative[name] += count
+        return [(name, own[name], count) for name, count in cumulative.most_common(limit)]
+
+
+class Profiler:
+    """Wraps batches and callbacks in a sampling CPU profile and a tracemalloc
+    snapshot diff, writing one report per run to directory. Disabled when
+    directory is None, then profile() and wrap() cost next to nothing.
+
+    Allocations are traced process wide, so the reports of runs overlapping in
+    time, such as concurrent dashboard callbacks, include each other's, and
+    tracing slows allocation heavy code down several times while enabled.
+    """
+
+    def __init__(
+        self,
+        directory: typing.Optional[str] = None,
+        interval: float = 0.005,
+        top_allocations: int = 25,
+        top_functions: int = 30,
+        traceback_frames: int = 10,
+    ):
+        self.directory = directory
+        self.interval = interval
+        self.top_allocations = top_allocations
+        self.top_functions = top_functions
+        self.traceback_frames = traceback_frames
+        self._lock = threading.Lock()
+        self._active = 0
+        self._started_tracing = False
+        if self.enabled:
+            os.makedirs(directory, exist_ok=True)
+
+    @property
+    def enabled(self) -> bool:
+        return self.directory is not None
+
+    def _start_tracing(self):
+        with self._lock:
+            if self._active == 0 and not tracemalloc.is_tracing():
+                tracemalloc.start(self.traceback_frames)
+                self._started_tracing = True
+            self._active += 1
+
+    def _stop_tracing(self):
+        with self._lock:
+            self._active -= 1
+            if self._active == 0 and self._started_tracing:
+                tracemalloc.stop()
+                self._started_tracing = False
+
+    @contextlib.contextmanager
+    def _profile(self, name: str):
+        self._start_tracing()
+        before = tracemalloc.take_snapshot()
+        sampler = SamplingProfiler(threading.get_ident(), self.interval)
+        sampler.start()
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            sampler.stop()
+            after = tracemalloc.take_snapshot()
+            current, peak = tracemalloc.get_traced_memory()
+            self._stop_tracing()
+            self._write(name, elapsed, sampler, after.compare_to(before, "traceback"), peak)
+
+    def profile(self, name: str):
+        """Context manager profiling its block under name."""
+        if not self.enabled:
+            return contextlib.nullcontext()
+        return self._profile(name)
+
+    def wrap(self, name: typing.Optional[str] = None):
+        """Decorator profiling every call, returns the function itself when disabled."""
+
+        def decorator(func):
+            if not self.enabled:
+                return func
+
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                with self._profile(name or func.__name__):
+                    return func(*args, **kwargs)
+
+            return wrapper
+
+        return decorator
+
+    def _write(self, name: str, elapsed: float, sampler: SamplingProfiler, allocations, peak: int):
+        timestamp = datetime.datetime.now().strftime("%Y%m%d-%H%M%S-%f")
+        base = os.path.join(self.directory, f"{re.sub(r'[^A-Za-z0-9_.-]', '_', name)}-{timestamp}")
+
+        lines = [
+            f"{name}: {elapsed:.3f}s, {sampler.samples} samples every {self.interval * 1000:.1f}ms, "
+            f"traced memory peak {peak / 1e6:.1f}MB",
+            "",
+            f"{'self':>8}{'total':>8}  function",
+        ]
+        for function, own, cumulative in sampler.top_functions(self.top_functions):
+            lines.append(f"{own / max(sampler.samples, 1):>8.1%}{cumulative / max(sampler.samples, 1):>8.1%}  {function}")
+
+        lines += ["", f"Top {self.top_allocations} allocations (size change, count change):"]
+        for stat in allocations[: self.top_allocations]:
+            lines.append(f"{stat.size_diff / 1e3:>+12.1f}kB {stat.count_diff:>+8}")
+            lines += [f"    {line}" for line in stat.traceback.format(limit=self.traceback_frames, most_recent_first=True)]
+
+        with open(base + ".txt", "w", encoding="utf-8") as f:
+            f.write("\n".join(lines) + "\n")
+        with open(base + ".collapsed", "w", encoding="utf-8") as f:
+            f.write(sampler.collapsed())
+
+
+def profiler_from_env(**kwargs) -> Profiler:
+    """Profiler writing to $CSA_PROFILE_DIR, disabled when it is not set."""
+    return Profiler(os.getenv(PROFILE_DIRECTORY_ENV) or None, **kwargs)
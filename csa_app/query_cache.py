@@ -0,0 +1,83 @@
+import json
+import pickle
+import time
+import typing
+
+from .sqlite_connections import SqliteConnectionManager
+
+
+class QueryResultCache:
+    """On-disk LRU cache of query results shared by every process that opens the
+    same file, such as several dashboard server workers. Entries are tagged with
+    the database's summary generation and are stale once add_summaries bumps it.
+    """
+
+    def __init__(self, db_file_path="query_cache.db", max_entries: int = 1000):
+        self.db_file_path = db_file_path
+        self.connections = SqliteConnectionManager(db_file_path)
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+
+        with self.connections.connection() as c:
+            c.execute(
+                """CREATE TABLE IF NOT EXISTS query_results (
+                cache_key TEXT NOT NULL,
+                generation INTEGER NOT NULL,
+                result BLOB NOT NULL,
+                last_accessed REAL NOT NULL,
+                PRIMARY KEY (cache_key));
+            """
+            )
+            c.execute(
+                "CREATE INDEX IF NOT EXISTS query_results_last_accessed ON query_results (last_accessed);"
+            )
+            c.commit()
+
+    def get_or_compute(self, key: typing.Tuple, generation: int, compute: typing.Callable[[], typing.Any]):
+        """Returns the cached result for key at this generation, or stores and
+        returns compute() on a miss.
+        """
+        cache_key = json.dumps(key, default=str)
+        with self.connections.connection() as c:
+            row = c.execute(
+                "SELECT generation, result FROM query_results WHERE cache_key = ?",
+                (cache_key,),
+            ).fetchone()
+            if row is not None and row[0] == generation:
+                c.execute(
+                    "UPDATE query_results SET last_accessed = ? WHERE cache_key = ?",
+                    (time.time(), cache_key),
+                )
+                c.commit()
+                self.hits += 1
+                return pickle.loads(row[1])
+
+        self.misses += 1
+        result = compute()
+        with self.connections.connection() as c:
+            cur = c.cursor()
+            cur.execute("BEGIN IMMEDIATE")
+            # a worker still at an older generation neither stores its result
+            # nor evicts the entries of workers that have seen newer summaries
+            newest = cur.execute("SELECT MAX(generation) FROM query_results").fetchone()[0]
+            if newest is None or newest <= generation:
+                cur.execute(
+                    "INSERT OR REPLACE INTO query_results VALUES (?,?,?,?);",
+                    (cache_key, generation, pickle.dumps(result), time.time()),
+                )
+                cur.execute(
+                    """DELETE FROM query_results WHERE generation < ? OR cache_key IN (
+                    SELECT cache_key FROM query_results ORDER BY last_accessed DESC LIMIT -1 OFFSET ?)""",
+                    (generation, self.max_entries),
+                )
+            c.commit()
+        return result
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups > 0 else 0.0,
+        }
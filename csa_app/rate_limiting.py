@@ -0,0 +1,147 @@
+import asyncio
+import random
+import time
+import typing
+
+import openai
+
+
+RETRYABLE_STATUS_CODES = (408, 409, 429, 500, 502, 503, 504)
+
+
+def estimate_tokens(messages: typing.List[dict]) -> int:
+    # rough heuristic of ~4 characters per token, good enough for budgeting
+    return sum(len(str(m.get("content") or "")) for m in messages) // 4 + 4 * len(messages)
+
+
+class _TokenBucket:
+
+    def __init__(self, per_minute: float):
+        self.capacity = float(per_minute)
+        self.level = float(per_minute)
+        self.refill_rate = float(per_minute) / 60.0
+        self.updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.refill_rate)
+        self.updated = now
+
+    def wait_time(self, amount: float) -> float:
+        self._refill()
+        # never ask for more than the bucket can ever hold
+        amount = min(amount, self.capacity)
+        if self.level >= amount:
+            return 0.0
+        return (amount - self.level) / self.refill_rate
+
+    def take(self, amount: float):
+        self._refill()
+        self.level -= min(amount, self.capacity)
+
+    def give_back(self, amount: float):
+        self._refill()
+        self.level = min(self.capacity, self.level + amount)
+
+
+class AsyncRateLimiter:
+    """Bounds concurrency and enforces requests-per-minute and tokens-per-minute
+    budgets for coroutines sharing one API account.
+    """
+
+    def __init__(
+        self,
+        max_concurrency: int = 8,
+        requests_per_minute: typing.Optional[float] = None,
+        tokens_per_minute: typing.Optional[float] = None,
+    ):
+        self.semaphore = asyncio.Semaphore(max_concurrency)
+        self.requests = _TokenBucket(requests_per_minute) if requests_per_minute else None
+        self.tokens = _TokenBucket(tokens_per_minute) if tokens_per_minute else None
+        self.lock = asyncio.Lock()
+
+    async def acquire(self, estimated_tokens: int = 0):
+        await self.semaphore.acquire()
+        try:
+            async with self.lock:
+                while True:
+                    delay = 0.0
+                    if self.requests is not None:
+                        delay = max(delay, self.requests.wait_time(1))
+                    if self.tokens is not None:
+                        delay = max(delay, self.tokens.wait_time(estimated_tokens))
+                    if delay <= 0:
+                        break
+                    await asyncio.sleep(delay)
+                if self.requests is not None:
+                    self.requests.take(1)
+                if self.tokens is not None:
+                    self.tokens.take(estimated_tokens)
+        except BaseException:
+            self.semaphore.release()
+            raise
+
+    def release(self, estimated_tokens: int = 0, used_tokens: typing.Optional[int] = None):
+        # reconcile the estimate with the usage the API actually reported
+        if self.tokens is not None and used_tokens is not None:
+            if used_tokens < estimated_tokens:
+                self.tokens.give_back(estimated_tokens - used_tokens)
+            else:
+                self.tokens.take(used_tokens - estimated_tokens)
+        self.semaphore.release()
+
+
+def is_retryable(error: Exception) -> bool:
+    if isinstance(error, (openai.APIConnectionError, openai.APITimeoutError)):
+        return True
+    if isinstance(error, openai.APIStatusError):
+        return error.status_code in RETRYABLE_STATUS_CODES
+    return False
+
+
+async def call_with_retry(
+    request_func: typing.Callable[[], typing.Awaitable],
+    limiter: typing.Optional[AsyncRateLimiter] = None,
+    estimated_tokens: int = 0,
+    max_retries: int = 5,
+    base_delay: float = 1.0,
+    max_delay: float = 60.0,
+):
+    """Awaits request_func() under the limiter, retrying 429/5xx responses with
+    full-jitter exponential backoff. Returns (result, number_of_retries).
+    """
+    attempt = 0
+    while True:
+        if limiter is not None:
+            await limiter.acquire(estimated_tokens)
+        used_tokens = None
+        try:
+            result = await request_func()
+            usage = getattr(result, "usage", None)
+            if usage is not None:
+                used_tokens = usage.total_tokens
+            return result, attempt
+        except Exception as e:
+            if attempt >= max_retries or not is_retryable(e):
+                raise
+            sleep_for = random.uniform(0, min(max_delay, base_delay * (2**attempt)))
+            retry_after = _retry_after(e)
+            if retry_after is not None:
+                sleep_for = max(sleep_for, retry_after + random.uniform(0, base_delay))
+            attempt += 1
+            print(f"Retrying request ({attempt}/{max_retries}) after error: {e}")
+        finally:
+            if limiter is not None:
+                limiter.release(estimated_tokens, used_tokens)
+        await asyncio.sleep(sleep_for)
+
+
+def _retry_after(error: Exception) -> typing.Optional[float]:
+    response = getattr(error, "response", None)
+    if response is None:
+        return None
+    value = response.headers.get("retry-after")
+    try:
+        return float(value) if value is not None else None
+    except ValueError:
+        return None
@@ -0,0 +1,155 @@
+import json
+import re
+import threading
+import time
+import typing
+
+from .model import convert_to_id
+from .sqlite_connections import SqliteConnectionManager
+
+
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_messages(messages: typing.List[dict]) -> typing.List[typing.Tuple[str, str]]:
+    return [
+        (m["role"], _WHITESPACE.sub(" ", str(m["content"])).strip())
+        for m in messages
+    ]
+
+
+def create_cache_key(model: str, prompt_strategy: str, messages: typing.List[dict]) -> str:
+    return convert_to_id(
+        json.dumps([model, prompt_strategy, normalize_messages(messages)])
+    )
+
+
+class ResponseCacheSqlLite:
+    """Persistent cache of LLM responses keyed on the model, prompt strategy and
+    the normalized message payload, so identical bodies are only paid for once.
+    Entries older than max_age_seconds are dropped and the least recently used
+    entries are evicted beyond max_entries.
+
+    Hits only note their access time in memory, written back in one transaction
+    per access_flush_size hits (and before every eviction), so lookups
+    stay reads. Safe to call from several threads, async callers should do so
+    through asyncio.to_thread.
+    """
+
+    def __init__(
+        self,
+        db_file_path="llm_cache.db",
+        max_entries: typing.Optional[int] = 1000000,
+        max_age_seconds: typing.Optional[float] = 90 * 24 * 3600,
+        eviction_interval: int = 1000,
+        access_flush_size: int = 1000,
+    ):
+        self.db_file_path = db_file_path
+        self.connections = SqliteConnectionManager(db_file_path)
+        self.max_entries = max_entries
+        self.max_age_seconds = max_age_seconds
+        self.eviction_interval = eviction_interval
+        self.access_flush_size = access_flush_size
+        self.hits = 0
+        self.misses = 0
+        self._puts_since_eviction = 0
+        # cache_key -> last access time not yet written
+        self._accessed = {}
+        self._lock = threading.Lock()
+
+        with self.connections.connection() as c:
+            c.execute(
+                """CREATE TABLE IF NOT EXISTS llm_responses (
+                cache_key TEXT NOT NULL,
+                model_id TEXT NOT NULL,
+                prompt_strategy TEXT NOT NULL,
+                response TEXT NOT NULL,
+                created REAL NOT NULL,
+                last_accessed REAL NOT NULL,
+                PRIMARY KEY (cache_key));
+            """
+            )
+            c.execute(
+                "CREATE INDEX IF NOT EXISTS llm_responses_last_accessed ON llm_responses (last_accessed);"
+            )
+            c.commit()
+
+    def get(self, model: str, prompt_strategy: str, messages: typing.List[dict]) -> typing.Optional[dict]:
+        key = create_cache_key(model, prompt_strategy, messages)
+        now = time.time()
+        with self.connections.connection() as c:
+            row = c.execute(
+                "SELECT response, created FROM llm_responses WHERE cache_key = ?",
+                (key,),
+            ).fetchone()
+            if row is None or (
+                self.max_age_seconds is not None and now - row[1] > self.max_age_seconds
+            ):
+                with self._lock:
+                    self.misses += 1
+                return None
+        with self._lock:
+            self.hits += 1
+            self._accessed[key] = now
+            flush = len(self._accessed) >= self.access_flush_size
+        if flush:
+            self.flush_accessed()
+        return json.loads(row[0])
+
+    def flush_accessed(self):
+        """Writes the access times noted by get since the last flush."""
+        with self._lock:
+            accessed, self._accessed = self._accessed, {}
+        if len(accessed) == 0:
+            return
+        with self.connections.connection() as c:
+            c.executemany(
+                "UPDATE llm_responses SET last_accessed = MAX(last_accessed, ?) WHERE cache_key = ?",
+                [(t, key) for key, t in accessed.items()],
+            )
+            c.commit()
+
+    def put(self, model: str, prompt_strategy: str, messages: typing.List[dict], response: dict):
+        key = create_cache_key(model, prompt_strategy, messages)
+        now = time.time()
+        with self.connections.connection() as c:
+            c.execute(
+                "INSERT OR REPLACE INTO llm_responses VALUES (?,?,?,?,?,?);",
+                (key, model, prompt_strategy, json.dumps(response), now, now),
+            )
+            c.commit()
+
+        with self._lock:
+            self._puts_since_eviction += 1
+            evict = self._puts_since_eviction >= self.eviction_interval
+            if evict:
+                self._puts_since_eviction = 0
+        if evict:
+            self.evict()
+
+    def evict(self):
+        with self._lock:
+            self._puts_since_eviction = 0
+        # so entries hit since the last flush are not evicted as unused
+        self.flush_accessed()
+        with self.connections.connection() as c:
+            if self.max_age_seconds is not None:
+                c.execute(
+                    "DELETE FROM llm_responses WHERE created < ?",
+                    (time.time() - self.max_age_seconds,),
+                )
+            if self.max_entries is not None:
+                c.execute(
+                    """DELETE FROM llm_responses WHERE cache_key IN (
+                    SELECT cache_key FROM llm_responses ORDER BY last_accessed DESC LIMIT -1 OFFSET ?)""",
+                    (self.max_entries,),
+                )
+            c.commit()
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups > 0 else 0.0,
+        }
@@ -0,0 +1,161 @@
+import random
+import re
+import typing
+
+import numpy as np
+import scipy.sparse
+
+from . import wse_models
+
+
+_TOKEN = re.compile(r"[a-z]+")
+
+STOPWORDS = frozenset(
+    """a about above after again against all am an and any are as at be because been before being below
+    between both but by can could did do does doing down during each few for from further had has have
+    having he her here hers herself him himself his how i if in into is it its itself just me more most my
+    myself no nor not of off on once only or other our ours ourselves out over own same she should so some
+    such than that the their theirs them themselves then there these they this those through to too under
+    until up very was we were what when where which while who whom why will with would you your yours
+    yourself yourselves something someone especially usually used""".split()
+)
+
+
+def tokenize(text: str) -> typing.List[str]:
+    tokens = []
+    for token in _TOKEN.findall(text.lower()):
+        if token in STOPWORDS or len(token) < 3:
+            continue
+        # crude plural folding so "events" overlaps with "event"
+        if len(token) > 4 and token.endswith("s") and not token.endswith("ss"):
+            token = token[:-1]
+        tokens.append(token)
+    return tokens
+
+
+class SenseRanking(typing.NamedTuple):
+    # options ordered by descending lexical score
+    options: typing.Tuple[wse_models.SynsetOption, ...]
+    scores: np.ndarray
+    # the best option dominates and no LLM call is needed
+    skip: bool
+    # the ranker would have skipped but the LLM is asked to measure agreement
+    audit: bool
+
+    @property
+    def best(self) -> wse_models.SynsetOption:
+        return self.options[0]
+
+
+class LexicalSenseRanker:
+    """Ranks synset candidates by the TF-IDF weighted overlap between the content
+    and each gloss (a vectorized extended-Lesk), so only the top_k candidates are
+    put in the WSD prompt and the LLM is skipped when the best candidate beats the
+    runner up by at least margin.
+
+    IDF weights come from the candidate glosses themselves, terms shared by every
+    sense of a lemma carry little evidence for any of them. A fraction audit_rate
+    of skippable evaluations still goes to the LLM to estimate how often skipping
+    agrees with it.
+    """
+
+    def __init__(
+        self,
+        top_k: int = 5,
+        margin: float = 0.15,
+        min_score: float = 0.1,
+        audit_rate: float = 0.05,
+        seed: typing.Optional[int] = None,
+    ):
+        self.top_k = top_k
+        self.margin = margin
+        self.min_score = min_score
+        self.audit_rate = audit_rate
+        self.random = random.Random(seed)
+
+        self.evaluations = 0
+        self.skipped = 0
+        self.pruned_options = 0
+        self.llm_choices = 0
+        self.llm_agreements = 0
+        self.audits = 0
+        self.audit_agreements = 0
+
+    def scores(self, context: str, glosses: typing.Sequence[str]) -> np.ndarray:
+        """Cosine similarity between the TF-IDF vectors of the context and each gloss."""
+        vocabulary = {}
+        rows, cols = [], []
+        for row, gloss in enumerate(glosses):
+            for token in tokenize(gloss):
+                rows.append(row)
+                cols.append(vocabulary.setdefault(token, len(vocabulary)))
+        if len(vocabulary) == 0:
+            return np.zeros(len(glosses))
+
+        # duplicate (row, col) pairs are summed into term counts
+        counts = scipy.sparse.csr_matrix(
+            (np.ones(len(rows)), (rows, cols)), shape=(len(glosses), len(vocabulary))
+        )
+        document_frequency = np.diff(counts.tocsc().indptr)
+        idf = np.log((1 + len(glosses)) / (1 + document_frequency)) + 1
+        gloss_vectors = counts.multiply(idf).tocsr()
+
+        context_counts = np.zeros(len(vocabulary))
+        for token in tokenize(context):
+            col = vocabulary.get(token)
+            if col is not None:
+                context_counts[col] += 1
+        context_vector = context_counts * idf
+
+        gloss_norms = np.sqrt(np.asarray(gloss_vectors.multiply(gloss_vectors).sum(axis=1)).ravel())
+        context_norm = np.linalg.norm(context_vector)
+        if context_norm == 0:
+            return np.zeros(len(glosses))
+        dots = gloss_vectors @ context_vector
+        return dots / (np.maximum(gloss_norms, 1e-12) * context_norm)
+
+    def rank(self, context: str, synset_options: typing.Sequence[wse_models.SynsetOption]) -> SenseRanking:
+        scores = self.scores(context, [o.gloss for o in synset_options])
+        # stable so WordNet's sense order (most frequent first) breaks ties
+        order = np.argsort(-scores, kind="stable")
+        ranked_scores = scores[order]
+        ranked = tuple(synset_options[i] for i in order)
+
+        runner_up = ranked_scores[1] if len(ranked_scores) > 1 else 0.0
+        dominant = bool(ranked_scores[0] >= self.min_score and ranked_scores[0] - runner_up >= self.margin)
+        audit = dominant and self.random.random() < self.audit_rate
+
+        self.evaluations += 1
+        if dominant and not audit:
+            self.skipped += 1
+        else:
+            self.audits += audit
+            self.pruned_options += max(0, len(ranked) - self.top_k)
+        return SenseRanking(ranked, ranked_scores, dominant and not audit, audit)
+
+    def prompt_options(self, ranking: SenseRanking, synset_options) -> typing.List[wse_models.SynsetOption]:
+        """The top_k candidates in their original order, so the prompt keeps
+        WordNet's sense order.
+        """
+        kept = set(o.id for o in ranking.options[: self.top_k])
+        return [o for o in synset_options if o.id in kept]
+
+    def record_llm_choice(self, ranking: SenseRanking, synset_id: str):
+        agrees = ranking.best.id == synset_id
+        self.llm_choices += 1
+        self.llm_agreements += agrees
+        if ranking.audit:
+            self.audit_agreements += agrees
+
+    def stats(self) -> dict:
+        return {
+            "evaluations": self.evaluations,
+            "skipped": self.skipped,
+            "skip_rate": self.skipped / self.evaluations if self.evaluations > 0 else 0.0,
+            "pruned_options": self.pruned_options,
+            # how often the LLM picks the lexical favourite, over all prompted evaluations
+            "agreement": self.llm_agreements / self.llm_choices if self.llm_choices > 0 else 0.0,
+            # same over audited skips, i.e. the estimated precision of skipping
+            "audits": self.audits,
+            "skip_agreement": self.audit_agreements / self.audits if self.audits > 0 else 0.0,
+        }
@@ -0,0 +1,263 @@
+import datetime
+import itertools
+import json
+import os
+import shutil
+import typing
+
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+
+WATERMARK_FILE = "_watermark.json"
+# bumped whenever SNAPSHOT_SCHEMA changes, snapshots of another format are rebuilt
+WATERMARK_FORMAT = 3
+# lists the files a partition rewrite deletes and renames, until it completed
+REWRITE_JOURNAL_FILE = "_rewrite.json"
+
+SNAPSHOT_SCHEMA = pa.schema(
+    [
+        ("content_hash", pa.string()),
+        ("model_id", pa.string()),
+        ("prompt_strategy", pa.string()),
+        ("sentiment", pa.int8()),
+        ("discussion_duration", pa.float64()),
+        ("location", pa.string()),
+        ("content_datetime", pa.string()),
+        ("contributors", pa.string()),
+        ("contributors_values", pa.string()),
+        ("method", pa.string()),
+        ("method_lemma_id", pa.string()),
+        ("method_values", pa.string()),
+        ("topic", pa.string()),
+        ("topic_lemma_id", pa.string()),
+        ("topic_values", pa.string()),
+        ("topic_synset_id", pa.string()),
+        ("method_synset_id", pa.string()),
+        ("wsd_version", pa.int32()),
+        ("expansion_version", pa.int32()),
+        ("contributor_version", pa.string()),
+        ("body", pa.string()),
+        ("author", pa.string()),
+        ("forum", pa.string()),
+        ("region", pa.string()),
+        ("written_date_time", pa.string()),
+        ("date", pa.string()),
+        ("month", pa.string()),
+    ]
+)
+
+
+def _day(value) -> str:
+    if isinstance(value, (datetime.date, datetime.datetime)):
+        return value.strftime("%Y-%m-%d")
+    return str(value)[:10]
+
+
+def _table(rows: typing.List[typing.Tuple]) -> pa.Table:
+    columns = list(zip(*rows))
+    dates = [w.strip()[:10] for w in columns[-1]]
+    table = pa.Table.from_arrays(
+        [pa.array(col, type=field.type) for col, field in zip(columns, SNAPSHOT_SCHEMA)]
+        + [pa.array(dates, type=pa.string()), pa.array([d[:7] for d in dates], type=pa.string())],
+        schema=SNAPSHOT_SCHEMA,
+    )
+    # sorted row groups give tight min/max statistics for date pruning
+    return table.sort_by([("date", "ascending")])
+
+
+def _keys(table: pa.Table) -> pa.Array:
+    return pc.binary_join_element_wise(table["content_hash"], table["model_id"], table["prompt_strategy"], "\x00")
+
+
+class ParquetSnapshotStore:
+    """Columnar snapshot of content joined with sentiment_summaries, written as a
+    hive partitioned Parquet dataset (forum=/month=) under root_dir. Exports are
+    incremental: summaries inserted since the last export are appended, and the
+    partitions of summaries updated in place since (see
+    DatabaseSqlLite.update_stage_results) are rewritten.
+    """
+
+    def __init__(self, root_dir: str = "snapshots"):
+        self.root_dir = root_dir
+
+    def _watermark_path(self) -> str:
+        return os.path.join(self.root_dir, WATERMARK_FILE)
+
+    def _read_watermark(self) -> typing.Optional[dict]:
+        if not os.path.exists(self._watermark_path()):
+            return None
+        with open(self._watermark_path(), encoding="utf-8") as f:
+            watermark = json.load(f)
+        if watermark.get("format") != WATERMARK_FORMAT:
+            return None
+        return watermark
+
+    def get_watermark(self) -> int:
+        watermark = self._read_watermark()
+        return watermark["last_summary_rowid"] if watermark is not None else 0
+
+    def _set_watermark(self, rowid: int, generation: int):
+        tmp_path = self._watermark_path() + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"format": WATERMARK_FORMAT, "last_summary_rowid": rowid, "last_generation": generation}, f)
+        os.replace(tmp_path, self._watermark_path())
+
+    def _clear(self):
+        # removes the partitions and watermark written by export, nothing else
+        for name in os.listdir(self.root_dir):
+            if name.startswith("forum=") and os.path.isdir(os.path.join(self.root_dir, name)):
+                shutil.rmtree(os.path.join(self.root_dir, name))
+        for name in (WATERMARK_FILE, REWRITE_JOURNAL_FILE):
+            if os.path.exists(os.path.join(self.root_dir, name)):
+                os.remove(os.path.join(self.root_dir, name))
+
+    def _finish_rewrite(self):
+        # completes a partition rewrite interrupted after its new file was written
+        journal_path = os.path.join(self.root_dir, REWRITE_JOURNAL_FILE)
+        if not os.path.exists(journal_path):
+            return
+        with open(journal_path, encoding="utf-8") as f:
+            journal = json.load(f)
+        # the new rows appear before the old ones go, never a missing partition
+        if os.path.exists(journal["write"]):
+            os.replace(journal["write"], journal["rename"])
+        for path in journal["delete"]:
+            if os.path.exists(path):
+                os.remove(path)
+        os.remove(journal_path)
+
+    def _rewrite_partition(self, forum: str, month: str, updated: pa.Table, generation: int, rows_per_group: int):
+        """Replaces the rows of the partition that were updated, written to a
+        new file that is renamed into place before the old files are deleted.
+        """
+        partition = (ds.field("forum") == forum) & (ds.field("month") == month)
+        dataset = self.dataset()
+        old_paths = [fragment.path for fragment in dataset.get_fragments(filter=partition)]
+        if len(old_paths) == 0:
+            # exported before its content was, nothing to replace
+            self._write(updated, f"part-u{generation}-{{i}}.parquet", rows_per_group)
+            return
+        kept = dataset.to_table(filter=partition)
+        kept = kept.filter(pc.invert(pc.is_in(_keys(kept), value_set=_keys(updated))))
+        table = pa.concat_tables([kept, updated]).sort_by([("date", "ascending")])
+
+        directory = os.path.dirname(old_paths[0])
+        rename = os.path.join(directory, f"part-u{generation}-0.parquet")
+        journal = {
+            # a rewrite repeated after a crash replaces its own earlier file
+            "delete": [path for path in old_paths if path != rename],
+            # files starting with "_" are not part of the dataset
+            "write": os.path.join(directory, f"_part-u{generation}.parquet"),
+            "rename": rename,
+        }
+        pq.write_table(table.drop_columns(["forum", "month"]), journal["write"], row_group_size=rows_per_group)
+        tmp_path = os.path.join(self.root_dir, REWRITE_JOURNAL_FILE + ".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(journal, f)
+        os.replace(tmp_path, os.path.join(self.root_dir, REWRITE_JOURNAL_FILE))
+        self._finish_rewrite()
+
+    def _write(self, table: pa.Table, basename_template: str, rows_per_group: int):
+        ds.write_dataset(
+            table,
+            self.root_dir,
+            format="parquet",
+            partitioning=["forum", "month"],
+            partitioning_flavor="hive",
+            basename_template=basename_template,
+            existing_data_behavior="overwrite_or_ignore",
+            max_rows_per_group=rows_per_group,
+            min_rows_per_group=min(rows_per_group, len(table)),
+        )
+
+    def export(self, database, chunk_rows: int = 100000, rows_per_group: int = 50000) -> int:
+        """Appends the summaries added since the previous export and rewrites
+        the partitions of the summaries updated since, returning the number of
+        rows written. A snapshot without a watermark of the current format is
+        rebuilt from scratch.
+        """
+        os.makedirs(self.root_dir, exist_ok=True)
+        written = 0
+        watermark = self._read_watermark()
+        if watermark is None:
+            # a snapshot of an older format cannot be appended to
+            self._clear()
+            watermark = {"last_summary_rowid": 0, "last_generation": 0}
+        self._finish_rewrite()
+        rowid = appended_after_rowid = watermark["last_summary_rowid"]
+        generation = watermark.get("last_generation", 0)
+        # the rows appended below reflect every update up to here
+        appended_generation = database.get_summary_generation()
+
+        for rowid, rows in database.iter_snapshot_rows(rowid, chunk_rows):
+            self._write(_table(rows), f"part-{rowid}-{{i}}.parquet", rows_per_group)
+            self._set_watermark(rowid, generation)
+            written += len(rows)
+
+        # the rows arrive grouped by partition, one partition is rewritten at a time
+        last_generation = generation
+        for (forum, month), chunks in itertools.groupby(
+            (
+                (chunk_generation, row)
+                for chunk_generation, rows in database.iter_updated_snapshot_rows(
+                    generation, appended_after_rowid, rowid, appended_generation, chunk_rows
+                )
+                for row in rows
+            ),
+            key=lambda item: (item[1][-3], item[1][-1].strip()[:7]),
+        ):
+            chunks = list(chunks)
+            last_generation = max(last_generation, max(g for g, _ in chunks))
+            self._rewrite_partition(forum, month, _table([row for _, row in chunks]), last_generation, rows_per_group)
+            written += len(chunks)
+        last_generation = max(last_generation, appended_generation)
+        if last_generation != generation:
+            self._set_watermark(rowid, last_generation)
+        return written
+
+    def dataset(self) -> ds.Dataset:
+        return ds.dataset(
+            self.root_dir,
+            format="parquet",
+            partitioning="hive",
+            schema=SNAPSHOT_SCHEMA,
+            exclude_invalid_files=True,
+        )
+
+    def read_table(
+        self,
+        columns: typing.Optional[typing.List[str]] = None,
+        sentiment: typing.Optional[bool] = None,
+        regions: typing.Optional[typing.List[str]] = None,
+        forums: typing.Optional[typing.List[str]] = None,
+        start_date: typing.Optional[typing.Union[str, datetime.date]] = None,
+        end_date: typing.Optional[typing.Union[str, datetime.date]] = None,
+    ) -> pa.Table:
+        """Loads only the requested columns. Filters are pushed down to skip
+        partitions (forum, month) and row groups (sentiment, region, date).
+        """
+        expression = None
+        conditions = []
+        if sentiment is not None:
+            conditions.append(ds.field("sentiment") == (1 if sentiment else 0))
+        if regions is not None:
+            conditions.append(ds.field("region").isin(regions))
+        if forums is not None:
+            conditions.append(ds.field("forum").isin(forums))
+        if start_date is not None:
+            conditions.append(ds.field("month") >= _day(start_date)[:7])
+            conditions.append(ds.field("date") >= _day(start_date))
+        if end_date is not None:
+            conditions.append(ds.field("month") <= _day(end_date)[:7])
+            conditions.append(ds.field("date") <= _day(end_date))
+        for condition in conditions:
+            expression = condition if expression is None else expression & condition
+
+        return self.dataset().to_table(columns=columns, filter=expression)
+
+    def read_dataframe(self, columns: typing.Optional[typing.List[str]] = None, **filters):
+        # split_blocks/self_destruct avoid consolidating copies when converting
+        return self.read_table(columns, **filters).to_pandas(split_blocks=True, self_destruct=True)
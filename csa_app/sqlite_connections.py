@@ -0,0 +1,69 @@
+import os
+import sqlite3
+import threading
+
+
+class SqliteConnectionManager:
+    """Hands out one persistent connection per thread (and per process, so
+    forked workers never share a connection) with WAL journaling and tuned
+    pragmas. Read-only managers open the file with mode=ro so dashboard reads
+    never take write locks.
+    """
+
+    def __init__(
+        self,
+        db_file_path: str,
+        read_only: bool = False,
+        cache_size_kib: int = 64 * 1024,
+        mmap_size: int = 256 * 1024 * 1024,
+        busy_timeout: float = 30.0,
+        cached_statements: int = 256,
+    ):
+        self.db_file_path = db_file_path
+        self.read_only = read_only
+        self.cache_size_kib = cache_size_kib
+        self.mmap_size = mmap_size
+        self.busy_timeout = busy_timeout
+        self.cached_statements = cached_statements
+        self._local = threading.local()
+
+    def _connect(self) -> sqlite3.Connection:
+        if self.read_only:
+            c = sqlite3.connect(
+                f"file:{self.db_file_path}?mode=ro",
+                uri=True,
+                timeout=self.busy_timeout,
+                cached_statements=self.cached_statements,
+            )
+            c.execute("PRAGMA query_only = ON")
+        else:
+            c = sqlite3.connect(
+                self.db_file_path,
+                timeout=self.busy_timeout,
+                cached_statements=self.cached_statements,
+            )
+            # WAL lets readers proceed while a writer commits, and persists in the file
+            c.execute("PRAGMA journal_mode = WAL")
+        # NORMAL is durable across application crashes in WAL mode
+        c.execute("PRAGMA synchronous = NORMAL")
+        c.execute(f"PRAGMA cache_size = -{int(self.cache_size_kib)}")
+        c.execute(f"PRAGMA mmap_size = {int(self.mmap_size)}")
+        c.execute("PRAGMA temp_store = MEMORY")
+        return c
+
+    def connection(self) -> sqlite3.Connection:
+        """Returns this thread's connection; use it as a context manager to
+        commit on success and roll back on error, it stays open afterwards.
+        """
+        c = getattr(self._local, "connection", None)
+        if c is None or self._local.pid != os.getpid():
+            c = self._connect()
+            self._local.connection = c
+            self._local.pid = os.getpid()
+        return c
+
+    def close(self):
+        c = getattr(self._local, "connection", None)
+        if c is not None and self._local.pid == os.getpid():
+            c.close()
+        self._local.connection = None
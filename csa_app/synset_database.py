@@ -1,37 +1,116 @@
+import collections
+import os
 import typing
-from nltk.corpus import wordnet as wn
 
 from . import wse_models
+from .hypernym_index import HypernymClosureIndex
+from .wordnet_snapshot import WordNetSnapshot
+
+
+# Bump when get_parent_ids or the hypernym data change, d_04_reprocess_stages.py
+# then re-expands the stored summaries
+EXPANSION_VERSION = 1
+
+
+class LruCache:
+    """Bounded least-recently-used mapping that counts hits and misses."""
+
+    def __init__(self, max_size: int = 50000):
+        self.max_size = max_size
+        self.entries = collections.OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        value = self.entries.get(key)
+        if value is None:
+            self.misses += 1
+            return None
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def put(self, key, value):
+        self.entries[key] = value
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self.entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups > 0 else 0.0,
+        }
+
 
 class SynsetDatabaseWordNet:
+    """Senses and hypernyms from the prebuilt WordNet snapshot when one exists,
+    otherwise from NLTK, whose corpus is only loaded on the first lookup.
+    """
 
-    def get_noun_synsets(self, lemma):
-        # lookup all the senses for a word from wordnet
-        synset_options = []
-        added_map = {}
-        for wn_synset in wn.synsets(lemma, pos=wn.NOUN):
-            if wn_synset._name not in added_map:
-                synset_options.append(wse_models.SynsetOption(wn_synset._name, wn_synset._definition))
-                added_map[wn_synset._name] = True
-            else:
-                1+2 # why here?!
-                
-        return synset_options
+    def __init__(
+        self,
+        cache_size: int = 50000,
+        hypernym_index_path: typing.Optional[str] = None,
+        snapshot_path: typing.Optional[str] = None,
+    ):
+        # (lemma, pos) -> tuple of SynsetOption shared by every caller
+        self.synset_cache = LruCache(cache_size)
+        self.hypernym_index = None
+        if hypernym_index_path is not None and os.path.exists(hypernym_index_path):
+            self.hypernym_index = HypernymClosureIndex(hypernym_index_path)
+        self.snapshot = None
+        if snapshot_path is not None and os.path.exists(snapshot_path):
+            self.snapshot = WordNetSnapshot(snapshot_path)
+
+    def _get_synsets(self, lemma, pos) -> typing.Tuple[wse_models.SynsetOption, ...]:
+        key = (lemma, pos)
+        synset_options = self.synset_cache.get(key)
+        if synset_options is not None:
+            return synset_options
 
-    def get_verb_synsets(self, lemma):
         # lookup all the senses for a word from wordnet
-        synset_options = []
         added_map = {}
-        for wn_synset in wn.synsets(lemma, pos=wn.VERB):
-            if wn_synset._name not in added_map:
-                synset_options.append(wse_models.SynsetOption(wn_synset._name, wn_synset._definition))
-                added_map[wn_synset._name] = True
-            else:
-                1+2 # why here?!
-                
+        if self.snapshot is not None:
+            for i in self.snapshot.synsets(lemma, pos):
+                name = self.snapshot.names[i]
+                if name not in added_map:
+                    added_map[name] = wse_models.SynsetOption(name, self.snapshot.glosses[i])
+        else:
+            from nltk.corpus import wordnet as wn
+
+            for wn_synset in wn.synsets(lemma, pos=pos):
+                if wn_synset._name not in added_map:
+                    added_map[wn_synset._name] = wse_models.SynsetOption(wn_synset._name, wn_synset._definition)
+        synset_options = tuple(added_map.values())
+
+        self.synset_cache.put(key, synset_options)
         return synset_options
 
+    def get_noun_synsets(self, lemma) -> typing.Tuple[wse_models.SynsetOption, ...]:
+        return self._get_synsets(lemma, "n")
+
+    def get_verb_synsets(self, lemma) -> typing.Tuple[wse_models.SynsetOption, ...]:
+        return self._get_synsets(lemma, "v")
+
+    def warm_cache(self, database, number: int = 10000):
+        """Preloads the cache with the lemmas most frequently stored in sentiment_summaries."""
+        for lemma, role in database.get_frequent_lemmas(number):
+            self.get_noun_synsets(lemma)
+            if role == "method":
+                self.get_verb_synsets(lemma)
+
     def get_parent_ids(self, synset_id) -> typing.List[str]:
+        if self.hypernym_index is not None and synset_id in self.hypernym_index:
+            return self.hypernym_index.get_parent_ids(synset_id)
+        if self.snapshot is not None and synset_id in self.snapshot:
+            return self.snapshot.get_parent_ids(synset_id)
+
+        from nltk.corpus import wordnet as wn
+
         p_ids = set()
 
         to_get = [synset_id]
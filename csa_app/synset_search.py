@@ -0,0 +1,225 @@
+import bisect
+import collections
+import heapq
+import math
+import re
+import typing
+
+import numpy as np
+
+from . import wse_models
+
+
+_TOKEN = re.compile(r"\w+")
+
+
+def normalize_lemma(text: str) -> str:
+    return " ".join(text.lower().replace("_", " ").split())
+
+
+def trigrams(text: str) -> typing.Set[str]:
+    padded = f"  {text} "
+    return set(padded[i : i + 3] for i in range(len(padded) - 2))
+
+
+class SynsetSearchIndex:
+    """In-memory autocomplete index over the lemma names and glosses of synsets.
+
+    Prefix queries are answered by bisecting the sorted lemma names, with the
+    ranked candidates of short prefixes precomputed. When prefixes do not give
+    enough results, lemmas sharing character trigrams with the query are added
+    so misspellings still match, then synsets whose glosses contain every query
+    word. Within each tier synsets are ranked by how often they occur in our
+    data for the searched role.
+    """
+
+    def __init__(
+        self,
+        synsets: typing.List[typing.Tuple[str, str, typing.List[str]]],
+        frequencies: typing.Optional[typing.Dict[str, typing.Dict[str, int]]] = None,
+        short_prefix_length: int = 3,
+        top_k: int = 20,
+        min_similarity: float = 0.4,
+    ):
+        """synsets holds (synset id, gloss, lemma names) and frequencies maps a
+        role to synset id -> number of occurrences.
+        """
+        self.ids = [s[0] for s in synsets]
+        self.glosses = [s[1] for s in synsets]
+        # synset names look like lemma.pos.nn
+        self.pos = [s[0].rsplit(".", 2)[-2] if s[0].count(".") >= 2 else "" for s in synsets]
+        self.top_k = top_k
+        self.min_similarity = min_similarity
+        self.short_prefix_length = short_prefix_length
+
+        positions = {synset_id: i for i, synset_id in enumerate(self.ids)}
+        self.weights = {}
+        for role, counts in (frequencies or {}).items():
+            weights = np.zeros(len(self.ids), dtype=np.float64)
+            for synset_id, count in counts.items():
+                if synset_id in positions:
+                    weights[positions[synset_id]] = count
+            self.weights[role] = weights
+        self.no_weights = np.zeros(len(self.ids), dtype=np.float64)
+        self.any_role_weights = (
+            np.max(np.vstack(list(self.weights.values())), axis=0) if len(self.weights) > 0 else self.no_weights
+        )
+
+        # (lemma, synset) pairs sorted on the lemma for prefix bisection
+        entries = sorted(
+            set((normalize_lemma(lemma), i) for i, s in enumerate(synsets) for lemma in s[2])
+        )
+        self.keys = [e[0] for e in entries]
+        self.key_synsets = [e[1] for e in entries]
+
+        # distinct lemmas with their synsets and trigram postings for fuzzy matching
+        self.lemmas = sorted(set(self.keys))
+        self.lemma_synsets = []
+        postings = collections.defaultdict(list)
+        self.lemma_trigram_counts = np.zeros(len(self.lemmas), dtype=np.int32)
+        for j, lemma in enumerate(self.lemmas):
+            start = bisect.bisect_left(self.keys, lemma)
+            end = bisect.bisect_right(self.keys, lemma)
+            self.lemma_synsets.append(self.key_synsets[start:end])
+            grams = trigrams(lemma)
+            self.lemma_trigram_counts[j] = len(grams)
+            for gram in grams:
+                postings[gram].append(j)
+        self.trigram_postings = {gram: np.array(js, dtype=np.int32) for gram, js in postings.items()}
+
+        gloss_postings = collections.defaultdict(set)
+        for i, gloss in enumerate(self.glosses):
+            for token in _TOKEN.findall(gloss.lower()):
+                gloss_postings[token].add(i)
+        self.gloss_postings = {token: frozenset(ids) for token, ids in gloss_postings.items()}
+
+        # short prefixes match too many lemmas to rank per keystroke, they are
+        # ranked for each role since a role's top synsets may rank low overall
+        self.prefix_candidates = {role: {} for role in [None] + list(self.weights)}
+        for length in range(1, short_prefix_length + 1):
+            for prefix in set(key[:length] for key in self.keys if len(key) >= length):
+                start = bisect.bisect_left(self.keys, prefix)
+                end = bisect.bisect_left(self.keys, prefix + "\U0010ffff", start)
+                for role, candidates in self.prefix_candidates.items():
+                    candidates[prefix] = self._rank_range(start, end, role, 4 * top_k)
+
+    def _rank_range(self, start: int, end: int, role: typing.Optional[str], limit: typing.Optional[int]) -> typing.List[int]:
+        weights = self._role_weights(role)
+        best = {}
+        for k in range(start, end):
+            i = self.key_synsets[k]
+            key = (-weights[i], len(self.keys[k]), self.ids[i])
+            if i not in best or key < best[i]:
+                best[i] = key
+        ranked = sorted(best, key=best.get)
+        return ranked if limit is None else ranked[:limit]
+
+    def _role_weights(self, role: typing.Optional[str]) -> np.ndarray:
+        if role is None:
+            return self.any_role_weights
+        return self.weights.get(role, self.no_weights)
+
+    def _prefix_matches(self, query: str, role: typing.Optional[str], pos, k: int) -> typing.List[int]:
+        start = bisect.bisect_left(self.keys, query)
+        end = bisect.bisect_right(self.keys, query, start)
+        exact = [self.key_synsets[j] for j in range(start, end)]
+        weights = self._role_weights(role)
+        exact.sort(key=lambda i: (-weights[i], self.ids[i]))
+
+        candidates = self.prefix_candidates.get(role, {}).get(query)
+        if candidates is None or len(self._filter(candidates, pos)) < k:
+            end = bisect.bisect_left(self.keys, query + "\U0010ffff", start)
+            candidates = self._rank_range(start, end, role, None)
+        return exact + candidates
+
+    def _fuzzy_matches(self, query: str, role: typing.Optional[str]) -> typing.List[int]:
+        grams = [gram for gram in trigrams(query) if gram in self.trigram_postings]
+        if len(grams) == 0:
+            return []
+        shared = np.bincount(
+            np.concatenate([self.trigram_postings[gram] for gram in grams]),
+            minlength=len(self.lemmas),
+        )
+        # dice coefficient between the trigram sets
+        similarity = 2 * shared / (len(trigrams(query)) + self.lemma_trigram_counts)
+        lemma_ids = np.nonzero(similarity >= self.min_similarity)[0]
+        weights = self._role_weights(role)
+        max_log_weight = math.log1p(weights.max()) if len(weights) > 0 and weights.max() > 0 else 1.0
+
+        scores = {}
+        for j in lemma_ids:
+            for i in self.lemma_synsets[j]:
+                score = similarity[j] + 0.1 * math.log1p(weights[i]) / max_log_weight
+                if score > scores.get(i, -1.0):
+                    scores[i] = score
+        return sorted(scores, key=lambda i: (-scores[i], self.ids[i]))
+
+    def _gloss_matches(self, query: str, role: typing.Optional[str], pos, k: int) -> typing.List[int]:
+        tokens = _TOKEN.findall(query)
+        if len(tokens) == 0:
+            return []
+        matches = None
+        for token in tokens:
+            ids = self.gloss_postings.get(token, frozenset())
+            matches = ids if matches is None else matches & ids
+        weights = self._role_weights(role)
+        # common gloss words match a large part of the index, only rank the top k
+        return heapq.nsmallest(k, self._filter(matches, pos), key=lambda i: (-weights[i], self.ids[i]))
+
+    def _filter(self, synset_indices, pos) -> typing.List[int]:
+        if pos is None:
+            return list(synset_indices)
+        return [i for i in synset_indices if self.pos[i] in pos]
+
+    def search(
+        self,
+        text: str,
+        role: typing.Optional[str] = None,
+        pos: typing.Optional[typing.Tuple[str, ...]] = None,
+        k: typing.Optional[int] = None,
+    ) -> typing.List[wse_models.SynsetOption]:
+        """Returns up to k synsets matching text, pos restricts the parts of
+        speech e.g. ("n",) or ("n", "v").
+        """
+        k = k if k is not None else self.top_k
+        query = normalize_lemma(text)
+        if query == "":
+            return []
+
+        results = []
+        seen = set()
+
+        def extend(candidates):
+            for i in self._filter(candidates, pos):
+                if i not in seen:
+                    seen.add(i)
+                    results.append(i)
+                    if len(results) >= k:
+                        return True
+            return False
+
+        if not extend(self._prefix_matches(query, role, pos, k)):
+            if not extend(self._fuzzy_matches(query, role)):
+                extend(self._gloss_matches(query, role, pos, k + len(seen)))
+        return [wse_models.SynsetOption(self.ids[i], self.glosses[i]) for i in results]
+
+
+def build_from_wordnet(
+    frequencies: typing.Optional[typing.Dict[str, typing.Dict[str, int]]] = None, **kwargs
+) -> SynsetSearchIndex:
+    from nltk.corpus import wordnet as wn
+
+    synsets = []
+    for pos in (wn.NOUN, wn.VERB):
+        for s in wn.all_synsets(pos):
+            synsets.append((s._name, s._definition, s.lemma_names()))
+    return SynsetSearchIndex(synsets, frequencies, **kwargs)
+
+
+def build_from_snapshot(
+    snapshot_path: str, frequencies: typing.Optional[typing.Dict[str, typing.Dict[str, int]]] = None, **kwargs
+) -> SynsetSearchIndex:
+    """Same index as build_from_wordnet without loading the NLTK corpus."""
+    from .wordnet_snapshot import WordNetSnapshot
+
+    return SynsetSearchIndex(list(WordNetSnapshot(snapshot_path).iter_synsets()), frequencies, **kwargs)
@@ -0,0 +1,201 @@
+import json
+import os
+import typing
+
+import numpy as np
+
+
+NAMES_FILE = "names"
+GLOSSES_FILE = "glosses"
+LEMMA_KEYS_FILE = "lemma_keys"
+LEMMA_OFFSETS_FILE = "lemma_offsets.npy"
+LEMMA_SYNSETS_FILE = "lemma_synsets.npy"
+HYPERNYM_OFFSETS_FILE = "hypernym_offsets.npy"
+HYPERNYM_IDS_FILE = "hypernym_ids.npy"
+MORPHOLOGY_FILE = "morphology.json"
+
+
+class StringTable:
+    """Strings stored as one memory-mapped UTF-8 blob and an offsets array.
+
+    When the strings were written sorted, find() binary searches the table
+    without building a dict, so opening it costs no more than mapping the files.
+    Lookups go through memoryviews of the mappings, indexing the numpy arrays
+    themselves costs a microsecond per access.
+    """
+
+    def __init__(self, directory: str, name: str):
+        self.blob = memoryview(np.load(os.path.join(directory, name + "_blob.npy"), mmap_mode="r"))
+        self.offsets = memoryview(np.load(os.path.join(directory, name + "_offsets.npy"), mmap_mode="r"))
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def _bytes(self, i: int) -> bytes:
+        return bytes(self.blob[self.offsets[i] : self.offsets[i + 1]])
+
+    def __getitem__(self, i: int) -> str:
+        return self._bytes(i).decode("utf-8")
+
+    def find(self, value: str) -> int:
+        """Index of value in a sorted table, -1 when missing."""
+        # UTF-8 bytes sort in the same order as the strings they encode
+        encoded = value.encode("utf-8")
+        low, high = 0, len(self)
+        while low < high:
+            middle = (low + high) // 2
+            if self._bytes(middle) < encoded:
+                low = middle + 1
+            else:
+                high = middle
+        return low if low < len(self) and self._bytes(low) == encoded else -1
+
+    @staticmethod
+    def write(directory: str, name: str, values: typing.List[str]):
+        encoded = [v.encode("utf-8") for v in values]
+        offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum([len(e) for e in encoded])
+        np.save(os.path.join(directory, name + "_blob.npy"), np.frombuffer(b"".join(encoded), dtype=np.uint8))
+        np.save(os.path.join(directory, name + "_offsets.npy"), offsets)
+
+
+def _lemma_key(lemma: str, pos: str) -> str:
+    return f"{pos}\t{lemma}"
+
+
+class WordNetSnapshot:
+    """The parts of WordNet the app uses: the lemma index, glosses and hypernym
+    edges of noun and verb synsets, written by build() as memory-mapped arrays.
+
+    Opening a snapshot takes milliseconds against the seconds NLTK needs to
+    parse the corpus, and forked workers share its pages through the page cache.
+    synsets() reproduces wn.synsets, including its morphological normalization,
+    as NLTK releases that apply the substitution rules once do; older releases
+    applied them again to their outputs until a form matched.
+    """
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self.names = StringTable(directory, NAMES_FILE)
+        self.glosses = StringTable(directory, GLOSSES_FILE)
+        self.lemma_keys = StringTable(directory, LEMMA_KEYS_FILE)
+        self.lemma_offsets = memoryview(np.load(os.path.join(directory, LEMMA_OFFSETS_FILE), mmap_mode="r"))
+        self.lemma_synsets = memoryview(np.load(os.path.join(directory, LEMMA_SYNSETS_FILE), mmap_mode="r"))
+        self.hypernym_offsets = memoryview(np.load(os.path.join(directory, HYPERNYM_OFFSETS_FILE), mmap_mode="r"))
+        self.hypernym_ids = memoryview(np.load(os.path.join(directory, HYPERNYM_IDS_FILE), mmap_mode="r"))
+        # exception lists and suffix rules, loaded on the first lookup
+        self._morphology = None
+
+    def __contains__(self, synset_id: str) -> bool:
+        return self.names.find(synset_id) >= 0
+
+    def _lemma_synsets(self, lemma: str, pos: str) -> memoryview:
+        i = self.lemma_keys.find(_lemma_key(lemma, pos))
+        if i < 0:
+            return self.lemma_synsets[0:0]
+        return self.lemma_synsets[self.lemma_offsets[i] : self.lemma_offsets[i + 1]]
+
+    def _morphy(self, form: str, pos: str) -> typing.List[str]:
+        if self._morphology is None:
+            with open(os.path.join(self.directory, MORPHOLOGY_FILE), encoding="utf-8") as f:
+                self._morphology = json.load(f)
+        exceptions = self._morphology["exceptions"][pos]
+        substitutions = self._morphology["substitutions"][pos]
+
+        if form in exceptions:
+            forms = exceptions[form]
+        else:
+            forms = [form[: -len(old)] + new for old, new in substitutions if form.endswith(old)]
+
+        result = []
+        for candidate in [form] + forms:
+            if candidate not in result and len(self._lemma_synsets(candidate, pos)) > 0:
+                result.append(candidate)
+        return result
+
+    def synsets(self, lemma: str, pos: str) -> typing.List[int]:
+        """Synset numbers of lemma in WordNet's sense order, as wn.synsets(lemma, pos)."""
+        return [i for form in self._morphy(lemma.lower(), pos) for i in self._lemma_synsets(form, pos)]
+
+    def hypernyms(self, synset: int) -> memoryview:
+        return self.hypernym_ids[self.hypernym_offsets[synset] : self.hypernym_offsets[synset + 1]]
+
+    def get_parent_ids(self, synset_id: str) -> typing.List[str]:
+        """Transitive hypernyms, slower than a HypernymClosureIndex but complete."""
+        parents = set()
+        to_get = [self.names.find(synset_id)]
+        while len(to_get) > 0:
+            for p in self.hypernyms(to_get.pop()):
+                if p not in parents:
+                    parents.add(p)
+                    to_get.append(p)
+        return [self.names[p] for p in parents]
+
+    def iter_synsets(self) -> typing.Iterator[typing.Tuple[str, str, typing.List[str]]]:
+        """(synset id, gloss, lemma names) triples, as used by SynsetSearchIndex."""
+        lemmas = [[] for _ in range(len(self.names))]
+        for i in range(len(self.lemma_keys)):
+            lemma = self.lemma_keys[i].split("\t", 1)[1]
+            for s in self.lemma_synsets[self.lemma_offsets[i] : self.lemma_offsets[i + 1]]:
+                lemmas[s].append(lemma)
+        for i in range(len(self.names)):
+            yield self.names[i], self.glosses[i], lemmas[i]
+
+    @staticmethod
+    def build(
+        directory: str,
+        synsets: typing.Dict[str, typing.Tuple[str, typing.List[str]]],
+        lemma_index: typing.Dict[typing.Tuple[str, str], typing.List[str]],
+        exceptions: typing.Dict[str, typing.Dict[str, typing.List[str]]],
+        substitutions: typing.Dict[str, typing.List[typing.Tuple[str, str]]],
+    ):
+        """Writes a snapshot from synset id -> (gloss, hypernym ids), (lemma, pos)
+        -> synset ids in sense order, and the morphology of each part of speech.
+        """
+        names = sorted(synsets)
+        ids = {name: i for i, name in enumerate(names)}
+
+        hypernym_offsets = np.zeros(len(names) + 1, dtype=np.int64)
+        hypernym_offsets[1:] = np.cumsum([len(synsets[name][1]) for name in names])
+        hypernym_ids = np.array([ids[p] for name in names for p in synsets[name][1]], dtype=np.int32)
+
+        keys = sorted(lemma_index, key=lambda key: _lemma_key(*key))
+        lemma_offsets = np.zeros(len(keys) + 1, dtype=np.int64)
+        lemma_offsets[1:] = np.cumsum([len(lemma_index[key]) for key in keys])
+        lemma_synsets = np.array([ids[s] for key in keys for s in lemma_index[key]], dtype=np.int32)
+
+        os.makedirs(directory, exist_ok=True)
+        StringTable.write(directory, NAMES_FILE, names)
+        StringTable.write(directory, GLOSSES_FILE, [synsets[name][0] for name in names])
+        StringTable.write(directory, LEMMA_KEYS_FILE, [_lemma_key(lemma, pos) for lemma, pos in keys])
+        np.save(os.path.join(directory, LEMMA_OFFSETS_FILE), lemma_offsets)
+        np.save(os.path.join(directory, LEMMA_SYNSETS_FILE), lemma_synsets)
+        np.save(os.path.join(directory, HYPERNYM_OFFSETS_FILE), hypernym_offsets)
+        np.save(os.path.join(directory, HYPERNYM_IDS_FILE), hypernym_ids)
+        with open(os.path.join(directory, MORPHOLOGY_FILE), "w", encoding="utf-8") as f:
+            json.dump({"exceptions": exceptions, "substitutions": substitutions}, f)
+
+
+def build_from_wordnet(directory: str):
+    from nltk.corpus import wordnet as wn
+
+    synsets = {}
+    offset_names = {}
+    for pos in (wn.NOUN, wn.VERB):
+        for s in wn.all_synsets(pos):
+            synsets[s._name] = (s._definition, [p._name for p in s.hypernyms()])
+            offset_names[(pos, s._offset)] = s._name
+
+    lemma_index = {}
+    for lemma, offsets_by_pos in wn._lemma_pos_offset_map.items():
+        for pos in (wn.NOUN, wn.VERB):
+            if pos in offsets_by_pos:
+                lemma_index[(lemma, pos)] = [offset_names[(pos, offset)] for offset in offsets_by_pos[pos]]
+
+    WordNetSnapshot.build(
+        directory,
+        synsets,
+        lemma_index,
+        {pos: dict(wn._exception_map[pos]) for pos in (wn.NOUN, wn.VERB)},
+        {pos: list(wn.MORPHOLOGICAL_SUBSTITUTIONS[pos]) for pos in (wn.NOUN, wn.VERB)},
+    )
@@ -2,11 +2,10 @@ import typing
 import json
 
 
-class SynsetOption:
-
-    def __init__(self, id:str, gloss:str):
-        self.id = id
-        self.gloss = gloss
+class SynsetOption(typing.NamedTuple):
+    # immutable so option lists can be shared between callers through caches
+    id: str
+    gloss: str
 
 
 class WordSenseEvaluation:
@@ -25,6 +24,9 @@ class WordSenseEvaluation:
         return f"What is the meaning of the word {self.word} in '{self.sentence}'?"
 
 
+LETTERS = ['A', 'B', 'C', 'D', 'E', 'F', 'G', 'H', 'I', 'J', 'K', 'L', 'M', 'N', 'O', 'P', 'Q', 'R', 'S', 'T', 'U', 'V', 'W', 'X', 'Y', 'Z']
+
+
 class DefaultWsePrompt:
 
     def __init__(self,
@@ -35,7 +37,7 @@ class DefaultWsePrompt:
 
     @property
     def content(self) -> str:
-        letters = ['A', 'B', 'C', 'D', 'E', 'F', 'G', 'H', 'I', 'J', 'K', 'L', 'M', 'N', 'O', 'P', 'Q', 'R', 'S', 'T', 'U', 'V', 'W', 'X', 'Y', 'Z']
+        letters = LETTERS
 
         if len(self.topic.synset_options) > len(letters):
             raise ValueError("Not enough letters to support this prompt") 
@@ -51,8 +53,77 @@ class DefaultWsePrompt:
         options_str = "\n".join(options)
 
         return f'''
-What is the meaning of the concept "{self.topic.word}" in "{self.topic.sentence}"?
+{self.question}
 
 Options:
 {options_str}
 '''
+
+    @property
+    def question(self) -> str:
+        return f'What is the meaning of the concept "{self.topic.word}" in "{self.topic.sentence}"?'
+
+
+class ContributorPrompt(DefaultWsePrompt):
+    """Asks which catalog entity a contributor name refers to, the options
+    describe the candidate entities.
+    """
+
+    @property
+    def question(self) -> str:
+        return f'Who or what is "{self.topic.word}" in "{self.topic.sentence}"?'
+
+
+class MultiQuestionWsePrompt:
+    """Several word sense questions in one prompt. Each distinct sentence is
+    stated once and the questions refer to it by number, so questions about the
+    same content share its tokens. letter_option_maps holds one letter map per
+    question, in order.
+    """
+
+    def __init__(self,
+            topics:typing.List[WordSenseEvaluation],
+        ):
+        self.topics = topics
+        self.letter_option_maps = []
+        self.sentences = []
+        sentence_numbers = {}
+        self.sentence_refs = []
+        for topic in topics:
+            if len(topic.synset_options) > len(LETTERS):
+                raise ValueError("Not enough letters to support this prompt")
+            if topic.sentence not in sentence_numbers:
+                sentence_numbers[topic.sentence] = len(self.sentences) + 1
+                self.sentences.append(topic.sentence)
+            self.sentence_refs.append(sentence_numbers[topic.sentence])
+            self.letter_option_maps.append(dict(zip(LETTERS, topic.synset_options)))
+
+    @property
+    def content(self) -> str:
+        texts = "\n".join(f'Text {i + 1}: "{sentence}"' for i, sentence in enumerate(self.sentences))
+        questions = []
+        for number, (topic, ref, letter_option_map) in enumerate(
+            zip(self.topics, self.sentence_refs, self.letter_option_maps), start=1
+        ):
+            options_str = "\n".join(f"{letter}) {t.gloss}" for letter, t in letter_option_map.items())
+            questions.append(
+                f'Question {number}: What is the meaning of the concept "{topic.word}" in Text {ref}?\n'
+                f"Options:\n{options_str}"
+            )
+        questions_str = "\n\n".join(questions)
+
+        return f'''
+{texts}
+
+{questions_str}
+'''
+
+    def answer(self, answers) -> typing.List[typing.Optional[SynsetOption]]:
+        """Maps (question number, letter) answers back to the synset options,
+        None for questions left unanswered or answered with an unknown letter.
+        """
+        options = [None] * len(self.topics)
+        for number, letter in answers:
+            if 1 <= number <= len(self.topics):
+                options[number - 1] = self.letter_option_maps[number - 1].get(letter.strip().upper())
+        return options
@@ -1,27 +1,49 @@
 import csv
-import json
 
 from csa_app.database import DatabaseSqlLite
+from csa_app.ingestion import ingest_file
+from csa_app.near_duplicates import MinHashLshIndex
 import csa_app.model as model
 
 
 # Configuration
 
-csv_files = ["tests/testdata.csv"]
+# CSV or JSONL files, optionally gzip-compressed (".csv.gz", ".jsonl.gz")
+input_files = ["tests/testdata.csv"]
 field_mapping = {
     "body": "content",
     "author": "author",
     "written_date_time": "publish_date",
 }
 forum = "twitter"
+region = "unknown"
 db_file_path = "data.db"
 batch_size = 1000
+# Assign near-duplicate cluster ids while ingesting
+cluster_near_duplicates = True
+# Hash and serialize rows in a process pool with a single batched writer
+use_parallel_ingestion = True
+parallel_workers = None  # defaults to the number of CPUs
+parallel_chunk_rows = 5000
+parallel_write_batch_rows = 50000
 
 
 # Helper functions
 
 
-def process_csv_as_json(csv_file_path, database, field_mapping):
+def store_batch(database, batch, near_duplicate_index=None):
+    # content stored by an earlier run keeps its cluster, so re-ingesting a file
+    # neither assigns it again nor inserts it twice
+    stored = set(database.get_content([c.content_hash for c in batch]).content_hash)
+    new_content = list({c.content_hash: c for c in batch if c.content_hash not in stored}.values())
+    if len(new_content) == 0:
+        return
+    if near_duplicate_index is not None:
+        near_duplicate_index.assign_clusters(new_content)
+    database.add_content(new_content)
+
+
+def process_csv_as_json(csv_file_path, database, field_mapping, near_duplicate_index=None):
     with open(csv_file_path, mode="r", encoding="utf-8") as csv_file:
         # Initialize the CSV reader
         csv_reader = csv.DictReader(csv_file)
@@ -38,22 +60,39 @@ def process_csv_as_json(csv_file_path, database, field_mapping):
                         body=row[field_mapping["body"]],
                         author=row[field_mapping["author"]],
                         forum=forum,
-                        raw_details=json.dumps(row),
+                        raw_details=row,
                         written_date_time=row[field_mapping["written_date_time"]],
+                        region=region,
                     )
                 )
 
                 if (i + 1) % batch_size == 0:
-                    database.add_content(batch)
+                    store_batch(database, batch, near_duplicate_index)
                     batch.clear()
             except Exception as e:
                 print(f"Skipping row due to parsing exception: {e}")
 
         if len(batch) > 0:
-            database.add_content(batch)
+            store_batch(database, batch, near_duplicate_index)
 
 
 if __name__ == "__main__":
     database = DatabaseSqlLite(db_file_path=db_file_path)
-    for csv_file_path in csv_files:
-        process_csv_as_json(csv_file_path, database, field_mapping)
+    near_duplicate_index = None
+    if cluster_near_duplicates:
+        near_duplicate_index = MinHashLshIndex(db_file_path=db_file_path)
+    for input_file_path in input_files:
+        if use_parallel_ingestion:
+            ingest_file(
+                input_file_path,
+                database,
+                field_mapping,
+                forum,
+                region,
+                workers=parallel_workers,
+                chunk_rows=parallel_chunk_rows,
+                write_batch_rows=parallel_write_batch_rows,
+                near_duplicate_index=near_duplicate_index,
+            )
+        else:
+            process_csv_as_json(input_file_path, database, field_mapping, near_duplicate_index)
@@ -1,13 +1,26 @@
+import asyncio
+import collections
+import concurrent.futures
 import openai
 import dotenv
 import functools
 import os
+import socket
+import typing
 
 import csa_app.ai_processor_openai
-from csa_app.ambiguty_processor import extract_synset_id
+from csa_app.batch_processor import OpenAIBatchEndpoint, process_batch_job
+from csa_app.ambiguty_processor import WSD_VERSION, SynsetQuestion, extract_contributor_id_async, extract_synset_id_async, extract_synset_ids_async
+from csa_app.contributor_resolution import ContributorCatalog
 from csa_app.database import DatabaseSqlLite
-from csa_app.model import SentimentSummary
-from csa_app.synset_database import SynsetDatabaseWordNet
+from csa_app.metrics import STAGE_DB_WRITE, STAGE_HYPERNYM_EXPANSION, MetricsRecorder
+from csa_app.model import Content, SentimentSummary, SummaryBatch
+from csa_app.pipeline import GroupCommitWriter, PipelineStage, StagePipeline
+from csa_app.profiling import profiler_from_env
+from csa_app.rate_limiting import AsyncRateLimiter
+from csa_app.response_cache import ResponseCacheSqlLite
+from csa_app.sense_ranking import LexicalSenseRanker
+from csa_app.synset_database import EXPANSION_VERSION, SynsetDatabaseWordNet
 
 # Configuration
 
@@ -15,55 +28,589 @@ from csa_app.synset_database import SynsetDatabaseWordNet
 dotenv.load_dotenv()
 
 db_file_path = "data.db"
+# Built by d_98_build_wordnet_indexes.py, hypernyms are walked in WordNet when missing
+hypernym_index_path = "wordnet_hypernym_index"
+# Built by d_98_build_wordnet_indexes.py, NLTK's corpus is loaded when missing
+wordnet_snapshot_path = "wordnet_snapshot"
+# Number of frequent lemmas to preload into the synset cache on start
+synset_cache_warm_size = 10000
+# LLM responses are cached next to the main database, None disables the cache
+cache_db_file_path = "data_llm_cache.db"
 batch_size = 10
 max_number_of_batches = 1
+# Limits of the API account shared by all concurrent requests
+max_concurrency = 8
+requests_per_minute = 500
+tokens_per_minute = 200000
+model_id = "gpt-4o-mini"
+# Per stage latency, token, retry and cost metrics, summarized after each batch,
+# stored in the stage_metrics table and exported for Prometheus
+metrics = MetricsRecorder()
+metrics_prometheus_file_path = "analyzer_metrics.prom"
+# Sampling CPU profile and top allocations of every batch, written to the
+# directory in $CSA_PROFILE_DIR when set, e.g. CSA_PROFILE_DIR=profiles
+profiler = profiler_from_env()
+prompt_strategy = csa_app.ai_processor_openai.PROMPT_STRATEGY
 processor = functools.partial(
-    csa_app.ai_processor_openai.process, model="gpt-4o-mini"
+    csa_app.ai_processor_openai.process_async, model=model_id, metrics=metrics
 )
-ambiguity_clarifier = functools.partial(csa_app.ai_processor_openai.process_multiple_choice_prompt, model="gpt-4o-mini")
+ambiguity_clarifier = functools.partial(csa_app.ai_processor_openai.process_multiple_choice_prompt_async, model=model_id, metrics=metrics)
+packed_processor = functools.partial(
+    csa_app.ai_processor_openai.process_packed_async, model=model_id, metrics=metrics
+)
+# Short contents are extracted several per request, within a prompt token
+# budget; 1 sends every content on its own
+pack_max_records = 8
+pack_max_input_tokens = 3000
+batch_ambiguity_clarifier = functools.partial(csa_app.ai_processor_openai.process_multiple_choice_batch_prompt_async, model=model_id, metrics=metrics)
+# Ask the WSD questions of a record (and, for batch jobs, of several records)
+# in one prompt, at most this many questions per prompt; 1 asks them one by one
+wsd_questions_per_prompt = 8
+# Lexical pre-ranking of synset candidates: only the top k go into the WSD
+# prompt and the LLM is skipped when the best gloss wins by the margin, None disables
+sense_ranker = LexicalSenseRanker(top_k=5, margin=0.15)
+# Built by d_98_build_wordnet_indexes.py from WordNet's named entities and a CSV
+# of known entities; contributors are matched against it locally and only
+# ambiguous names are asked about. Contributors stay unresolved when missing
+contributor_catalog_path = "contributor_catalog.jsonl"
+# loaded in __main__
+contributor_catalog = None
+# Claim content through the shared work queue so several analyzer processes
+# (or machines sharing the database file) can run side by side
+use_work_queue = True
+worker_id = f"{socket.gethostname()}-{os.getpid()}"
+lease_seconds = 600
+heartbeat_interval = 60
+# Items released or expired this many times are marked failed, not retried
+max_attempts = 3
+# Stream content through extraction, disambiguation, expansion and writing as
+# overlapping stages instead of finishing each batch stage by stage; batch_size
+# is then the number of contents claimed per fetch and max_number_of_batches
+# the number of fetches
+use_pipeline = True
+# Items waiting between two stages, a full queue holds back the stage before it
+pipeline_queue_size = 64
+# Requests in flight per network bound stage, all within the limits above
+extraction_concurrency = 8
+wsd_concurrency = 8
+# Hypernym expansion is CPU bound and runs on a pool of threads
+expansion_threads = 2
+expansion_executor = concurrent.futures.ThreadPoolExecutor(max_workers=expansion_threads, thread_name_prefix="expansion")
+# Summaries are committed in groups of this many, or after this many seconds
+write_max_items = 500
+write_max_seconds = 5.0
+# Offline mode: submit extraction as batch jobs instead of real-time calls
+use_batch_jobs = False
+batch_job_size = 10000
+batch_job_request_file_path = "batch_requests.jsonl"
+batch_job_poll_interval = 60
 api_key = os.getenv("OPENAI_API_KEY")
 openai.api_key = api_key
 
 
-if __name__ == "__main__":
-    database = DatabaseSqlLite(db_file_path=db_file_path)
-    synset_database = SynsetDatabaseWordNet()
+async def analyze_content(content: Content, synset_database, limiter, cache=None) -> SentimentSummary:
+    summary:SentimentSummary = await processor(content, limiter=limiter, cache=cache)
+    if summary is None:
+        return None
+    return await disambiguate_summary(content, summary, synset_database, limiter, cache)
+
+
+async def analyze_pack(contents: typing.List[Content], synset_database, limiter, cache=None) -> typing.List[SentimentSummary | Exception | None]:
+    summaries = await packed_processor(contents, limiter=limiter, cache=cache)
+    pairs = [(content, summary) for content, summary in zip(contents, summaries) if summary is not None]
+    if wsd_questions_per_prompt > 1:
+        disambiguated = await disambiguate_summaries(pairs, synset_database, limiter, cache)
+    else:
+        disambiguated = await asyncio.gather(
+            *(disambiguate_summary(content, summary, synset_database, limiter, cache) for content, summary in pairs),
+            return_exceptions=True,
+        )
+    disambiguated = iter(disambiguated)
+    return [next(disambiguated) if summary is not None else None for summary in summaries]
+
+
+def _set_synset_id(summary: SentimentSummary, role: str, synset_id, duration, msg):
+    if synset_id is not None:
+        setattr(summary, f"{role}_synset_id", synset_id)
+    summary.discussion_duration += duration
+    summary.log.append(msg)
+
+
+def expand_summary(summary: SentimentSummary, synset_database) -> SentimentSummary:
+    """Sets the values of the disambiguated roles to their synset and its hypernyms."""
+    for role in ("topic", "method"):
+        synset_id = getattr(summary, f"{role}_synset_id")
+        if synset_id is not None and getattr(summary, f"{role}_values") is None:
+            with metrics.time(STAGE_HYPERNYM_EXPANSION):
+                values = synset_database.get_parent_ids(synset_id)
+            values.append(synset_id)
+            setattr(summary, f"{role}_values", values)
+    return summary
+
+
+def _set_stage_versions(summary: SentimentSummary):
+    summary.wsd_version = WSD_VERSION
+    summary.expansion_version = EXPANSION_VERSION
+
+
+async def resolve_contributors(pairs, limiter, cache=None) -> typing.List[Exception | None]:
+    """Sets the contributors_values of (content, summary) pairs to the catalog
+    entities of their contributors, returning for each pair None or the
+    exception that failed one of its prompts.
+    """
+    errors = [None] * len(pairs)
+    if contributor_catalog is None:
+        return errors
+    clarifier = functools.partial(ambiguity_clarifier, limiter=limiter, cache=cache)
+
+    names = [
+        (position, name)
+        for position, (_, summary) in enumerate(pairs)
+        if summary.contributors_values is None
+        for name in dict.fromkeys(summary.contributors)
+    ]
+    # the names of all pairs are matched against the catalog at once
+    resolutions = contributor_catalog.resolve([name for _, name in names])
+    results = await asyncio.gather(
+        *(
+            extract_contributor_id_async(clarifier, pairs[position][0], name, resolution, ranker=sense_ranker)
+            for (position, name), resolution in zip(names, resolutions)
+        ),
+        return_exceptions=True,
+    )
+
+    entity_ids = [[] for _ in pairs]
+    for (position, _), result in zip(names, results):
+        if isinstance(result, Exception):
+            errors[position] = result
+            continue
+        entity_id, duration, msg = result
+        if entity_id is not None and entity_id not in entity_ids[position]:
+            entity_ids[position].append(entity_id)
+        pairs[position][1].discussion_duration += duration
+        pairs[position][1].log.append(msg)
+    for (_, summary), error, ids in zip(pairs, errors, entity_ids):
+        if error is None and summary.contributors_values is None:
+            summary.contributors_values = ids
+            summary.contributor_version = contributor_catalog.version
+    return errors
+
+
+async def disambiguate_summaries(pairs, synset_database, limiter, cache=None, expand=True) -> typing.List[SentimentSummary | Exception]:
+    """Disambiguates the lemmas of several (content, summary) pairs with
+    multiple-question prompts, returning the summaries in order or the exception
+    that failed their prompt. With expand=False the hypernyms are left to
+    expand_summary.
+    """
+    clarifier = functools.partial(ambiguity_clarifier, limiter=limiter, cache=cache)
+    batch_clarifier = functools.partial(batch_ambiguity_clarifier, limiter=limiter, cache=cache)
+
+    questions = []
+    for position, (content, summary) in enumerate(pairs):
+        if summary.topic_synset_id is None and summary.topic_lemma is not None and summary.topic_lemma != "":
+            questions.append((position, "topic", SynsetQuestion(content, summary.topic_lemma, consider_verbs=False)))
+        if summary.method_synset_id is None and summary.method_lemma is not None and summary.method_lemma != "":
+            questions.append((position, "method", SynsetQuestion(content, summary.method_lemma, consider_verbs=True)))
+
+    chunks = [questions[i : i + wsd_questions_per_prompt] for i in range(0, len(questions), wsd_questions_per_prompt)]
+    chunk_results, contributor_errors = await asyncio.gather(
+        asyncio.gather(
+            *(extract_synset_ids_async(batch_clarifier, clarifier, [q for _, _, q in chunk], synset_database, ranker=sense_ranker) for chunk in chunks),
+            return_exceptions=True,
+        ),
+        resolve_contributors(pairs, limiter, cache),
+    )
+
+    results = [summary if error is None else error for (_, summary), error in zip(pairs, contributor_errors)]
+    for chunk, chunk_result in zip(chunks, chunk_results):
+        if isinstance(chunk_result, Exception):
+            for position, _, _ in chunk:
+                results[position] = chunk_result
+            continue
+        for (position, role, _), (synset_id, duration, msg) in zip(chunk, chunk_result):
+            if not isinstance(results[position], Exception):
+                _set_synset_id(results[position], role, synset_id, duration, msg)
+    for summary in results:
+        if not isinstance(summary, Exception):
+            _set_stage_versions(summary)
+            if expand:
+                expand_summary(summary, synset_database)
+    return results
+
+
+async def disambiguate_summary(content: Content, summary: SentimentSummary, synset_database, limiter, cache=None, expand=True) -> SentimentSummary:
+    if wsd_questions_per_prompt > 1:
+        result = (await disambiguate_summaries([(content, summary)], synset_database, limiter, cache, expand))[0]
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+    clarifier = functools.partial(ambiguity_clarifier, limiter=limiter, cache=cache)
+
+    if summary.topic_synset_id is None and summary.topic_lemma is not None and summary.topic_lemma != "":
+
+        synset_id, duration, msg = await extract_synset_id_async(clarifier, content,summary.topic_lemma, synset_database, consider_verbs=False, ranker=sense_ranker)
+        _set_synset_id(summary, "topic", synset_id, duration, msg)
+
+    if summary.method_synset_id is None and summary.method_lemma is not None and summary.method_lemma != "":
+        synset_id, duration, msg = await extract_synset_id_async(clarifier, content,summary.method_lemma, synset_database, consider_verbs=True, ranker=sense_ranker)
+        _set_synset_id(summary, "method", synset_id, duration, msg)
+
+    error = (await resolve_contributors([(content, summary)], limiter, cache))[0]
+    if error is not None:
+        raise error
+
+    _set_stage_versions(summary)
+    if expand:
+        expand_summary(summary, synset_database)
+    return summary
+
+
+def group_by_cluster(content_batch):
+    """Splits a batch into the contents that need analysis (one per near-duplicate
+    cluster) and a map from each representative to its remaining members. The
+    content named by the cluster_id represents its cluster when it is in the batch.
+    """
+    clusters = {}
+    for content in content_batch:
+        cluster_id = content.cluster_id if content.cluster_id is not None else content.content_hash
+        clusters.setdefault(cluster_id, []).append(content)
+    representatives = []
+    members = {}
+    for cluster_id, contents in clusters.items():
+        representative = next((c for c in contents if c.content_hash == cluster_id), contents[0])
+        representatives.append(representative)
+        members[representative.content_hash] = [c for c in contents if c is not representative]
+    return representatives, members
+
+
+def fan_out_summaries(summaries: SummaryBatch, members) -> SummaryBatch:
+    for i in range(len(summaries)):
+        for member in members.get(summaries.content_hash[i], []):
+            summaries.append_copy(i, member.content_hash)
+    return summaries
+
+
+async def _paired(contents, coroutine, single=False):
+    """Awaits coroutine, pairing its results, or the exception it raised, with contents."""
+    try:
+        results = await coroutine
+        return contents, [results] if single else results
+    except Exception as e:
+        return contents, [e] * len(contents)
+
+
+def collect_summaries(summaries: SummaryBatch, contents, results):
+    for content, summary in zip(contents, results):
+        if isinstance(summary, Exception):
+            print(f"Failed to analyze content {content.content_hash}: {summary}")
+        elif summary is not None:
+            summaries.append(summary)
+        else:
+            print(
+                f"Odd, this content was skipped given processor did not like it: {content}"
+            )
+
+
+def report_metrics(database):
+    print(metrics.format_batch_summary())
+    database.add_stage_metrics(metrics.batch_started, worker_id, metrics.batch_summary())
+    if metrics_prometheus_file_path is not None:
+        metrics.write_prometheus(metrics_prometheus_file_path)
+
+
+def fetch_batch(database, number):
+    if use_work_queue:
+        return database.claim_work(worker_id, model_id, prompt_strategy, number, lease_seconds, max_attempts)
+    return database.get_unanalyzed_content(number)
+
+
+async def keep_leases_alive(database):
+    while True:
+        await asyncio.sleep(heartbeat_interval)
+        # waits out the write lock off the event loop
+        await asyncio.to_thread(database.heartbeat_work, worker_id, model_id, prompt_strategy, lease_seconds)
+
+
+def store_summaries(database, content_hashes, summaries: SummaryBatch):
+    with metrics.time(STAGE_DB_WRITE, len(summaries)):
+        database.add_summaries(summaries, worker_id=worker_id if use_work_queue else None)
+    if not use_work_queue:
+        return
+    # let other workers retry whatever failed here
+    stored = set(summaries.content_hash)
+    database.release_work(
+        worker_id, model_id, prompt_strategy,
+        [h for h in content_hashes if h not in stored],
+    )
+
+
+async def analyze_batches(database, synset_database, cache=None):
+    limiter = AsyncRateLimiter(
+        max_concurrency=max_concurrency,
+        requests_per_minute=requests_per_minute,
+        tokens_per_minute=tokens_per_minute,
+    )
 
     for i in range(max_number_of_batches):
-        content_batch = database.get_unanalyzed_content(batch_size)
-        if len(content_batch) == 0:
-            print("Finished end of content to process, exiting.")
-            break
-        summaries = []
-        for content in content_batch:
-            summary:SentimentSummary = processor(content)
-
-            if summary.topic_values is None and summary.topic_lemma is not None and summary.topic_lemma != "":
-                        
-                synset_id, duration, msg = extract_synset_id(ambiguity_clarifier, content,summary.topic_lemma, synset_database, consider_verbs=False)
-                if synset_id is not None:
-                    topic_values = synset_database.get_parent_ids(synset_id)
-                    topic_values.append(synset_id)
-                    summary.topic_values = topic_values
-                    
-                summary.discussion_duration += duration
-                summary.log.append(msg)
-
-            if summary.method_values is None and summary.method_lemma is not None and summary.method_lemma != "":
-                synset_id, duration, msg = extract_synset_id(ambiguity_clarifier, content,summary.method_lemma, synset_database, consider_verbs=True)
-                if synset_id is not None:
-                    method_values = synset_database.get_parent_ids(synset_id)
-                    method_values.append(synset_id)
-                    summary.method_values = method_values
-                    
-                summary.discussion_duration += duration
-                summary.log.append(msg)
-
-            if summary is not None:
-                summaries.append(summary)
+        with profiler.profile(f"analyze_batch_{i}"):
+            metrics.start_batch()
+            content_batch = fetch_batch(database, batch_size)
+            if len(content_batch) == 0:
+                print("Finished end of content to process, exiting.")
+                break
+
+            covered = database.fan_out_cluster_summaries(content_batch)
+            representatives, members = group_by_cluster(
+                [c for c in content_batch if c.content_hash not in covered]
+            )
+
+            summaries = SummaryBatch()
+            heartbeat = asyncio.create_task(keep_leases_alive(database))
+            try:
+                if pack_max_records > 1:
+                    packs = csa_app.ai_processor_openai.pack_contents(
+                        representatives, max_records=pack_max_records, max_input_tokens=pack_max_input_tokens
+                    )
+                    jobs = [_paired(pack, analyze_pack(pack, synset_database, limiter, cache)) for pack in packs]
+                else:
+                    jobs = [
+                        _paired([content], analyze_content(content, synset_database, limiter, cache), single=True)
+                        for content in representatives
+                    ]
+                # completed summaries move into the columnar batch right away
+                for job in asyncio.as_completed(jobs):
+                    collect_summaries(summaries, *(await job))
+            finally:
+                heartbeat.cancel()
+
+            store_summaries(
+                database,
+                [h for h in content_batch.content_hash if h not in covered],
+                fan_out_summaries(summaries, members),
+            )
+
+            if cache is not None:
+                print(f"LLM response cache: {cache.stats()}")
+            print(f"Synset cache: {synset_database.synset_cache.stats()}")
+            if sense_ranker is not None:
+                print(f"Sense ranker: {sense_ranker.stats()}")
+            report_metrics(database)
+
+
+async def analyze_pipelined(database, synset_database, cache=None):
+    limiter = AsyncRateLimiter(
+        max_concurrency=max_concurrency,
+        requests_per_minute=requests_per_minute,
+        tokens_per_minute=tokens_per_minute,
+    )
+    # near-duplicates waiting for the summary of their representative, and
+    # representatives that failed, both released by the writer thread
+    members = {}
+    failed = collections.deque()
+    # content fetched but not written yet; without the work queue it still looks
+    # unanalyzed, failed content stays here so it is not retried in this run
+    in_flight = set()
+
+    async def fetch():
+        for i in range(max_number_of_batches):
+            # claiming and copying cluster summaries wait for the write lock
+            # the writer thread may hold, both run off the event loop
+            if use_work_queue:
+                content_batch = await asyncio.to_thread(fetch_batch, database, batch_size)
             else:
-                print(
-                    f"Odd, this content was skipped given processor did not like it: {content}"
+                exclude = set(in_flight)
+                content_batch = await asyncio.to_thread(database.get_unanalyzed_content, batch_size + len(exclude))
+                content_batch = [c for c in content_batch if c.content_hash not in exclude][:batch_size]
+            if len(content_batch) == 0:
+                print("Finished end of content to process.")
+                return
+            covered = await asyncio.to_thread(database.fan_out_cluster_summaries, content_batch)
+            uncovered = [c for c in content_batch if c.content_hash not in covered]
+            in_flight.update(c.content_hash for c in uncovered)
+            representatives, batch_members = group_by_cluster(uncovered)
+            members.update(batch_members)
+            if pack_max_records > 1:
+                packs = csa_app.ai_processor_openai.pack_contents(
+                    representatives, max_records=pack_max_records, max_input_tokens=pack_max_input_tokens
                 )
+            else:
+                packs = [[content] for content in representatives]
+            for pack in packs:
+                yield pack
+
+    async def extract(pack):
+        if len(pack) > 1:
+            summaries = await packed_processor(pack, limiter=limiter, cache=cache)
+        else:
+            summaries = [await processor(pack[0], limiter=limiter, cache=cache)]
+        for content, summary in zip(pack, summaries):
+            if summary is None:
+                print(f"Odd, this content was skipped given processor did not like it: {content}")
+                failed.append(content.content_hash)
+        pairs = [(content, summary) for content, summary in zip(pack, summaries) if summary is not None]
+        return pairs if len(pairs) > 0 else None
+
+    async def disambiguate(pairs):
+        # the questions of a pack share multiple-question prompts
+        if wsd_questions_per_prompt > 1:
+            results = await disambiguate_summaries(pairs, synset_database, limiter, cache, expand=False)
+        else:
+            results = await asyncio.gather(
+                *(disambiguate_summary(content, summary, synset_database, limiter, cache, expand=False) for content, summary in pairs),
+                return_exceptions=True,
+            )
+        for (content, _), result in zip(pairs, results):
+            if isinstance(result, Exception):
+                fail("disambiguate", [content], result)
+        return [pair for pair, result in zip(pairs, results) if not isinstance(result, Exception)]
+
+    def expand(pairs):
+        for _, summary in pairs:
+            expand_summary(summary, synset_database)
+        return pairs
+
+    def fail(stage, contents, e):
+        for content in contents:
+            print(f"Failed to analyze content {content.content_hash} in {stage}: {e}")
+            failed.append(content.content_hash)
+
+    def on_error(stage, item, e):
+        # extraction takes a pack of contents, the later stages and the writer
+        # lists of (content, summary) pairs
+        fail(stage, item if stage == "extract" else [content for content, _ in item], e)
+
+    def flush(pairs):
+        summaries = SummaryBatch.from_summaries(summary for _, summary in pairs)
+        stored = list(summaries.content_hash)
+        fan_out_summaries(summaries, {h: members.get(h, []) for h in stored})
+        # a failed representative takes its near-duplicates back to the queue
+        released = [failed.popleft() for _ in range(len(failed))]
+        content_hashes = list(summaries.content_hash)
+        for h in released:
+            content_hashes.append(h)
+            content_hashes.extend(m.content_hash for m in members.get(h, []))
+        if len(content_hashes) > 0:
+            try:
+                store_summaries(database, content_hashes, summaries)
+            except Exception:
+                # released with the next group, along with the pairs of this one
+                failed.extend(released)
+                raise
+        for h in stored + released:
+            members.pop(h, None)
+        in_flight.difference_update(summaries.content_hash)
+
+    pipeline = StagePipeline(
+        [
+            # packs of (content, summary) pairs flow up to the expansion,
+            # which passes the pairs on to the writer one by one
+            PipelineStage("extract", extract, concurrency=extraction_concurrency),
+            PipelineStage("disambiguate", disambiguate, concurrency=wsd_concurrency),
+            PipelineStage("expand", expand, concurrency=expansion_threads, executor=expansion_executor, many=True),
+        ],
+        GroupCommitWriter(flush, max_items=write_max_items, max_seconds=write_max_seconds),
+        queue_size=pipeline_queue_size,
+        on_error=on_error,
+    )
+
+    with profiler.profile("analyze_pipelined"):
+        metrics.start_batch()
+        heartbeat = asyncio.create_task(keep_leases_alive(database))
+        try:
+            await pipeline.run(fetch())
+        finally:
+            heartbeat.cancel()
+        # failures after the last group was written
+        if len(failed) > 0:
+            try:
+                await asyncio.to_thread(flush, [])
+            except Exception as e:
+                print(f"Failed to release {len(failed)} contents, their leases expire after {lease_seconds} seconds: {e}")
+
+        print(f"Pipeline: {pipeline.stats()}")
+        if cache is not None:
+            print(f"LLM response cache: {cache.stats()}")
+        print(f"Synset cache: {synset_database.synset_cache.stats()}")
+        if sense_ranker is not None:
+            print(f"Sense ranker: {sense_ranker.stats()}")
+        report_metrics(database)
+
+
+async def analyze_batch_jobs(database, synset_database, endpoint, cache=None):
+    limiter = AsyncRateLimiter(
+        max_concurrency=max_concurrency,
+        requests_per_minute=requests_per_minute,
+        tokens_per_minute=tokens_per_minute,
+    )
+
+    for i in range(max_number_of_batches):
+        with profiler.profile(f"analyze_batch_job_{i}"):
+            metrics.start_batch()
+            content_batch = fetch_batch(database, batch_job_size)
+            if len(content_batch) == 0:
+                print("Finished end of content to process, exiting.")
+                break
+
+            covered = database.fan_out_cluster_summaries(content_batch)
+            representatives, members = group_by_cluster(
+                [c for c in content_batch if c.content_hash not in covered]
+            )
+            if len(representatives) == 0:
+                # the whole batch was copied from analyzed clusters, nothing to submit
+                print(f"All {len(content_batch)} contents were covered by their clusters")
+                continue
+
+            heartbeat = asyncio.create_task(keep_leases_alive(database))
+            try:
+                summaries = await asyncio.to_thread(
+                    process_batch_job,
+                    representatives,
+                    endpoint,
+                    batch_job_request_file_path,
+                    model=model_id,
+                    poll_interval=batch_job_poll_interval,
+                )
+                content_map = {c.content_hash: c for c in representatives}
+                contents = [content_map[s.content_hash] for s in summaries]
+                if wsd_questions_per_prompt > 1:
+                    # questions of different records share prompts here
+                    results = await disambiguate_summaries(list(zip(contents, summaries)), synset_database, limiter, cache)
+                else:
+                    results = await asyncio.gather(
+                        *(disambiguate_summary(content, s, synset_database, limiter, cache) for content, s in zip(contents, summaries)),
+                        return_exceptions=True,
+                    )
+            finally:
+                heartbeat.cancel()
+            stored = SummaryBatch()
+            collect_summaries(stored, contents, results)
+            store_summaries(
+                database,
+                [h for h in content_batch.content_hash if h not in covered],
+                fan_out_summaries(stored, members),
+            )
+            if sense_ranker is not None:
+                print(f"Sense ranker: {sense_ranker.stats()}")
+            report_metrics(database)
+
+
+if __name__ == "__main__":
+    database = DatabaseSqlLite(db_file_path=db_file_path)
+    synset_database = SynsetDatabaseWordNet(hypernym_index_path=hypernym_index_path, snapshot_path=wordnet_snapshot_path)
+    synset_database.warm_cache(database, synset_cache_warm_size)
+    if os.path.exists(contributor_catalog_path):
+        contributor_catalog = ContributorCatalog.load(contributor_catalog_path)
+        print(f"Loaded {len(contributor_catalog)} known contributors")
+    if use_work_queue:
+        print(f"Queued {database.enqueue_content(model_id, prompt_strategy)} new items")
+    cache = None
+    if cache_db_file_path is not None:
+        cache = ResponseCacheSqlLite(db_file_path=cache_db_file_path)
 
-        database.add_summaries(summaries)
+    if use_batch_jobs:
+        asyncio.run(analyze_batch_jobs(database, synset_database, OpenAIBatchEndpoint(), cache))
+    elif use_pipeline:
+        asyncio.run(analyze_pipelined(database, synset_database, cache))
+    else:
+        asyncio.run(analyze_batches(database, synset_database, cache))
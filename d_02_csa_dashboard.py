@@ -1,26 +1,46 @@
+import os
+
 import dash
 from dash import dcc, html
 from dash.dependencies import Input, Output, State
 import plotly.express as px
 import plotly.graph_objs as go
 import dash_bootstrap_components as dbc
+import pandas as pd
 
+from csa_app.contributor_resolution import read_entities
 from csa_app.database import DatabaseSqlLite
-from csa_app.synset_database import SynsetDatabaseWordNet
-
-
-database = DatabaseSqlLite()
-synset_database = SynsetDatabaseWordNet()
-
-synset_database.get_noun_synsets("events")
+from csa_app.profiling import profiler_from_env
+from csa_app.query_cache import QueryResultCache
+from csa_app.synset_search import SynsetSearchIndex, build_from_snapshot, build_from_wordnet
+
+
+database = DatabaseSqlLite(read_only=True)
+# Profiles of every callback are written to $CSA_PROFILE_DIR when set
+profiler = profiler_from_env()
+# shared by all server worker processes, invalidated when summaries are added
+query_cache = QueryResultCache("data_query_cache.db")
+# built once at startup so searching never touches WordNet per keystroke, from
+# the snapshot of d_98_build_wordnet_indexes.py when present
+wordnet_snapshot_path = "wordnet_snapshot"
+synset_frequencies = database.get_synset_frequencies()
+if os.path.exists(wordnet_snapshot_path):
+    synset_search_index = build_from_snapshot(wordnet_snapshot_path, synset_frequencies)
+else:
+    synset_search_index = build_from_wordnet(synset_frequencies)
+# contributors are filtered on the entities of the catalog the analyzer resolved
+# them with, WordNet's nouns are searched when it is missing
+contributor_catalog_path = "contributor_catalog.jsonl"
+contributor_search_index = None
+if os.path.exists(contributor_catalog_path):
+    contributor_search_index = SynsetSearchIndex(
+        [(e.id, e.gloss, [e.name, *e.aliases]) for e in read_entities(contributor_catalog_path)],
+        synset_frequencies,
+    )
 
 # Initialize Dash app
 app = dash.Dash(__name__, external_stylesheets=[dbc.themes.BOOTSTRAP])
 
-# Sample data for charts
-df = database.lookup_sentiment_summaries(return_limit=1000)
-query_count = 0
-
 COL_SENTIMENT = "sentiment"
 COL_METHOD = "method"
 COL_CONTRIBUTOR = "contributor"
@@ -38,7 +58,7 @@ lst_columns = [
 
 def convert_sentiment_col(series):
     return [
-        "Neutral" if s is None else "Negative" if s == 0.0 else "Positive"
+        "Neutral" if pd.isna(s) else "Negative" if s == 0.0 else "Positive"
         for s in series
     ]
 
@@ -278,17 +298,39 @@ app.layout = html.Div(
 )
 
 
+def lookup_counts(selected_column, filters):
+    filters = filters or {}
+    key = (
+        selected_column,
+        filters.get("topic_id"),
+        filters.get("method_id"),
+        filters.get("contributor_id"),
+        filters.get("sentiment"),
+        filters.get("start_content_datetime"),
+        filters.get("end_content_datetime"),
+    )
+    # counts come from the rollup tables, or the synset index when filtered
+    return query_cache.get_or_compute(
+        key,
+        database.get_summary_generation(),
+        lambda: database.lookup_sentiment_counts(*key),
+    ).copy()
+
+
 # Callback to update the bar chart based on dropdown selection
-@app.callback(Output("bar-chart", "figure"), [Input("bar-dropdown-column", "value")])
-def update_bar_chart(selected_column: str):
+@app.callback(
+    Output("bar-chart", "figure"),
+    [Input("bar-dropdown-column", "value"), Input("data-loading-number", "data")],
+)
+@profiler.wrap()
+def update_bar_chart(selected_column: str, filters):
     # Create the bar chart
-    grouped_df = (
-        df.groupby([selected_column, COL_SENTIMENT]).size().reset_index(name="Count")
-    )
+    grouped_df = lookup_counts(selected_column, filters)
+    if selected_column != COL_SENTIMENT:
+        grouped_df = grouped_df.sort_values("Count", ascending=False)
 
     grouped_df[COL_SENTIMENT] = convert_sentiment_col(grouped_df[COL_SENTIMENT])
 
-    print(grouped_df.head())
     fig = px.bar(
         grouped_df,
         x=selected_column,
@@ -305,16 +347,19 @@ def update_bar_chart(selected_column: str):
     Output("pie-chart", "figure"),
     [Input("pie-dropdown-column", "value"), Input("data-loading-number", "data")],
 )
-def update_pie_chart(selected_column, _):
-    # Create the bar chart
-    grouped_df = df.groupby([selected_column]).size().reset_index(name="Count")
-
-    grouped_df[COL_SENTIMENT] = convert_sentiment_col(grouped_df[COL_SENTIMENT])
+@profiler.wrap()
+def update_pie_chart(selected_column, filters):
+    # Create the pie chart
+    grouped_df = lookup_counts(selected_column, filters)
+    if selected_column == COL_SENTIMENT:
+        grouped_df[COL_SENTIMENT] = convert_sentiment_col(grouped_df[COL_SENTIMENT])
+    grouped_df = grouped_df.groupby([selected_column])["Count"].sum().reset_index()
 
     fig = px.pie(
         grouped_df,
         names=selected_column,
         values="Count",
+        color=selected_column,
         color_discrete_map=SENTIMENT_COLORS,
     )
     return fig
@@ -328,6 +373,7 @@ def update_pie_chart(selected_column, _):
         Input("dropdown-topic", "value"),
     ],
 )
+@profiler.wrap()
 def update_data(contributor_id, method_id, topic_id):
 
     if contributor_id == ANY_VALUE:
@@ -336,32 +382,29 @@ def update_data(contributor_id, method_id, topic_id):
         method_id = None
     if topic_id == ANY_VALUE:
         topic_id = None
-    # Create the bar chart
-    global query_count
-    global df
-
-    df = database.lookup_sentiment_summaries(
-        topic_id=topic_id,
-        method_id=method_id,
-        contributor_id=contributor_id,
-    )
-    import time
 
-    time.sleep(1)
-    query_count += 1
-    return query_count
+    # the charts query with these filters
+    return {
+        "topic_id": topic_id,
+        "method_id": method_id,
+        "contributor_id": contributor_id,
+    }
 
 
 @app.callback(Output("dropdown-contributor", "options"), Input("txt-s-cont", "value"))
+@profiler.wrap()
 def toggle_contributor_search(search_term):
 
     options = []
     if search_term is not None and search_term != "":
-        options = synset_database.get_noun_synsets(search_term)
+        if contributor_search_index is not None:
+            options = contributor_search_index.search(search_term, role="contributor")
+        else:
+            options = synset_search_index.search(search_term, role="contributor", pos=("n",))
 
     l = list(
         {
-            "label": o.gloss,
+            "label": f"{o.id}: {o.gloss}",
             "value": o.id,
         }
         for o in options
@@ -374,16 +417,17 @@ def toggle_contributor_search(search_term):
     Output("dropdown-method", "options"),
     Input("txt-s-method", "value"),
 )
+@profiler.wrap()
 def toggle_method_search(search_term):
 
     options = []
 
     if search_term is not None and search_term != "":
-        options = synset_database.get_noun_synsets(search_term)
+        options = synset_search_index.search(search_term, role="method", pos=("n", "v"))
 
     l = list(
         {
-            "label": o.gloss,
+            "label": f"{o.id}: {o.gloss}",
             "value": o.id,
         }
         for o in options
@@ -396,16 +440,17 @@ def toggle_method_search(search_term):
     Output("dropdown-topic", "options"),
     Input("txt-s-topic", "value"),
 )
+@profiler.wrap()
 def toggle_topic_search(search_term):
 
     options = []
 
     if search_term is not None and search_term != "":
-        options = synset_database.get_noun_synsets(search_term)
+        options = synset_search_index.search(search_term, role="topic", pos=("n",))
 
     l = list(
         {
-            "label": o.gloss,
+            "label": f"{o.id}: {o.gloss}",
             "value": o.id,
         }
         for o in options
@@ -424,6 +469,7 @@ def toggle_topic_search(search_term):
     [Input("toggle-left", "n_clicks")],
     [State("collapse-left", "is_open")],
 )
+@profiler.wrap()
 def toggle_panels(n_left, is_left_open):
     ctx = dash.callback_context
     left_style = {"float": "left", "width": "20%", "padding": "10px"}
@@ -452,6 +498,7 @@ def toggle_panels(n_left, is_left_open):
 
 # Callback to update content display based on checklist
 @app.callback(Output("content-display", "children"), [Input("content-list", "value")])
+@profiler.wrap()
 def display_content(selected_contents):
     if selected_contents:
         return html.Div(
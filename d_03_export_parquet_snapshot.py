@@ -0,0 +1,13 @@
+from csa_app.database import DatabaseSqlLite
+
+
+# Configuration
+
+db_file_path = "data.db"
+snapshot_root_dir = "snapshots"
+
+
+if __name__ == "__main__":
+    database = DatabaseSqlLite(db_file_path=db_file_path, read_only=True)
+    written = database.export_parquet_snapshot(snapshot_root_dir)
+    print(f"Wrote {written} new or updated summaries to the snapshot at {snapshot_root_dir}")
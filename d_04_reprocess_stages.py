@@ -0,0 +1,223 @@
+import asyncio
+import collections
+import concurrent.futures
+import dotenv
+import functools
+import os
+import typing
+
+import csa_app.ai_processor_openai
+from csa_app.ambiguty_processor import WSD_VERSION, SynsetQuestion, extract_contributor_id_async, extract_synset_ids_async
+from csa_app.contributor_resolution import ContributorCatalog
+from csa_app.database import DatabaseSqlLite
+from csa_app.model import ContributorResult, StageResult, StageRow
+from csa_app.rate_limiting import AsyncRateLimiter
+from csa_app.response_cache import ResponseCacheSqlLite
+from csa_app.sense_ranking import LexicalSenseRanker
+from csa_app.synset_database import EXPANSION_VERSION, SynsetDatabaseWordNet
+
+# Re-runs only the stages after extraction for summaries stored by an older
+# WSD_VERSION or EXPANSION_VERSION: the lemmas extracted by the LLM are
+# disambiguated again (WSD prompts only, the extraction is never repeated) and
+# the resolved synsets are re-expanded to their hypernyms. Contributors resolved
+# against another version of the contributor catalog, or never resolved, are
+# resolved again from their extracted names.
+
+# Configuration
+
+# Load environment variables from local ".env" file
+dotenv.load_dotenv()
+
+db_file_path = "data.db"
+hypernym_index_path = "wordnet_hypernym_index"
+wordnet_snapshot_path = "wordnet_snapshot"
+# Built by d_98_build_wordnet_indexes.py, contributors are left as they are when missing
+contributor_catalog_path = "contributor_catalog.jsonl"
+cache_db_file_path = "data_llm_cache.db"
+# Summaries read and rewritten per transaction
+chunk_size = 1000
+# Processes expanding the summaries whose disambiguation is current, they share
+# the memory-mapped hypernym index and WordNet snapshot
+expansion_workers = os.cpu_count()
+# Limits of the API account shared by all concurrent requests
+max_concurrency = 8
+requests_per_minute = 500
+tokens_per_minute = 200000
+model_id = "gpt-4o-mini"
+wsd_questions_per_prompt = 8
+sense_ranker = LexicalSenseRanker(top_k=5, margin=0.15)
+ambiguity_clarifier = functools.partial(csa_app.ai_processor_openai.process_multiple_choice_prompt_async, model=model_id)
+batch_ambiguity_clarifier = functools.partial(csa_app.ai_processor_openai.process_multiple_choice_batch_prompt_async, model=model_id)
+
+# opened once per expansion worker process
+synset_database = None
+# loaded in __main__
+contributor_catalog = None
+
+
+def open_synset_database():
+    global synset_database
+    synset_database = SynsetDatabaseWordNet(hypernym_index_path=hypernym_index_path, snapshot_path=wordnet_snapshot_path)
+
+
+def expand(synset_id: typing.Optional[str]) -> typing.Optional[typing.List[str]]:
+    if synset_id is None:
+        return None
+    values = synset_database.get_parent_ids(synset_id)
+    values.append(synset_id)
+    return values
+
+
+def expand_rows(rows: typing.List[StageRow]) -> typing.List[StageResult]:
+    return [
+        StageResult(
+            r.content_hash, r.model_id, r.prompt_strategy,
+            r.topic_synset_id, expand(r.topic_synset_id),
+            r.method_synset_id, expand(r.method_synset_id),
+            r.wsd_version, EXPANSION_VERSION,
+        )
+        for r in rows
+    ]
+
+
+async def disambiguate_rows(database, rows: typing.List[StageRow], limiter, cache=None) -> typing.List[StageResult]:
+    """Disambiguates the stored lemmas of rows again, leaving out the rows whose
+    prompts failed so the next run retries them.
+    """
+    clarifier = functools.partial(ambiguity_clarifier, limiter=limiter, cache=cache)
+    batch_clarifier = functools.partial(batch_ambiguity_clarifier, limiter=limiter, cache=cache)
+    contents = {c.content_hash: c for c in database.get_content(list(set(r.content_hash for r in rows)))}
+
+    questions = []
+    for position, r in enumerate(rows):
+        if r.topic_lemma is not None and r.topic_lemma != "":
+            questions.append((position, "topic", SynsetQuestion(contents[r.content_hash], r.topic_lemma, consider_verbs=False)))
+        if r.method_lemma is not None and r.method_lemma != "":
+            questions.append((position, "method", SynsetQuestion(contents[r.content_hash], r.method_lemma, consider_verbs=True)))
+
+    chunks = [questions[i : i + wsd_questions_per_prompt] for i in range(0, len(questions), wsd_questions_per_prompt)]
+    chunk_results = await asyncio.gather(
+        *(extract_synset_ids_async(batch_clarifier, clarifier, [q for _, _, q in chunk], synset_database, ranker=sense_ranker) for chunk in chunks),
+        return_exceptions=True,
+    )
+
+    synset_ids = [{"topic": None, "method": None} for _ in rows]
+    failed = set()
+    for chunk, chunk_result in zip(chunks, chunk_results):
+        if isinstance(chunk_result, Exception):
+            print(f"Failed to disambiguate {len(chunk)} lemmas: {chunk_result}")
+            failed.update(position for position, _, _ in chunk)
+            continue
+        for (position, role, _), (synset_id, _, _) in zip(chunk, chunk_result):
+            synset_ids[position][role] = synset_id
+
+    return [
+        StageResult(
+            r.content_hash, r.model_id, r.prompt_strategy,
+            ids["topic"], expand(ids["topic"]),
+            ids["method"], expand(ids["method"]),
+            WSD_VERSION, EXPANSION_VERSION,
+        )
+        for position, (r, ids) in enumerate(zip(rows, synset_ids))
+        if position not in failed
+    ]
+
+
+async def resolve_rows(database, rows: typing.List[StageRow], limiter, cache=None) -> typing.List[ContributorResult]:
+    """Resolves the stored contributor names of rows against the catalog again,
+    leaving out the rows whose prompts failed so the next run retries them.
+    """
+    clarifier = functools.partial(ambiguity_clarifier, limiter=limiter, cache=cache)
+    contents = {c.content_hash: c for c in database.get_content(list(set(r.content_hash for r in rows)))}
+
+    names = [(position, name) for position, r in enumerate(rows) for name in dict.fromkeys(r.contributors)]
+    resolutions = contributor_catalog.resolve([name for _, name in names])
+    results = await asyncio.gather(
+        *(
+            extract_contributor_id_async(clarifier, contents[rows[position].content_hash], name, resolution, ranker=sense_ranker)
+            for (position, name), resolution in zip(names, resolutions)
+        ),
+        return_exceptions=True,
+    )
+
+    entity_ids = [[] for _ in rows]
+    failed = set()
+    for (position, name), result in zip(names, results):
+        if isinstance(result, Exception):
+            print(f"Failed to resolve contributor {name}: {result}")
+            failed.add(position)
+            continue
+        entity_id = result[0]
+        if entity_id is not None and entity_id not in entity_ids[position]:
+            entity_ids[position].append(entity_id)
+
+    return [
+        ContributorResult(r.content_hash, r.model_id, r.prompt_strategy, ids, contributor_catalog.version)
+        for position, (r, ids) in enumerate(zip(rows, entity_ids))
+        if position not in failed
+    ]
+
+
+async def reprocess(database, executor, cache=None):
+    limiter = AsyncRateLimiter(
+        max_concurrency=max_concurrency,
+        requests_per_minute=requests_per_minute,
+        tokens_per_minute=tokens_per_minute,
+    )
+    loop = asyncio.get_running_loop()
+    totals = collections.Counter()
+
+    contributor_version = contributor_catalog.version if contributor_catalog is not None else None
+    after_rowid = 0
+    while True:
+        rows = database.get_stale_stage_rows(WSD_VERSION, EXPANSION_VERSION, after_rowid, chunk_size, contributor_version)
+        if len(rows) == 0:
+            break
+        after_rowid = rows[-1].rowid
+
+        # rows with a current disambiguation only need their hypernyms again,
+        # rows stale only in their contributors keep both
+        wsd_rows = [r for r in rows if r.wsd_version != WSD_VERSION]
+        expansion_rows = [r for r in rows if r.wsd_version == WSD_VERSION and r.expansion_version != EXPANSION_VERSION]
+        contributor_rows = [r for r in rows if contributor_version is not None and r.contributor_version != contributor_version]
+        parts = [expansion_rows[i::expansion_workers] for i in range(expansion_workers)]
+        expansions = [loop.run_in_executor(executor, expand_rows, part) for part in parts if len(part) > 0]
+
+        if len(contributor_rows) > 0:
+            results, contributor_results = await asyncio.gather(
+                disambiguate_rows(database, wsd_rows, limiter, cache),
+                resolve_rows(database, contributor_rows, limiter, cache),
+            )
+        else:
+            results, contributor_results = await disambiguate_rows(database, wsd_rows, limiter, cache), []
+        totals["disambiguated"] += len(results)
+        totals["failed"] += len(wsd_rows) - len(results)
+        totals["contributors_resolved"] += len(contributor_results)
+        totals["contributors_failed"] += len(contributor_rows) - len(contributor_results)
+        for part in await asyncio.gather(*expansions):
+            results.extend(part)
+            totals["expanded"] += len(part)
+
+        if len(results) > 0:
+            database.update_stage_results(results)
+        if len(contributor_results) > 0:
+            database.update_contributor_results(contributor_results)
+        print(f"Reprocessed up to summary {after_rowid}: {dict(totals)}")
+        if sense_ranker is not None:
+            print(f"Sense ranker: {sense_ranker.stats()}")
+    return totals
+
+
+if __name__ == "__main__":
+    database = DatabaseSqlLite(db_file_path=db_file_path)
+    open_synset_database()
+    if os.path.exists(contributor_catalog_path):
+        contributor_catalog = ContributorCatalog.load(contributor_catalog_path)
+        print(f"Loaded {len(contributor_catalog)} known contributors, catalog version {contributor_catalog.version}")
+    cache = None
+    if cache_db_file_path is not None:
+        cache = ResponseCacheSqlLite(db_file_path=cache_db_file_path)
+
+    with concurrent.futures.ProcessPoolExecutor(max_workers=expansion_workers, initializer=open_synset_database) as executor:
+        totals = asyncio.run(reprocess(database, executor, cache))
+    print(f"Finished reprocessing stages to WSD version {WSD_VERSION} and expansion version {EXPANSION_VERSION}: {dict(totals)}")
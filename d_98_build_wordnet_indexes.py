@@ -0,0 +1,33 @@
+import os
+import time
+
+from csa_app.hypernym_index import build_from_wordnet
+from csa_app import contributor_resolution, wordnet_snapshot
+
+
+# Configuration
+
+hypernym_index_path = "wordnet_hypernym_index"
+wordnet_snapshot_path = "wordnet_snapshot"
+contributor_catalog_path = "contributor_catalog.jsonl"
+# Known people and organizations added to WordNet's named entities, a CSV with
+# id, name, description and aliases ("|" separated) columns, skipped when missing
+known_entities_csv_path = "known_entities.csv"
+
+
+if __name__ == "__main__":
+    start = time.time()
+    build_from_wordnet(hypernym_index_path)
+    print(f"Built hypernym closure index at {hypernym_index_path} in {time.time() - start:.1f}s")
+
+    start = time.time()
+    wordnet_snapshot.build_from_wordnet(wordnet_snapshot_path)
+    print(f"Built WordNet snapshot at {wordnet_snapshot_path} in {time.time() - start:.1f}s")
+
+    start = time.time()
+    entities = {e.id: e for e in contributor_resolution.entities_from_wordnet()}
+    if os.path.exists(known_entities_csv_path):
+        # known entities replace WordNet's of the same id
+        entities.update((e.id, e) for e in contributor_resolution.entities_from_csv(known_entities_csv_path))
+    contributor_resolution.write_entities(contributor_catalog_path, entities.values())
+    print(f"Built contributor catalog of {len(entities)} entities at {contributor_catalog_path} in {time.time() - start:.1f}s")
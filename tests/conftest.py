@@ -0,0 +1,61 @@
+import json
+
+import pytest
+
+from csa_app.database import DatabaseSqlLite
+from csa_app.model import SentimentSummary
+
+
+MODEL_ID = "model"
+PROMPT_STRATEGY = "v1"
+
+
+@pytest.fixture
+def database(tmp_path) -> DatabaseSqlLite:
+    return DatabaseSqlLite(str(tmp_path / "data.db"))
+
+
+@pytest.fixture
+def add_content(database):
+    """Stores content rows from (content_hash, forum, written_date_time) and
+    optional cluster_id keyword arguments."""
+
+    def add(content_hashes, forum="forum", written_date_time="2024-01-15 10:00:00", region="region", cluster_id=None):
+        return database.add_content_rows(
+            [
+                (h, f"body of {h}", "author", forum, json.dumps({"id": h}), written_date_time, region, cluster_id)
+                for h in content_hashes
+            ]
+        )
+
+    return add
+
+
+@pytest.fixture
+def make_summary():
+    def make(content_hash, **fields) -> SentimentSummary:
+        values = dict(
+            content_hash=content_hash,
+            model_id=MODEL_ID,
+            prompt_strategy=PROMPT_STRATEGY,
+            log=[],
+            discussion_duration=1.0,
+            sentiment=True,
+            justifications=[],
+            location=None,
+            content_datetime=None,
+            topic="topic",
+            topic_lemma="topic",
+            topic_values=None,
+            contributors=[],
+            contributors_values=None,
+            method="method",
+            method_lemma="method",
+            method_values=None,
+            wsd_version=1,
+            expansion_version=1,
+        )
+        values.update(fields)
+        return SentimentSummary(**values)
+
+    return make
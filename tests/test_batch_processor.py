@@ -0,0 +1,93 @@
+import json
+import os
+
+from csa_app.ai_processor_openai import PackedSentimentResponse
+from csa_app.batch_processor import LocalFileBatchEndpoint, build_response_format, parse_batch_results, process_batch_job
+from csa_app.model import Content
+
+
+MODEL_ID = "model"
+RESPONSE = {
+    "justifications_of_sentiment": ["it works"],
+    "sentiment": "positive",
+    "names_of_contributors_that_cause_sentiment": ["Ada"],
+    "actions_causing_sentiment": "fixing the bug",
+    "action_lemma": "fix",
+    "action_tense": "past",
+    "topic": "the build",
+    "topic_lemma": "build",
+    "lat_lng_of_topic_location": None,
+    "datetime_of_topic": None,
+}
+
+
+def _content(content_hash) -> Content:
+    return Content(content_hash, f"body of {content_hash}", "author", "forum", {}, "2024-01-15 10:00:00", "region")
+
+
+def _result(custom_id, content=None, status_code=200, error=None) -> str:
+    body = {"choices": [{"message": {"role": "assistant", "content": content if content is not None else json.dumps(RESPONSE)}}]}
+    return json.dumps({"custom_id": custom_id, "response": {"status_code": status_code, "body": body}, "error": error})
+
+
+def test_parse_skips_failed_and_unknown_requests():
+    contents = [_content(h) for h in ("ok", "http_error", "error", "invalid", "missing")]
+    lines = [
+        _result("ok"),
+        _result("http_error", status_code=500),
+        _result("error", error={"code": "server_error"}),
+        _result("invalid", content="not json"),
+        _result("unknown"),
+        "\n",
+    ]
+    summaries = parse_batch_results(contents, lines, MODEL_ID)
+
+    assert [s.content_hash for s in summaries] == ["ok"]
+    summary = summaries[0]
+    assert (summary.sentiment, summary.topic_lemma, summary.method_lemma, summary.contributors) == (True, "build", "fix", ["Ada"])
+    assert summary.log[-1]["role"] == "assistant"
+
+
+def test_response_format_is_strict():
+    response_format = build_response_format(PackedSentimentResponse)
+    schema = response_format["json_schema"]["schema"]
+    assert response_format["json_schema"]["strict"] is True
+    assert schema["additionalProperties"] is False
+    for definition in schema["$defs"].values():
+        assert definition["additionalProperties"] is False
+        assert set(definition["required"]) == set(definition["properties"])
+
+
+class _AnsweringEndpoint(LocalFileBatchEndpoint):
+    """Answers every request of a submitted job right away."""
+
+    def __init__(self, directory):
+        super().__init__(directory)
+        self.submitted = []
+
+    def submit(self, request_file_path):
+        job_id = super().submit(request_file_path)
+        self.submitted.append(job_id)
+        with open(os.path.join(self.directory, job_id, "input.jsonl"), encoding="utf-8") as f:
+            requests = [json.loads(line) for line in f]
+        with open(os.path.join(self.directory, job_id, "output.jsonl"), "w", encoding="utf-8") as f:
+            for request in requests:
+                f.write(_result(request["custom_id"]) + "\n")
+        return job_id
+
+
+def test_process_batch_job(tmp_path):
+    endpoint = _AnsweringEndpoint(str(tmp_path / "jobs"))
+    request_file_path = str(tmp_path / "requests.jsonl")
+    summaries = process_batch_job([_content("a"), _content("b")], endpoint, request_file_path, model=MODEL_ID, poll_interval=0)
+    assert sorted(s.content_hash for s in summaries) == ["a", "b"]
+
+    with open(request_file_path, encoding="utf-8") as f:
+        request = json.loads(f.readline())
+    assert request["body"]["response_format"]["json_schema"]["name"] == "SentimentResponse"
+
+
+def test_empty_batch_job_is_not_submitted(tmp_path):
+    endpoint = _AnsweringEndpoint(str(tmp_path / "jobs"))
+    assert process_batch_job([], endpoint, str(tmp_path / "requests.jsonl"), model=MODEL_ID) == []
+    assert endpoint.submitted == []
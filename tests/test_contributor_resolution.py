@@ -0,0 +1,95 @@
+import random
+
+import pytest
+
+from benchmarks.synthetic_corpus import generate_entities, misspell
+from csa_app.contributor_resolution import (
+    AMBIGUOUS, RESOLVED_EXACT, RESOLVED_SIMILAR, UNRESOLVED, ContributorCatalog, ContributorEntity, normalize_name,
+    read_entities, soundex, write_entities,
+)
+from csa_app.synset_search import trigrams
+
+
+ENTITIES = [
+    ContributorEntity("ent.acme", "Acme Corporation", "a maker of anvils", ("ACME", "Acme Corp")),
+    ContributorEntity("ent.zoe", "Zoë Saldaña", "an actress"),
+    ContributorEntity("ent.jsmith", "John Smith", "a carpenter"),
+    ContributorEntity("ent.jsmith2", "John Smith", "a senator"),
+    ContributorEntity("ent.bank", "The Federal Reserve", "a central bank", ("Fed",)),
+]
+
+
+def test_names_resolve_exactly_similarly_or_ambiguously():
+    catalog = ContributorCatalog(ENTITIES)
+    resolutions = catalog.resolve(["acme corp.", "Zoe Saldana", "Federal Reserve", "John Smith", "Federal Reserv", "", "Quux", "acme corp."])
+
+    assert [(r.method, r.entity_id) for r in resolutions] == [
+        (RESOLVED_EXACT, "ent.acme"),
+        # accents and a leading article are ignored
+        (RESOLVED_EXACT, "ent.zoe"),
+        (RESOLVED_EXACT, "ent.bank"),
+        (AMBIGUOUS, None),
+        (RESOLVED_SIMILAR, "ent.bank"),
+        (UNRESOLVED, None),
+        (UNRESOLVED, None),
+        (RESOLVED_EXACT, "ent.acme"),
+    ]
+    assert [e.id for e in resolutions[3].candidates] == ["ent.jsmith", "ent.jsmith2"]
+    # the misspelling still sounds alike
+    assert resolutions[4].score == 1.0
+
+
+def test_close_candidates_are_left_to_the_llm():
+    catalog = ContributorCatalog(
+        [ContributorEntity("ent.jon", "Jon Smithe"), ContributorEntity("ent.john", "John Smith")], accept_similarity=0.5
+    )
+    (resolution,) = catalog.resolve(["Jon Smith"])
+    assert resolution.method == AMBIGUOUS
+    assert set(e.id for e in resolution.candidates) == {"ent.jon", "ent.john"}
+
+
+def _codes(text):
+    return set(soundex(token) for token in text.split())
+
+
+def _brute_force(catalog, name):
+    # best entity over every alias, without blocking
+    best = {}
+    for entity_index, entity in enumerate(catalog.entities):
+        for alias in set(normalize_name(n) for n in (entity.name,) + entity.aliases):
+            a, b = trigrams(name), trigrams(alias)
+            score = 2 * len(a & b) / (len(a) + len(b))
+            score = min(score + catalog.phonetic_weight * (_codes(name) == _codes(alias)), 1.0)
+            best[entity_index] = max(best.get(entity_index, 0.0), score)
+    return sorted(best.items(), key=lambda item: -item[1])
+
+
+def test_blocking_finds_the_brute_force_matches():
+    rng = random.Random(3)
+    catalog = ContributorCatalog(generate_entities(300, seed=3), chunk_size=16)
+    names = [misspell(rng.choice(catalog.entities).name, rng) for _ in range(150)]
+
+    for name, resolution in zip(names, catalog.resolve(names)):
+        key = normalize_name(name)
+        if key in catalog.exact:
+            continue
+        ranked = _brute_force(catalog, key)
+        (best, score), runner_up = ranked[0], ranked[1][1]
+        if score >= catalog.accept_similarity and score - runner_up >= catalog.margin:
+            assert (resolution.method, resolution.entity_id) == (RESOLVED_SIMILAR, catalog.entities[best].id), name
+        elif score >= catalog.min_similarity:
+            assert resolution.method == AMBIGUOUS and resolution.score == pytest.approx(score), name
+        else:
+            assert resolution.method == UNRESOLVED, name
+
+
+def test_version_follows_the_entities_and_parameters(tmp_path):
+    file_path = str(tmp_path / "catalog.jsonl")
+    write_entities(file_path, ENTITIES)
+    assert read_entities(file_path) == ENTITIES
+
+    version = ContributorCatalog(ENTITIES).version
+    assert ContributorCatalog.load(file_path).version == version
+    assert ContributorCatalog(ENTITIES, margin=0.2).version != version
+    assert ContributorCatalog(ENTITIES[:-1]).version != version
+    assert len(ContributorCatalog.load(file_path)) == len(ENTITIES)
@@ -0,0 +1,58 @@
+import random
+
+import pytest
+from nltk.util import breadth_first
+
+from csa_app.hypernym_index import HypernymClosureIndex, build_from_wordnet
+
+
+def _hypernyms(number=300, seed=1) -> dict:
+    # a DAG where later synsets have one to three hypernyms among the earlier ones
+    rng = random.Random(seed)
+    hypernyms = {"s000.n.01": []}
+    for i in range(1, number):
+        names = sorted(hypernyms)
+        hypernyms[f"s{i:03d}.n.01"] = rng.sample(names, min(len(names), rng.randint(1, 3)))
+    return hypernyms
+
+
+def _closure(hypernyms, synset_id) -> set:
+    # the walk NLTK's Synset.closure does, without the synset itself
+    return set(breadth_first(synset_id, children=lambda s: hypernyms[s])) - {synset_id}
+
+
+def test_is_ancestor_matches_the_closure(tmp_path):
+    hypernyms = _hypernyms()
+    HypernymClosureIndex.build(str(tmp_path / "index"), hypernyms)
+    index = HypernymClosureIndex(str(tmp_path / "index"))
+
+    names = sorted(hypernyms)
+    for synset_id in names[::7]:
+        closure = _closure(hypernyms, synset_id)
+        assert set(index.get_parent_ids(synset_id)) == closure
+        for ancestor_id in names:
+            assert index.is_ancestor(ancestor_id, synset_id) == (ancestor_id in closure), (ancestor_id, synset_id)
+
+
+def test_unknown_hypernyms_are_ignored(tmp_path):
+    HypernymClosureIndex.build(str(tmp_path / "index"), {"a.n.01": ["missing.n.01"], "b.n.01": ["a.n.01"]})
+    index = HypernymClosureIndex(str(tmp_path / "index"))
+    assert "missing.n.01" not in index
+    assert index.get_parent_ids("b.n.01") == ["a.n.01"]
+    assert not index.is_ancestor("b.n.01", "b.n.01")
+
+
+def test_is_ancestor_matches_wordnet(tmp_path):
+    from nltk.corpus import wordnet as wn
+
+    try:
+        wn.ensure_loaded()
+    except LookupError:
+        pytest.skip("the WordNet corpus is not installed")
+    build_from_wordnet(str(tmp_path / "index"))
+    index = HypernymClosureIndex(str(tmp_path / "index"))
+    for synset_id in ["dog.n.01", "bank.n.02", "run.v.01", "entity.n.01", "python.n.01"]:
+        closure = set(s.name() for s in wn.synset(synset_id).closure(lambda s: s.hypernyms()))
+        assert set(index.get_parent_ids(synset_id)) == closure
+        for ancestor_id in ["animal.n.01", "entity.n.01", "institution.n.01", "travel.v.01", "organism.n.01"]:
+            assert index.is_ancestor(ancestor_id, synset_id) == (ancestor_id in closure)
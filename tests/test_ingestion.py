@@ -0,0 +1,59 @@
+import csv
+import gzip
+import json
+
+from csa_app.ingestion import ingest_file, serialize_chunk
+from csa_app.model import create_content_id
+from csa_app.near_duplicates import MinHashLshIndex
+
+
+FIELD_MAPPING = {"body": "content", "author": "author", "written_date_time": "publish_date"}
+ROWS = [
+    {"author": "ada", "content": "The parser release fixed every nested quote we had reported last month", "publish_date": "2024-01-02"},
+    {"author": "bob", "content": "The parser release fixed every nested quote we had reported last month!", "publish_date": "2024-01-03"},
+    {"author": "eve", "content": "Nobody expected the migration to take the whole weekend", "publish_date": "2024-01-04"},
+]
+
+
+def _write_csv(path, rows):
+    with open(path, "w", encoding="utf-8", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=list(rows[0]))
+        writer.writeheader()
+        writer.writerows(rows)
+
+
+def _content(database):
+    with database.connections.connection() as c:
+        return {h: (author, cluster_id) for h, author, cluster_id in c.execute("SELECT content_hash, author, cluster_id FROM content")}
+
+
+def test_ingest_counts_only_inserted_rows(tmp_path, database):
+    path = str(tmp_path / "rows.csv")
+    _write_csv(path, ROWS)
+    assert ingest_file(path, database, FIELD_MAPPING, "twitter", "unknown", workers=1, chunk_rows=2, write_batch_rows=2) == 3
+    assert ingest_file(path, database, FIELD_MAPPING, "twitter", "unknown", workers=1) == 0
+
+    content = _content(database)
+    assert set(content) == {create_content_id(row) for row in ROWS}
+
+
+def test_ingest_compressed_jsonl_with_clusters(tmp_path, database):
+    path = str(tmp_path / "rows.jsonl.gz")
+    with gzip.open(path, "wt", encoding="utf-8") as f:
+        for row in ROWS:
+            f.write(json.dumps(row) + "\n")
+        f.write("\n")
+    index = MinHashLshIndex(db_file_path=database.db_file_path)
+    assert ingest_file(path, database, FIELD_MAPPING, "twitter", "unknown", workers=1, near_duplicate_index=index) == 3
+
+    clusters = {author: cluster_id for author, cluster_id in _content(database).values()}
+    first = create_content_id(ROWS[0])
+    assert clusters == {"ada": first, "bob": first, "eve": create_content_id(ROWS[2])}
+
+
+def test_rows_missing_fields_are_skipped():
+    rows, signatures, skipped = serialize_chunk(ROWS[:1] + [{"author": "x"}], FIELD_MAPPING, "twitter", "unknown")
+    assert (len(rows), signatures, skipped) == (1, None, 1)
+    assert rows[0][0] == create_content_id(ROWS[0])
+    assert rows[0][3] == "twitter"
+    assert rows[0][5:] == (ROWS[0]["publish_date"], "unknown", None)
@@ -0,0 +1,75 @@
+import types
+
+import pytest
+
+from csa_app.metrics import STAGE_EXTRACTION, STAGE_WSD, MetricsRecorder
+
+
+def _usage(prompt, completion, cached=None):
+    details = types.SimpleNamespace(cached_tokens=cached) if cached is not None else None
+    return types.SimpleNamespace(prompt_tokens=prompt, completion_tokens=completion, prompt_tokens_details=details)
+
+
+def test_cost_counts_cached_tokens_at_their_price():
+    metrics = MetricsRecorder(prices={"model": (1.0, 4.0, 0.5)})
+    metrics.record_request(STAGE_EXTRACTION, "model", _usage(1000, 200, cached=600), retries=2)
+    metrics.record_request(STAGE_EXTRACTION, "model", _usage(100, 10))
+    # unpriced models and responses without usage still count as requests
+    metrics.record_request(STAGE_WSD, "other", _usage(100, 10))
+    metrics.record_request(STAGE_WSD, "model", None)
+
+    key = (STAGE_EXTRACTION, "model")
+    assert (metrics.requests[key], metrics.retries[key], metrics.prompt_tokens[key], metrics.cached_tokens[key]) == (2, 2, 1100, 600)
+    assert metrics.cost[key] == pytest.approx((400 * 1.0 + 600 * 0.5 + 200 * 4.0 + 100 * 1.0 + 10 * 4.0) / 1e6)
+    assert metrics.cost[(STAGE_WSD, "other")] == 0.0
+    assert metrics.requests[(STAGE_WSD, "model")] == 1
+
+
+def test_batch_summary_resets_with_the_batch():
+    metrics = MetricsRecorder(prices={"model": (1.0, 1.0, 1.0)})
+    for seconds in range(1, 101):
+        metrics.observe(STAGE_EXTRACTION, seconds / 100, items=2)
+    metrics.record_request(STAGE_WSD, "model", _usage(10, 5), retries=1)
+
+    rows = {row["stage"]: row for row in metrics.batch_summary()}
+    extraction = rows[STAGE_EXTRACTION]
+    assert (extraction["operations"], extraction["items"]) == (100, 200)
+    assert (extraction["p50"], extraction["p99"]) == (pytest.approx(0.505), pytest.approx(0.9901))
+    # a stage with requests but no timed operations still gets its row
+    assert (rows[STAGE_WSD]["operations"], rows[STAGE_WSD]["retries"], rows[STAGE_WSD]["prompt_tokens"]) == (0, 1, 10)
+    assert len(metrics.format_batch_summary().splitlines()) == 3
+
+    metrics.start_batch()
+    assert metrics.batch_summary() == []
+    assert metrics.items[STAGE_EXTRACTION] == 200
+
+
+def test_prometheus_histogram_is_cumulative(tmp_path):
+    metrics = MetricsRecorder(prices={"model": (1.0, 1.0, 1.0)})
+    for seconds in (0.0005, 0.02, 0.02, 200):
+        metrics.observe(STAGE_EXTRACTION, seconds)
+    metrics.record_request(STAGE_EXTRACTION, "model", _usage(3, 4))
+    file_path = str(tmp_path / "metrics.prom")
+    metrics.write_prometheus(file_path)
+
+    with open(file_path, encoding="utf-8") as f:
+        lines = dict(line.rsplit(" ", 1) for line in f.read().splitlines() if not line.startswith("#"))
+    assert lines['csa_stage_latency_seconds_bucket{stage="extraction",le="0.001"}'] == "1"
+    assert lines['csa_stage_latency_seconds_bucket{stage="extraction",le="0.05"}'] == "3"
+    assert lines['csa_stage_latency_seconds_bucket{stage="extraction",le="120"}'] == "3"
+    assert lines['csa_stage_latency_seconds_bucket{stage="extraction",le="+Inf"}'] == "4"
+    assert lines['csa_stage_latency_seconds_count{stage="extraction"}'] == "4"
+    assert lines['csa_llm_tokens_total{stage="extraction",model="model",kind="completion"}'] == "4"
+    assert lines['csa_llm_requests_total{stage="extraction",model="model"}'] == "1"
+
+
+def test_batch_summary_is_stored_per_worker(database):
+    metrics = MetricsRecorder()
+    metrics.observe(STAGE_EXTRACTION, 0.5, items=3)
+    database.add_stage_metrics(metrics.batch_started, "worker-1", metrics.batch_summary())
+    # storing the same batch again replaces its rows
+    database.add_stage_metrics(metrics.batch_started, "worker-1", metrics.batch_summary())
+    with database.connections.connection() as c:
+        assert c.execute("SELECT worker_id, stage, operations, items, p50 FROM stage_metrics").fetchall() == [
+            ("worker-1", STAGE_EXTRACTION, 1, 3, 0.5)
+        ]
@@ -0,0 +1,61 @@
+import json
+
+from csa_app.database import SUMMARY_COLUMNS
+from csa_app.model import ContentBatch, SummaryBatch
+
+
+def _summaries(make_summary):
+    return [
+        make_summary("a", sentiment=True, topic_values=["animal.n.01", "dog.n.01"], contributors=["Ada"], log=[{"role": "user"}]),
+        make_summary("b", sentiment=False, discussion_duration=2.5, contributors_values=["ent.bob"]),
+        make_summary("c", sentiment=None, method_lemma=None, justifications=["calm"]),
+    ]
+
+
+def test_rows_are_in_their_stored_form(make_summary):
+    batch = SummaryBatch.from_summaries(_summaries(make_summary))
+    rows = [dict(zip(SummaryBatch.__slots__, row)) for row in batch.rows()]
+
+    assert len(batch) == 3 and batch.keys()[1] == ("b", "model", "v1")
+    assert [r["sentiment"] for r in rows] == [1, 0, None]
+    assert (rows[0]["topic_values"], rows[0]["contributors"], rows[0]["log"]) == (
+        "animal.n.01! dog.n.01!", json.dumps(["Ada"]), json.dumps([{"role": "user"}])
+    )
+    assert (rows[1]["contributors_values"], rows[1]["discussion_duration"], rows[1]["method_values"]) == ("ent.bob!", 2.5, None)
+    assert (rows[2]["method_lemma"], rows[2]["justifications"]) == (None, '["calm"]')
+    # the slots follow the column order add_summaries inserts into
+    assert [c.strip() for c in SUMMARY_COLUMNS.split(",")][:4] == ["content_hash", "model_id", "prompt_strategy", "sentiment"]
+    assert len(SUMMARY_COLUMNS.split(",")) == len(SummaryBatch.__slots__)
+
+
+def test_select_and_copies_keep_every_column(make_summary):
+    batch = SummaryBatch.from_summaries(_summaries(make_summary))
+    batch.append_copy(1, "b2", discussion_duration=0.0)
+    rows = list(batch.rows())
+    assert rows[3][0] == "b2" and rows[3][6] == 0.0 and rows[3][1:6] == rows[1][1:6] and rows[3][7:] == rows[1][7:]
+
+    selected = batch.select([2, 0])
+    assert list(selected.rows()) == [rows[2], rows[0]]
+    assert selected.sentiment.typecode == "b" and selected.discussion_duration.typecode == "d"
+    assert list(batch.select([]).rows()) == []
+
+
+def test_stored_batches_read_back_as_the_summaries(database, add_content, make_summary):
+    add_content(["a", "b", "c"])
+    database.add_summaries(SummaryBatch.from_summaries(_summaries(make_summary)))
+    with database.connections.connection() as c:
+        stored = c.execute(f"SELECT {SUMMARY_COLUMNS} FROM sentiment_summaries ORDER BY content_hash").fetchall()
+    assert stored == list(SummaryBatch.from_summaries(_summaries(make_summary)).rows())
+
+    contents = database.get_content(["c", "a"])
+    assert sorted(contents.content_hash) == ["a", "c"]
+    content = contents[contents.content_hash.index("a")]
+    assert (content.body, content.raw_details, content.cluster_id) == ("body of a", {"id": "a"}, None)
+    assert [c.content_hash for c in contents] == contents.content_hash
+
+
+def test_content_batch_interns_repeated_strings():
+    rows = [(f"h{i}", "body", "".join(["aut", "hor"]), "forum", "{}", "2024-01-15", "".join(["reg", "ion"]), None) for i in range(2)]
+    batch = ContentBatch.from_rows(rows)
+    assert batch.author[0] is batch.author[1] and batch.region[0] is batch.region[1]
+    assert len(ContentBatch()) == 0
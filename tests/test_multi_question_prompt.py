@@ -0,0 +1,79 @@
+from csa_app.ambiguty_processor import (
+    MultipleChoiceAnswer, MultipleChoiceBatchResponse, MultipleChoiceResponse, SynsetQuestion, extract_synset_ids,
+)
+from csa_app.model import Content
+from csa_app.wse_models import MultiQuestionWsePrompt, SynsetOption, WordSenseEvaluation
+
+
+BANK = [SynsetOption("bank.n.01", "sloping land"), SynsetOption("bank.n.02", "a financial institution")]
+RUN = [SynsetOption("run.v.01", "move fast"), SynsetOption("run.v.02", "operate a business")]
+SYNSETS = {"bank": BANK, "run": RUN, "deposit": [SynsetOption("deposit.n.01", "money in a bank")], "zzz": []}
+
+
+class SynsetDatabase:
+    def get_noun_synsets(self, lemma):
+        return SYNSETS[lemma] if lemma != "run" else []
+
+    def get_verb_synsets(self, lemma):
+        return SYNSETS[lemma] if lemma == "run" else []
+
+
+def _content(content_hash: str, body: str) -> Content:
+    return Content(content_hash, body, "author", "forum", {}, "2024-01-15 10:00:00", "region")
+
+
+def test_answers_map_back_to_their_questions():
+    prompt = MultiQuestionWsePrompt(
+        [
+            WordSenseEvaluation("They run the bank", "bank", BANK),
+            WordSenseEvaluation("They run the bank", "run", RUN),
+            WordSenseEvaluation("A walk by the bank", "bank", BANK),
+        ]
+    )
+    # the shared sentence is stated once
+    assert prompt.sentence_refs == [1, 1, 2]
+    assert prompt.content.count("They run the bank") == 1
+    # out of range numbers, unknown letters and missing questions give None
+    assert prompt.answer([(2, " b"), (1, "Z"), (7, "A"), (0, "A")]) == [None, RUN[1], None]
+    assert prompt.answer([(3, "A"), (1, "B"), (3, "B")]) == [BANK[1], None, BANK[1]]
+
+
+def test_unanswered_questions_are_asked_one_at_a_time():
+    body = "They run the bank and deposit money"
+    questions = [
+        SynsetQuestion(_content("a", body), "bank"),
+        SynsetQuestion(_content("a", body), "deposit"),
+        SynsetQuestion(_content("a", body), "run"),
+        SynsetQuestion(_content("b", "zzz"), "zzz"),
+    ]
+    batch_prompts, single_prompts = [], []
+
+    def ask_batch(prompt):
+        batch_prompts.append(prompt)
+        # question 2 ("run") is left out of the response
+        return MultipleChoiceBatchResponse(answers=[MultipleChoiceAnswer(question=1, letter="B")]), 2.0, "batch"
+
+    def ask_single(prompt):
+        single_prompts.append(prompt)
+        return MultipleChoiceResponse(letter="B"), 1.0, "single"
+
+    results = extract_synset_ids(ask_batch, ask_single, questions, SynsetDatabase())
+    assert results == [
+        ("bank.n.02", 1.0, "batch"),
+        ("deposit.n.01", 0, "Only 1 synset applicable"),
+        ("run.v.02", 1.0, "single"),
+        (None, 0, "No matching synsets"),
+    ]
+    assert len(batch_prompts) == 1 and "Question 2" in batch_prompts[0] and "Question 3" not in batch_prompts[0]
+    assert len(single_prompts) == 1 and '"run"' in single_prompts[0]
+
+
+def test_failed_batch_call_falls_back_to_single_questions():
+    questions = [SynsetQuestion(_content("a", "by the bank"), "bank")]
+    results = extract_synset_ids(
+        lambda prompt: (None, 0, "error"),
+        lambda prompt: (MultipleChoiceResponse(letter="A"), 1.0, "single"),
+        questions,
+        SynsetDatabase(),
+    )
+    assert results == [("bank.n.01", 1.0, "single")]
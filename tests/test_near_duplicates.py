@@ -0,0 +1,59 @@
+import d_01_analyze_content
+from csa_app.model import Content
+from csa_app.near_duplicates import MinHashLshIndex
+
+
+BODY = "the new release of the parser finally handles nested quotes and the build is twice as fast on large files now"
+# the same shingles but for the last two words, an estimated Jaccard similarity of about 0.8
+EDITED_BODY = BODY.rsplit(" ", 2)[0] + " yesterday morning"
+
+
+def _content(content_hash, body, cluster_id=None) -> Content:
+    return Content(content_hash, body, "author", "forum", {}, "2024-01-15 10:00:00", "region", cluster_id)
+
+
+def _assign(index, bodies):
+    contents = [_content(f"h{i}", body) for i, body in enumerate(bodies)]
+    index.assign_clusters(contents)
+    return [c.cluster_id for c in contents]
+
+
+def test_copies_join_the_first_content_of_their_cluster(tmp_path):
+    index = MinHashLshIndex(db_file_path=str(tmp_path / "data.db"))
+    copy = "@someone " + BODY + " https://example.com/post/1 #news"
+    other = "a completely different message about the weather in the mountains this weekend and the traffic"
+    assert _assign(index, [BODY, copy, other, ""]) == ["h0", "h0", "h2", "h3"]
+
+
+def test_similarity_threshold(tmp_path):
+    strict = MinHashLshIndex(db_file_path=str(tmp_path / "strict.db"), threshold=0.95)
+    assert _assign(strict, [BODY, EDITED_BODY]) == ["h0", "h1"]
+    loose = MinHashLshIndex(db_file_path=str(tmp_path / "loose.db"), threshold=0.6)
+    assert _assign(loose, [BODY, EDITED_BODY]) == ["h0", "h0"]
+
+
+def test_clusters_persist_between_runs(tmp_path):
+    _assign(MinHashLshIndex(db_file_path=str(tmp_path / "data.db")), [BODY])
+    later = _content("later", EDITED_BODY)
+    MinHashLshIndex(db_file_path=str(tmp_path / "data.db")).assign_clusters([later])
+    assert later.cluster_id == "h0"
+
+
+def test_cluster_id_content_represents_its_cluster():
+    contents = [_content("m1", "", "rep"), _content("rep", "", "rep"), _content("m2", "", "rep"), _content("solo", "")]
+    representatives, members = d_01_analyze_content.group_by_cluster(contents)
+    assert [c.content_hash for c in representatives] == ["rep", "solo"]
+    assert [c.content_hash for c in members["rep"]] == ["m1", "m2"]
+    assert members["solo"] == []
+
+
+def test_any_analyzed_member_covers_its_cluster(database, add_content, make_summary):
+    add_content(["rep", "m1", "m2"], cluster_id="rep")
+    database.add_summaries([make_summary("m1", topic="shared")])
+
+    contents = list(database.get_content(["rep", "m2"]))
+    assert database.fan_out_cluster_summaries(contents) == {"rep", "m2"}
+    with database.connections.connection() as c:
+        assert dict(c.execute("SELECT content_hash, topic FROM sentiment_summaries").fetchall()) == {
+            "rep": "shared", "m1": "shared", "m2": "shared",
+        }
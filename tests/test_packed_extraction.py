@@ -0,0 +1,71 @@
+from csa_app.ai_processor_openai import (
+    PackedSentimentItem, PackedSentimentResponse, _lookup_cached_summary, build_sentiment_messages, pack_contents,
+    parse_packed_response,
+)
+from csa_app.model import Content
+from csa_app.rate_limiting import estimate_tokens
+from csa_app.response_cache import ResponseCacheSqlLite
+
+
+def _content(content_hash: str, body: str) -> Content:
+    return Content(content_hash, body, "author", "forum", {}, "2024-01-15 10:00:00", "region")
+
+
+def _item(content_id: str, topic: str, sentiment: str = "positive") -> PackedSentimentItem:
+    return PackedSentimentItem(
+        content_id=content_id,
+        justifications_of_sentiment=["because"],
+        sentiment=sentiment,
+        names_of_contributors_that_cause_sentiment=["Ada"],
+        actions_causing_sentiment="ran",
+        action_lemma="run",
+        action_tense="past",
+        topic=topic,
+        topic_lemma=topic,
+        lat_lng_of_topic_location=None,
+        datetime_of_topic=None,
+    )
+
+
+CONTENTS = [_content("a", "short"), _content("b", "a much longer body " * 20), _content("c", "third"), _content("d", "fourth")]
+
+
+def test_items_are_matched_back_by_id(tmp_path):
+    cache = ResponseCacheSqlLite(str(tmp_path / "cache.db"))
+    response = PackedSentimentResponse(
+        items=[
+            _item(" 2", "second", "negative"),
+            _item("1", "first"),
+            # duplicated and unknown ids are not trusted
+            _item("3", "third"),
+            _item("3", "third again"),
+            _item("9", "unknown"),
+        ]
+    )
+    summaries = parse_packed_response(CONTENTS, response, "model", 10.0, cache)
+
+    assert [s.topic if s is not None else None for s in summaries] == ["first", "second", None, None]
+    assert (summaries[0].content_hash, summaries[1].content_hash, summaries[1].sentiment) == ("a", "b", False)
+    # the duration is split by prompt share over all packed contents
+    weights = [estimate_tokens([{"content": c.body}]) + 1 for c in CONTENTS]
+    assert summaries[1].discussion_duration == 10.0 * weights[1] / sum(weights)
+    assert summaries[1].discussion_duration > 5 * summaries[0].discussion_duration
+    # a later single record call hits the cache
+    cached = _lookup_cached_summary(cache, CONTENTS[1], "model", build_sentiment_messages(CONTENTS[1]))
+    assert (cached.topic, cached.discussion_duration) == ("second", 0)
+    assert _lookup_cached_summary(cache, CONTENTS[2], "model", build_sentiment_messages(CONTENTS[2])) is None
+
+
+def test_missing_response_leaves_every_content_open():
+    assert parse_packed_response(CONTENTS, None, "model", 1.0) == [None] * 4
+
+
+def test_packs_respect_the_record_and_token_limits():
+    contents = [_content(str(i), "word " * 10) for i in range(10)]
+    assert [len(p) for p in pack_contents(contents, max_records=4)] == [4, 4, 2]
+    # the expected output bounds the records per pack too
+    assert [len(p) for p in pack_contents(contents, max_records=8, max_output_tokens=900)] == [3, 3, 3, 1]
+    # a content over the input budget is packed alone
+    long = _content("long", "word " * 4000)
+    packs = pack_contents(contents[:2] + [long] + contents[2:4], max_input_tokens=200)
+    assert [[c.content_hash for c in p] for p in packs] == [["0", "1"], ["long"], ["2", "3"]]
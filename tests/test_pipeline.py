@@ -0,0 +1,136 @@
+import asyncio
+import concurrent.futures
+import contextlib
+import functools
+import io
+import json
+import threading
+import warnings
+
+import openai
+import pytest
+
+import csa_app.ai_processor_openai as ai_processor
+import d_01_analyze_content as analyzer
+from benchmarks import synthetic_corpus
+from benchmarks.mock_llm_server import MockLlmServer
+from csa_app.hypernym_index import HypernymClosureIndex
+from csa_app.metrics import MetricsRecorder
+from csa_app.model import convert_to_id
+from csa_app.pipeline import GroupCommitWriter, PipelineStage, StagePipeline
+
+
+def test_a_failing_item_or_group_fails_alone():
+    written, errors = [], []
+    threads = set()
+
+    def flush(items):
+        threads.add(threading.get_ident())
+        if 13 in items:
+            raise RuntimeError("disk full")
+        written.extend(items)
+
+    async def double(item):
+        if item == 4:
+            raise ValueError("bad item")
+        return [item * 2, item * 2 + 1]
+
+    executor = concurrent.futures.ThreadPoolExecutor(2)
+    pipeline = StagePipeline(
+        [
+            PipelineStage("double", double, concurrency=3, many=True),
+            # drops the items for which it returns None
+            PipelineStage("filter", lambda item: item if item != 3 else None),
+            PipelineStage("identity", lambda item: item, executor=executor),
+        ],
+        GroupCommitWriter(flush, max_items=2, max_seconds=60),
+        queue_size=2,
+        on_error=lambda stage, item, e: errors.append((stage, item, type(e))),
+    )
+    with executor:
+        asyncio.run(pipeline.run(range(10)))
+
+    failed_group = [e for e in errors if e[0] == "write"]
+    assert [e for e in errors if e[0] != "write"] == [("double", 4, ValueError)]
+    assert len(failed_group) == 1 and 13 in failed_group[0][1] and failed_group[0][2] is RuntimeError
+    # every other item reached the writer
+    expected = {i for i in range(20) if i not in (8, 9, 3)}
+    assert set(written) | set(failed_group[0][1]) == expected and len(written) == len(expected) - len(failed_group[0][1])
+    assert len(threads) == 1
+
+    stats = pipeline.stats()
+    assert stats["double"] == {"processed": 9, "failed": 1, "busy_seconds": stats["double"]["busy_seconds"]}
+    assert stats["filter"]["processed"] == 18
+    assert (stats["writer"]["items"], stats["writer"]["failed"]) == (len(written), len(failed_group[0][1]))
+
+
+def test_groups_are_flushed_after_max_seconds():
+    flushed = []
+
+    async def source():
+        for item in range(3):
+            yield item
+            # longer than the writer waits for a group to fill up
+            await asyncio.sleep(0.2)
+
+    writer = GroupCommitWriter(lambda items: flushed.append(list(items)), max_items=100, max_seconds=0.05)
+    asyncio.run(StagePipeline([], writer).run(source()))
+    assert flushed == [[0], [1], [2]]
+
+
+@pytest.fixture
+def mock_llm():
+    server = MockLlmServer(latency=0.01, latency_jitter=0.01, error_rate=0.0, seed=1).start()
+    yield server
+    server.shutdown()
+
+
+@pytest.mark.parametrize("use_work_queue", [False, True])
+def test_pipelined_analysis_extracts_each_content_once(tmp_path, database, mock_llm, monkeypatch, use_work_queue):
+    HypernymClosureIndex.build(str(tmp_path / "index"), synthetic_corpus.generate_hypernyms(200, 1))
+    synset_database = synthetic_corpus.SyntheticSynsetDatabase(HypernymClosureIndex(str(tmp_path / "index")))
+    corpus = list(synthetic_corpus.generate_rows(40, 2, duplicate_rate=0.0))
+    database.add_content_rows(
+        [
+            (convert_to_id(json.dumps(r, sort_keys=True)), r["content"], r["author"], "twitter", json.dumps(r, sort_keys=True), r["publish_date"], "US", None)
+            for r in corpus
+        ]
+    )
+
+    aclient = openai.AsyncOpenAI(base_url=mock_llm.base_url, api_key="mock", max_retries=0)
+    metrics = MetricsRecorder()
+    model_id = analyzer.model_id
+    for name, value in {
+        "metrics": metrics,
+        "metrics_prometheus_file_path": None,
+        "processor": functools.partial(ai_processor.process_async, model=model_id, aclient=aclient, metrics=metrics),
+        "packed_processor": functools.partial(ai_processor.process_packed_async, model=model_id, aclient=aclient, metrics=metrics),
+        "ambiguity_clarifier": functools.partial(ai_processor.process_multiple_choice_prompt_async, model=model_id, aclient=aclient, metrics=metrics),
+        "batch_ambiguity_clarifier": functools.partial(ai_processor.process_multiple_choice_batch_prompt_async, model=model_id, aclient=aclient, metrics=metrics),
+        "contributor_catalog": None,
+        "batch_size": 10,
+        "max_number_of_batches": 10,
+        "use_work_queue": use_work_queue,
+        # every batch is fetched long before the first group is written
+        "write_max_seconds": 60,
+    }.items():
+        monkeypatch.setattr(analyzer, name, value)
+    if use_work_queue:
+        database.enqueue_content(model_id, analyzer.prompt_strategy)
+
+    async def analyze():
+        try:
+            await analyzer.analyze_pipelined(database, synset_database)
+        finally:
+            await aclient.close()
+
+    out = io.StringIO()
+    with contextlib.redirect_stdout(out), warnings.catch_warnings():
+        warnings.simplefilter("ignore", UserWarning)
+        asyncio.run(analyze())
+
+    assert "Failed" not in out.getvalue()
+    with database.connections.connection() as c:
+        assert c.execute("SELECT COUNT(DISTINCT content_hash), COUNT(*) FROM sentiment_summaries").fetchone() == (40, 40)
+    # no content was sent for extraction twice
+    assert metrics.items["extraction"] == 40
@@ -0,0 +1,73 @@
+import glob
+import os
+import time
+import tracemalloc
+
+from csa_app.profiling import PROFILE_DIRECTORY_ENV, Profiler, SamplingProfiler, profiler_from_env
+
+
+def _busy(seconds: float) -> list:
+    blocks = []
+    end = time.perf_counter() + seconds
+    while time.perf_counter() < end:
+        blocks.append(bytearray(1000))
+    return blocks
+
+
+def test_disabled_profiler_costs_nothing(tmp_path, monkeypatch):
+    monkeypatch.delenv(PROFILE_DIRECTORY_ENV, raising=False)
+    profiler = profiler_from_env()
+    assert not profiler.enabled
+    assert profiler.wrap()(_busy) is _busy
+    with profiler.profile("batch"):
+        assert not tracemalloc.is_tracing()
+
+    monkeypatch.setenv(PROFILE_DIRECTORY_ENV, str(tmp_path / "profiles"))
+    assert profiler_from_env().directory == str(tmp_path / "profiles")
+    assert os.path.isdir(tmp_path / "profiles")
+
+
+def test_profile_writes_cpu_and_allocation_reports(tmp_path):
+    profiler = Profiler(str(tmp_path), interval=0.001)
+    wrapped = profiler.wrap("busy batch")(_busy)
+    assert wrapped.__name__ == "_busy"
+    wrapped(0.2)
+    assert not tracemalloc.is_tracing()
+
+    (report,) = glob.glob(str(tmp_path / "busy_batch-*.txt"))
+    (collapsed,) = glob.glob(str(tmp_path / "busy_batch-*.collapsed"))
+    with open(report, encoding="utf-8") as f:
+        text = f.read()
+    assert text.startswith("busy batch: ") and "test_profiling.py:_busy:" in text
+    assert 'test_profiling.py", line' in text.split("Top 25 allocations")[1]
+    with open(collapsed, encoding="utf-8") as f:
+        stacks = f.read().splitlines()
+    assert len(stacks) > 0 and all(line.rsplit(" ", 1)[1].isdigit() for line in stacks)
+    assert any(line.rsplit(" ", 1)[0].endswith("_busy:" + str(_busy.__code__.co_firstlineno)) for line in stacks)
+
+
+def test_nested_profiles_share_allocation_tracing(tmp_path):
+    profiler = Profiler(str(tmp_path), interval=0.001)
+    with profiler.profile("outer"):
+        with profiler.profile("inner"):
+            _busy(0.01)
+        assert tracemalloc.is_tracing()
+    assert not tracemalloc.is_tracing()
+    assert len(glob.glob(str(tmp_path / "*.txt"))) == 2
+
+    # tracing started by someone else is left running
+    tracemalloc.start()
+    try:
+        with profiler.profile("traced"):
+            pass
+        assert tracemalloc.is_tracing()
+    finally:
+        tracemalloc.stop()
+
+
+def test_top_functions_count_self_and_cumulative_samples():
+    sampler = SamplingProfiler(0)
+    sampler.stacks.update({("main", "load", "parse"): 3, ("main", "load"): 1, ("main", "write"): 2})
+    sampler.samples = 6
+    assert sampler.top_functions(3) == [("main", 0, 6), ("load", 1, 4), ("parse", 3, 3)]
+    assert sampler.collapsed().splitlines()[0] == "main;load;parse 3"
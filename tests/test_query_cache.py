@@ -0,0 +1,55 @@
+from csa_app.query_cache import QueryResultCache
+
+
+class _Compute:
+    def __init__(self, value):
+        self.value = value
+        self.calls = 0
+
+    def __call__(self):
+        self.calls += 1
+        return self.value
+
+
+def _keys(cache):
+    with cache.connections.connection() as c:
+        return dict(c.execute("SELECT cache_key, generation FROM query_results").fetchall())
+
+
+def test_hits_until_the_generation_changes(tmp_path):
+    cache = QueryResultCache(str(tmp_path / "cache.db"))
+    compute = _Compute({"rows": [1, 2]})
+    assert cache.get_or_compute(("counts", "topic"), 1, compute) == {"rows": [1, 2]}
+    assert cache.get_or_compute(("counts", "topic"), 1, compute) == {"rows": [1, 2]}
+    assert compute.calls == 1
+    assert cache.stats()["hits"] == 1
+
+    assert cache.get_or_compute(("counts", "topic"), 2, compute) == {"rows": [1, 2]}
+    assert compute.calls == 2
+
+
+def test_newer_generation_evicts_older_entries(tmp_path):
+    cache = QueryResultCache(str(tmp_path / "cache.db"))
+    cache.get_or_compute(("a",), 1, _Compute(1))
+    cache.get_or_compute(("b",), 2, _Compute(2))
+    assert list(_keys(cache).values()) == [2]
+
+
+def test_stale_worker_keeps_newer_entries(tmp_path):
+    path = str(tmp_path / "cache.db")
+    current, stale = QueryResultCache(path), QueryResultCache(path)
+    current.get_or_compute(("a",), 2, _Compute("new"))
+
+    assert stale.get_or_compute(("a",), 1, _Compute("old")) == "old"
+    assert stale.get_or_compute(("b",), 1, _Compute("old")) == "old"
+    assert _keys(current) == {'["a"]': 2}
+    assert current.get_or_compute(("a",), 2, _Compute("recomputed")) == "new"
+
+
+def test_least_recently_used_entries_are_evicted(tmp_path):
+    cache = QueryResultCache(str(tmp_path / "cache.db"), max_entries=2)
+    cache.get_or_compute(("a",), 1, _Compute(1))
+    cache.get_or_compute(("b",), 1, _Compute(2))
+    cache.get_or_compute(("a",), 1, _Compute(1))
+    cache.get_or_compute(("c",), 1, _Compute(3))
+    assert set(_keys(cache)) == {'["a"]', '["c"]'}
@@ -0,0 +1,125 @@
+import asyncio
+import types
+
+import openai
+import pytest
+
+from csa_app import rate_limiting
+from csa_app.rate_limiting import AsyncRateLimiter, call_with_retry, is_retryable
+
+
+class _Clock:
+    """Stands in for time and asyncio.sleep in rate_limiting, sleeping advances it."""
+
+    def __init__(self):
+        self.now = 0.0
+        self.slept = []
+
+    def monotonic(self) -> float:
+        return self.now
+
+    async def sleep(self, delay: float):
+        self.slept.append(delay)
+        self.now += delay
+        await asyncio.sleep(0)
+
+
+@pytest.fixture
+def clock(monkeypatch) -> _Clock:
+    clock = _Clock()
+    monkeypatch.setattr(rate_limiting, "time", clock)
+    monkeypatch.setattr(
+        rate_limiting, "asyncio", types.SimpleNamespace(Semaphore=asyncio.Semaphore, Lock=asyncio.Lock, sleep=clock.sleep)
+    )
+    return clock
+
+
+def _status_error(status_code: int, headers=None) -> openai.APIStatusError:
+    # the parts of an HTTP response APIStatusError and call_with_retry read
+    response = types.SimpleNamespace(status_code=status_code, headers=headers or {}, request=None)
+    return openai.APIStatusError(f"status {status_code}", response=response, body=None)
+
+
+def test_requests_per_minute_wait(clock):
+    async def run():
+        limiter = AsyncRateLimiter(max_concurrency=10, requests_per_minute=2)
+        for _ in range(3):
+            await limiter.acquire()
+            limiter.release()
+
+    asyncio.run(run())
+    # the bucket starts full, the third request waits for one refill
+    assert sum(clock.slept) == pytest.approx(30.0)
+
+
+def test_tokens_per_minute_wait_and_reconciliation(clock):
+    async def run():
+        limiter = AsyncRateLimiter(max_concurrency=10, tokens_per_minute=1000)
+        await limiter.acquire(800)
+        limiter.release(800, used_tokens=800)
+        await limiter.acquire(800)
+        limiter.release(800, used_tokens=200)
+        return limiter
+
+    limiter = asyncio.run(run())
+    assert sum(clock.slept) == pytest.approx(36.0)
+    # the unused estimate was given back
+    assert limiter.tokens.level == pytest.approx(600.0)
+
+
+def test_concurrency_is_bounded(clock):
+    async def run():
+        limiter = AsyncRateLimiter(max_concurrency=1)
+        await limiter.acquire()
+        waiting = asyncio.ensure_future(limiter.acquire())
+        await asyncio.sleep(0)
+        blocked = not waiting.done()
+        limiter.release()
+        await waiting
+        limiter.release()
+        return blocked
+
+    assert asyncio.run(run())
+
+
+def test_retries_rate_limits_and_server_errors(clock):
+    errors = [_status_error(429, {"retry-after": "7"}), _status_error(503)]
+
+    async def request():
+        if errors:
+            raise errors.pop(0)
+        return "result"
+
+    result, retries = asyncio.run(call_with_retry(request, AsyncRateLimiter(requests_per_minute=100), base_delay=0.5))
+    assert (result, retries) == ("result", 2)
+    # the first backoff honors retry-after
+    assert clock.slept[0] >= 7
+
+
+def test_client_errors_are_not_retried(clock):
+    calls = []
+
+    async def request():
+        calls.append(1)
+        raise _status_error(400)
+
+    with pytest.raises(openai.APIStatusError):
+        asyncio.run(call_with_retry(request))
+    assert len(calls) == 1
+    assert clock.slept == []
+
+
+def test_retries_are_bounded(clock):
+    async def request():
+        raise _status_error(500)
+
+    with pytest.raises(openai.APIStatusError):
+        asyncio.run(call_with_retry(request, max_retries=2))
+    assert len(clock.slept) == 2
+
+
+def test_retryable_errors():
+    assert is_retryable(_status_error(429))
+    assert is_retryable(_status_error(502))
+    assert not is_retryable(_status_error(401))
+    assert not is_retryable(ValueError("parse error"))
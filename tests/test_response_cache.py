@@ -0,0 +1,70 @@
+import types
+
+import pytest
+
+from csa_app import response_cache
+from csa_app.response_cache import ResponseCacheSqlLite
+
+
+MESSAGES = [{"role": "system", "content": "Extract the sentiment."}, {"role": "user", "content": "I  like\nit"}]
+
+
+@pytest.fixture
+def clock(monkeypatch) -> list:
+    now = [1000.0]
+    monkeypatch.setattr(response_cache, "time", types.SimpleNamespace(time=lambda: now[0]))
+    return now
+
+
+def _messages(body):
+    return [MESSAGES[0], {"role": "user", "content": body}]
+
+
+def _last_accessed(cache) -> dict:
+    with cache.connections.connection() as c:
+        return dict(c.execute("SELECT response, last_accessed FROM llm_responses").fetchall())
+
+
+def test_hits_on_normalized_messages(tmp_path, clock):
+    cache = ResponseCacheSqlLite(str(tmp_path / "cache.db"))
+    assert cache.get("model", "v1", MESSAGES) is None
+    cache.put("model", "v1", MESSAGES, {"parsed": {"sentiment": "positive"}})
+
+    assert cache.get("model", "v1", _messages(" I like it ")) == {"parsed": {"sentiment": "positive"}}
+    assert cache.get("other-model", "v1", MESSAGES) is None
+    assert cache.get("model", "v2", MESSAGES) is None
+    assert cache.stats()["hits"] == 1
+    assert cache.stats()["misses"] == 3
+
+
+def test_hits_do_not_write_until_flushed(tmp_path, clock):
+    cache = ResponseCacheSqlLite(str(tmp_path / "cache.db"), access_flush_size=2)
+    cache.put("model", "v1", _messages("a"), "a")
+    cache.put("model", "v1", _messages("b"), "b")
+    clock[0] += 10
+    cache.get("model", "v1", _messages("a"))
+    assert _last_accessed(cache) == {'"a"': 1000.0, '"b"': 1000.0}
+
+    cache.get("model", "v1", _messages("b"))
+    assert _last_accessed(cache) == {'"a"': 1010.0, '"b"': 1010.0}
+
+
+def test_expired_entries_miss_and_are_evicted(tmp_path, clock):
+    cache = ResponseCacheSqlLite(str(tmp_path / "cache.db"), max_age_seconds=60)
+    cache.put("model", "v1", MESSAGES, "old")
+    clock[0] += 61
+    assert cache.get("model", "v1", MESSAGES) is None
+    cache.evict()
+    assert _last_accessed(cache) == {}
+
+
+def test_least_recently_used_entries_are_evicted(tmp_path, clock):
+    cache = ResponseCacheSqlLite(str(tmp_path / "cache.db"), max_entries=2, eviction_interval=3)
+    for body in ("a", "b"):
+        cache.put("model", "v1", _messages(body), body)
+        clock[0] += 1
+    # the pending access of "a" is flushed before evicting
+    assert cache.get("model", "v1", _messages("a")) == "a"
+    clock[0] += 1
+    cache.put("model", "v1", _messages("c"), "c")
+    assert set(_last_accessed(cache)) == {'"a"', '"c"'}
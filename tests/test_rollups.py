@@ -0,0 +1,124 @@
+import sqlite3
+
+import pandas as pd
+import pytest
+
+from csa_app.database import DatabaseSqlLite
+from csa_app.model import StageResult
+
+
+MODEL_ID = "model"
+PROMPT_STRATEGY = "v1"
+
+# the last "id!" entry of a *_values column, the resolved synset
+LAST_VALUE = "rtrim(substr({0}, length(rtrim({0}, replace({0}, ' ', ''))) + 1), '!')"
+
+# the aggregates the rollups replaced, computed from the summaries themselves
+REFERENCE_SQL = {
+    "sentiment": """SELECT '', s.sentiment, COUNT(*) FROM sentiment_summaries s
+        JOIN content c ON c.content_hash = s.content_hash WHERE c.written_date_time >= ? GROUP BY 1, 2""",
+    "topic": f"""SELECT {LAST_VALUE.format('s.topic_values')}, s.sentiment, COUNT(*) FROM sentiment_summaries s
+        JOIN content c ON c.content_hash = s.content_hash
+        WHERE c.written_date_time >= ? AND s.topic_values IS NOT NULL AND s.topic_values != '' GROUP BY 1, 2""",
+    "method": f"""SELECT {LAST_VALUE.format('s.method_values')}, s.sentiment, COUNT(*) FROM sentiment_summaries s
+        JOIN content c ON c.content_hash = s.content_hash
+        WHERE c.written_date_time >= ? AND s.method_values IS NOT NULL AND s.method_values != '' GROUP BY 1, 2""",
+    "unresolved_topic": """SELECT s.topic_lemma_id, s.sentiment, COUNT(*) FROM sentiment_summaries s
+        JOIN content c ON c.content_hash = s.content_hash
+        WHERE c.written_date_time >= ? AND (s.topic_values IS NULL OR s.topic_values = '') GROUP BY 1, 2""",
+    "unresolved_method": """SELECT s.method_lemma_id, s.sentiment, COUNT(*) FROM sentiment_summaries s
+        JOIN content c ON c.content_hash = s.content_hash
+        WHERE c.written_date_time >= ? AND (s.method_values IS NULL OR s.method_values = '') GROUP BY 1, 2""",
+    "contributor": """SELECT y.synset_id, s.sentiment, COUNT(*) FROM sentiment_summaries s
+        JOIN content c ON c.content_hash = s.content_hash
+        JOIN summary_synsets y ON y.content_hash = s.content_hash AND y.model_id = s.model_id
+            AND y.prompt_strategy = s.prompt_strategy AND y.role = 'contributor'
+        WHERE c.written_date_time >= ? GROUP BY 1, 2""",
+    "unresolved_contributor": """SELECT j.value, s.sentiment, COUNT(DISTINCT s.content_hash) FROM sentiment_summaries s
+        JOIN content c ON c.content_hash = s.content_hash, json_each(s.contributors) j
+        WHERE c.written_date_time >= ? AND s.contributors_values IS NULL GROUP BY 1, 2""",
+}
+
+
+def _store(database, add_content, make_summary):
+    add_content(["a", "b"], forum="reddit", written_date_time="2024-01-10 08:00:00")
+    add_content(["c", "d", "e"], forum="twitter", written_date_time="2024-02-10 08:00:00")
+    database.add_summaries(
+        [
+            make_summary("a", topic_values=["animal.n.01", "dog.n.01"], method_values=["run.v.01"],
+                         contributors=["Ada"], contributors_values=["ent.ada"]),
+            make_summary("b", topic_values=["animal.n.01", "cat.n.01"], sentiment=False,
+                         contributors=["Bob", "Bobby"]),
+            make_summary("c", topic_values=["dog.n.01"], method_lemma="walk", sentiment=None,
+                         contributors=["Ada", "Bob"], contributors_values=["ent.ada", "ent.bob"]),
+            make_summary("d", topic_lemma="bird", contributors=["Bob"]),
+            make_summary("e", topic_values=["cat.n.01"], method_values=["run.v.01"], sentiment=False),
+        ]
+    )
+
+
+def _counts(df, dimension) -> dict:
+    # pandas turns the None of neutral summaries into NaN next to 0 and 1
+    return {
+        ("" if dimension == "sentiment" else row[dimension], None if pd.isna(row["sentiment"]) else int(row["sentiment"])): int(row["Count"])
+        for _, row in df.iterrows()
+    }
+
+
+def _reference(database, dimension, since="") -> dict:
+    with database.connections.connection() as c:
+        return {(value, sentiment): count for value, sentiment, count in c.execute(REFERENCE_SQL[dimension], (since,))}
+
+
+def _assert_rollups_match(database):
+    for dimension in REFERENCE_SQL:
+        assert _counts(database.lookup_sentiment_counts(dimension), dimension) == _reference(database, dimension), dimension
+        assert _counts(
+            database.lookup_sentiment_counts(dimension, start_content_datetime="2024-02-01"), dimension
+        ) == _reference(database, dimension, "2024-02-01"), dimension
+
+
+def test_rollups_match_the_summaries(database, add_content, make_summary):
+    _store(database, add_content, make_summary)
+    _assert_rollups_match(database)
+    # unresolved lemmas stay out of the resolved dimensions
+    assert "walk" not in set(database.lookup_sentiment_counts("method")["method"])
+    assert _counts(database.lookup_sentiment_counts("unresolved_method"), "unresolved_method")[("walk", None)] == 1
+
+
+def test_synset_filtered_counts_match_the_rollup_path(database, add_content, make_summary):
+    _store(database, add_content, make_summary)
+    counts = _counts(database.lookup_sentiment_counts("contributor", topic_id="dog.n.01"), "contributor")
+    assert counts == {("ent.ada", True): 1, ("ent.ada", None): 1, ("ent.bob", None): 1}
+    with pytest.raises(ValueError):
+        database.lookup_sentiment_counts("region")
+
+
+def test_rollups_follow_stage_updates(database, add_content, make_summary):
+    _store(database, add_content, make_summary)
+    database.update_stage_results(
+        [
+            StageResult("a", MODEL_ID, PROMPT_STRATEGY, "cat.n.01", ["animal.n.01", "cat.n.01"], None, None, 2, 2),
+            StageResult("d", MODEL_ID, PROMPT_STRATEGY, "bird.n.01", ["bird.n.01"], None, None, 2, 2),
+        ]
+    )
+    _assert_rollups_match(database)
+    assert _counts(database.lookup_sentiment_counts("topic"), "topic")[("cat.n.01", True)] == 1
+    assert "bird" not in set(database.lookup_sentiment_counts("unresolved_topic")["unresolved_topic"])
+
+
+def test_migration_rebuilds_the_rollups(database, add_content, make_summary):
+    _store(database, add_content, make_summary)
+    with database.connections.connection() as c:
+        expected = c.execute("SELECT * FROM sentiment_rollups ORDER BY 1, 2, 3, 4, 5, 6").fetchall()
+    # a database written before contributors were counted by entity
+    raw = sqlite3.connect(database.db_file_path)
+    raw.execute("DELETE FROM sentiment_rollups")
+    raw.execute("PRAGMA user_version = 3")
+    raw.commit()
+    raw.close()
+
+    migrated = DatabaseSqlLite(database.db_file_path)
+    with migrated.connections.connection() as c:
+        assert c.execute("SELECT * FROM sentiment_rollups ORDER BY 1, 2, 3, 4, 5, 6").fetchall() == expected
+    _assert_rollups_match(migrated)
@@ -0,0 +1,74 @@
+from csa_app.ambiguty_processor import MultipleChoiceResponse, extract_synset_id
+from csa_app.model import Content
+from csa_app.sense_ranking import LexicalSenseRanker
+from csa_app.wse_models import SynsetOption
+
+
+OPTIONS = [
+    SynsetOption("bank.n.01", "sloping land beside a river or lake"),
+    SynsetOption("bank.n.02", "a financial institution that accepts deposits and lends money"),
+    SynsetOption("bank.n.03", "a long ridge or pile of snow"),
+]
+
+
+class SynsetDatabase:
+    def get_noun_synsets(self, lemma):
+        return OPTIONS
+
+    def get_verb_synsets(self, lemma):
+        return []
+
+
+def _content(body: str) -> Content:
+    return Content("hash", body, "author", "forum", {}, "2024-01-15 10:00:00", "region")
+
+
+def test_dominant_sense_skips_the_llm():
+    ranker = LexicalSenseRanker(margin=0.15, audit_rate=0.0)
+    calls = []
+    result = extract_synset_id(
+        lambda prompt: calls.append(prompt),
+        _content("The bank lends money against deposits at a fair rate"),
+        "bank",
+        SynsetDatabase(),
+        ranker=ranker,
+    )
+    assert result == ("bank.n.02", 0, "Lexically dominant synset")
+    assert calls == []
+    assert ranker.stats()["skipped"] == 1
+
+
+def test_close_scores_go_to_the_llm_with_the_top_k():
+    # "river" and "snow" both overlap, neither sense dominates
+    ranker = LexicalSenseRanker(top_k=2, margin=0.15, audit_rate=0.0)
+    prompts = []
+
+    def ask(prompt):
+        prompts.append(prompt)
+        return MultipleChoiceResponse(letter="B"), 1.5, "message"
+
+    result = extract_synset_id(ask, _content("Snow piled up on the river"), "bank", SynsetDatabase(), ranker=ranker)
+    assert len(prompts) == 1
+    # the pruned options keep WordNet's order, so B is the snow sense
+    assert "A) sloping land" in prompts[0] and "B) a long ridge" in prompts[0] and "financial" not in prompts[0]
+    assert result == ("bank.n.03", 1.5, "message")
+    stats = ranker.stats()
+    # the snow sense was also the lexical favourite
+    assert (stats["skipped"], stats["pruned_options"], stats["agreement"]) == (0, 1, 1.0)
+
+
+def test_margin_decides_the_shortcut():
+    context = "The bank lends money against deposits near the river"
+    scores = LexicalSenseRanker().scores(context, [o.gloss for o in OPTIONS])
+    gap = scores[1] - scores[0]
+    assert 0 < gap
+    assert LexicalSenseRanker(margin=gap - 1e-9, audit_rate=0.0).rank(context, OPTIONS).skip
+    assert not LexicalSenseRanker(margin=gap + 1e-9, audit_rate=0.0).rank(context, OPTIONS).skip
+
+
+def test_audited_skips_are_asked_and_scored():
+    ranker = LexicalSenseRanker(audit_rate=1.0, seed=1)
+    ranking = ranker.rank("The bank lends money against deposits", OPTIONS)
+    assert (ranking.skip, ranking.audit, ranking.best.id) == (False, True, "bank.n.02")
+    ranker.record_llm_choice(ranking, "bank.n.02")
+    assert ranker.stats()["audits"] == 1 and ranker.stats()["skip_agreement"] == 1.0
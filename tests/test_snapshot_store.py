@@ -0,0 +1,107 @@
+import json
+import os
+import shutil
+
+from csa_app.model import StageResult
+from csa_app.snapshot_store import REWRITE_JOURNAL_FILE, ParquetSnapshotStore
+
+
+MODEL_ID = "model"
+PROMPT_STRATEGY = "v1"
+
+
+def _stage_result(content_hash, synset_id) -> StageResult:
+    return StageResult(content_hash, MODEL_ID, PROMPT_STRATEGY, synset_id, [synset_id], None, None, 2, 1)
+
+
+def _snapshot(database, add_content, make_summary):
+    add_content(["a1", "a2"], forum="alpha", written_date_time="2024-01-15 10:00:00")
+    add_content(["a3"], forum="alpha", written_date_time="2024-02-15 10:00:00")
+    add_content(["b1"], forum="beta", written_date_time="2024-01-20 10:00:00")
+    database.add_summaries([make_summary(h) for h in ("a1", "a2", "a3", "b1")])
+
+
+def _rows(store) -> dict:
+    table = store.read_table(columns=["content_hash", "topic_synset_id", "wsd_version", "forum", "month"])
+    rows = table.to_pylist()
+    assert len(rows) == len(set(r["content_hash"] for r in rows))
+    return {r["content_hash"]: r for r in rows}
+
+
+def _partition_files(store, forum, month):
+    directory = os.path.join(store.root_dir, f"forum={forum}", f"month={month}")
+    return sorted(name for name in os.listdir(directory) if not name.startswith("_"))
+
+
+def test_export_appends_new_summaries(tmp_path, database, add_content, make_summary):
+    _snapshot(database, add_content, make_summary)
+    store = ParquetSnapshotStore(str(tmp_path / "snapshots"))
+    assert store.export(database) == 4
+    assert store.export(database) == 0
+
+    add_content(["b2"], forum="beta", written_date_time="2024-03-01 10:00:00")
+    database.add_summaries([make_summary("b2")])
+    assert store.export(database) == 1
+    rows = _rows(store)
+    assert set(rows) == {"a1", "a2", "a3", "b1", "b2"}
+    assert (rows["a3"]["forum"], rows["a3"]["month"]) == ("alpha", "2024-02")
+    assert set(r["content_hash"] for r in store.read_table(columns=["content_hash"], forums=["beta"]).to_pylist()) == {"b1", "b2"}
+
+
+def test_updated_summaries_rewrite_their_partition(tmp_path, database, add_content, make_summary):
+    _snapshot(database, add_content, make_summary)
+    store = ParquetSnapshotStore(str(tmp_path / "snapshots"))
+    store.export(database)
+    other_files = _partition_files(store, "alpha", "2024-02")
+
+    database.update_stage_results([_stage_result("a1", "cat.n.01")])
+    assert store.export(database) == 1
+    rows = _rows(store)
+    assert len(rows) == 4
+    assert (rows["a1"]["topic_synset_id"], rows["a1"]["wsd_version"]) == ("cat.n.01", 2)
+    assert rows["a2"]["topic_synset_id"] is None
+    assert len(_partition_files(store, "alpha", "2024-01")) == 1
+    assert _partition_files(store, "alpha", "2024-02") == other_files
+    assert store.export(database) == 0
+
+
+def test_appended_summaries_are_not_rewritten(tmp_path, database, add_content, make_summary):
+    _snapshot(database, add_content, make_summary)
+    store = ParquetSnapshotStore(str(tmp_path / "snapshots"))
+    store.export(database)
+
+    add_content(["b2"], forum="beta")
+    database.add_summaries([make_summary("b2")])
+    database.update_stage_results([_stage_result("b2", "dog.n.01")])
+    # b2 is appended with its update, only a1 needs its partition rewritten
+    database.update_stage_results([_stage_result("a1", "cat.n.01")])
+    assert store.export(database) == 2
+    rows = _rows(store)
+    assert rows["b2"]["topic_synset_id"] == "dog.n.01"
+    assert rows["a1"]["topic_synset_id"] == "cat.n.01"
+    assert store.export(database) == 0
+
+
+def test_interrupted_rewrite_is_finished(tmp_path, database, add_content, make_summary):
+    _snapshot(database, add_content, make_summary)
+    store = ParquetSnapshotStore(str(tmp_path / "snapshots"))
+    store.export(database)
+
+    # a rewrite that stopped after writing its journal and new file
+    directory = os.path.join(store.root_dir, "forum=beta", "month=2024-01")
+    (old_file,) = _partition_files(store, "beta", "2024-01")
+    shutil.copyfile(os.path.join(directory, old_file), os.path.join(directory, "_part-u99.parquet"))
+    with open(os.path.join(store.root_dir, REWRITE_JOURNAL_FILE), "w", encoding="utf-8") as f:
+        json.dump(
+            {
+                "delete": [os.path.join(directory, old_file)],
+                "write": os.path.join(directory, "_part-u99.parquet"),
+                "rename": os.path.join(directory, "part-u99-0.parquet"),
+            },
+            f,
+        )
+
+    assert store.export(database) == 0
+    assert _partition_files(store, "beta", "2024-01") == ["part-u99-0.parquet"]
+    assert not os.path.exists(os.path.join(store.root_dir, REWRITE_JOURNAL_FILE))
+    assert len(_rows(store)) == 4
@@ -0,0 +1,119 @@
+import asyncio
+import concurrent.futures
+import sqlite3
+
+import d_04_reprocess_stages
+from csa_app.ambiguty_processor import (
+    WSD_VERSION, MultipleChoiceAnswer, MultipleChoiceBatchResponse, MultipleChoiceResponse,
+)
+from csa_app.database import DatabaseSqlLite
+from csa_app.model import ContributorResult
+from csa_app.synset_database import EXPANSION_VERSION
+from csa_app.wse_models import SynsetOption
+
+
+MODEL_ID = "model"
+PROMPT_STRATEGY = "v1"
+
+PARENTS = {"bank.n.01": ["slope.n.01"], "bank.n.02": ["institution.n.01"], "run.v.01": []}
+
+
+class SynsetDatabase:
+    def get_noun_synsets(self, lemma):
+        return [SynsetOption("bank.n.01", "sloping land"), SynsetOption("bank.n.02", "a financial institution")] if lemma == "bank" else []
+
+    def get_verb_synsets(self, lemma):
+        return [SynsetOption("run.v.01", "move fast")] if lemma == "run" else []
+
+    def get_parent_ids(self, synset_id):
+        return list(PARENTS[synset_id])
+
+
+def _store(database, add_content, make_summary):
+    add_content(["a", "b", "c"])
+    database.add_summaries(
+        [
+            # disambiguated by an older WSD version
+            make_summary("a", topic_lemma="bank", topic_synset_id="bank.n.01", topic_values=["slope.n.01", "bank.n.01"],
+                         method_lemma="run", method_synset_id="run.v.01", method_values=["run.v.01"], wsd_version=WSD_VERSION - 1),
+            # expanded by an older expansion version
+            make_summary("b", topic_lemma="bank", topic_synset_id="bank.n.02", topic_values=["bank.n.02"],
+                         method_lemma=None, expansion_version=EXPANSION_VERSION - 1),
+            make_summary("c", topic_lemma="bank", topic_synset_id="bank.n.01", topic_values=["slope.n.01", "bank.n.01"],
+                         method_lemma=None, wsd_version=WSD_VERSION, expansion_version=EXPANSION_VERSION),
+        ]
+    )
+
+
+def _table(database, sql):
+    with database.connections.connection() as c:
+        return c.execute(sql).fetchall()
+
+
+def _rebuilt_rollups(database):
+    # the rollups migration 4 computes from scratch
+    raw = sqlite3.connect(database.db_file_path)
+    raw.execute("PRAGMA user_version = 3")
+    raw.commit()
+    raw.close()
+    return _table(DatabaseSqlLite(database.db_file_path), "SELECT * FROM sentiment_rollups ORDER BY 1, 2, 3, 4, 5, 6")
+
+
+def test_stale_rows_are_paged_by_version(database, add_content, make_summary):
+    _store(database, add_content, make_summary)
+    rows = database.get_stale_stage_rows(WSD_VERSION, EXPANSION_VERSION)
+    assert [(r.content_hash, r.topic_lemma, r.method_lemma, r.wsd_version) for r in rows] == [
+        ("a", "bank", "run", WSD_VERSION - 1), ("b", "bank", None, WSD_VERSION)
+    ]
+    assert [r.content_hash for r in database.get_stale_stage_rows(WSD_VERSION, EXPANSION_VERSION, rows[0].rowid)] == ["b"]
+    assert len(database.get_stale_stage_rows(WSD_VERSION, EXPANSION_VERSION, number=1)) == 1
+    # every summary is stale against a catalog it was not resolved with
+    assert len(database.get_stale_stage_rows(WSD_VERSION, EXPANSION_VERSION, contributor_version="v2")) == 3
+
+    database.update_contributor_results([ContributorResult("c", MODEL_ID, PROMPT_STRATEGY, ["ent.ada"], "v2")])
+    assert [r.content_hash for r in database.get_stale_stage_rows(WSD_VERSION, EXPANSION_VERSION, contributor_version="v2")] == ["a", "b"]
+    assert _table(database, "SELECT content_hash, synset_id FROM summary_synsets WHERE role = 'contributor'") == [("c", "ent.ada")]
+
+
+def test_reprocess_redoes_only_the_stale_stages(database, add_content, make_summary, monkeypatch):
+    _store(database, add_content, make_summary)
+    generation = database.get_summary_generation()
+    prompts = []
+
+    async def ask_batch(prompt, limiter=None, cache=None):
+        prompts.append(prompt)
+        return MultipleChoiceBatchResponse(answers=[MultipleChoiceAnswer(question=1, letter="B")]), 1.0, "batch"
+
+    async def ask_single(prompt, limiter=None, cache=None):
+        prompts.append(prompt)
+        return MultipleChoiceResponse(letter="B"), 1.0, "single"
+
+    monkeypatch.setattr(d_04_reprocess_stages, "synset_database", SynsetDatabase())
+    monkeypatch.setattr(d_04_reprocess_stages, "batch_ambiguity_clarifier", ask_batch)
+    monkeypatch.setattr(d_04_reprocess_stages, "ambiguity_clarifier", ask_single)
+    monkeypatch.setattr(d_04_reprocess_stages, "sense_ranker", None)
+    monkeypatch.setattr(d_04_reprocess_stages, "expansion_workers", 2)
+    with concurrent.futures.ThreadPoolExecutor(max_workers=2) as executor:
+        totals = asyncio.run(d_04_reprocess_stages.reprocess(database, executor))
+
+    assert dict(totals) == {"disambiguated": 1, "failed": 0, "expanded": 1, "contributors_resolved": 0, "contributors_failed": 0}
+    # one prompt for the stale row "a", its single-option method needs none
+    assert len(prompts) == 1
+    assert _table(
+        database,
+        """SELECT content_hash, topic_synset_id, topic_values, method_values, wsd_version, expansion_version, updated_generation
+        FROM sentiment_summaries ORDER BY content_hash""",
+    ) == [
+        ("a", "bank.n.02", "institution.n.01! bank.n.02!", "run.v.01!", WSD_VERSION, EXPANSION_VERSION, generation + 1),
+        ("b", "bank.n.02", "institution.n.01! bank.n.02!", None, WSD_VERSION, EXPANSION_VERSION, generation + 1),
+        ("c", "bank.n.01", "slope.n.01! bank.n.01!", None, WSD_VERSION, EXPANSION_VERSION, None),
+    ]
+    assert _table(database, "SELECT content_hash, synset_id FROM summary_synsets WHERE role = 'topic' ORDER BY 1, 2") == [
+        ("a", "bank.n.02"), ("a", "institution.n.01"), ("b", "bank.n.02"), ("b", "institution.n.01"),
+        ("c", "bank.n.01"), ("c", "slope.n.01"),
+    ]
+    assert database.get_stale_stage_rows(WSD_VERSION, EXPANSION_VERSION) == []
+
+    rollups = _table(database, "SELECT * FROM sentiment_rollups ORDER BY 1, 2, 3, 4, 5, 6")
+    assert ("topic", "bank.n.01", 1, "region", "forum", "2024-01-15", 1) in rollups
+    assert rollups == _rebuilt_rollups(database)
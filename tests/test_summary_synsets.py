@@ -0,0 +1,74 @@
+import sqlite3
+
+from csa_app.database import DatabaseSqlLite
+
+
+def _store(database, add_content, make_summary):
+    add_content(["a", "b"], written_date_time="2024-01-10 08:00:00")
+    add_content(["c", "d"], written_date_time="2024-02-10 08:00:00")
+    database.add_summaries(
+        [
+            make_summary("a", topic_values=["animal.n.01", "dog.n.01"], method_values=["run.v.01"], contributors_values=["ent.ada"]),
+            make_summary("b", topic_values=["animal.n.01", "cat.n.01"], sentiment=False),
+            make_summary("c", topic_values=["dog.n.01"], method_values=["run.v.01"], contributors_values=["ent.bob"]),
+            # "dog.n.011" must not match a filter on dog.n.01
+            make_summary("d", topic_values=["dog.n.011"], contributors_values=["ent.ada", "ent.bob"]),
+        ]
+    )
+
+
+def _unrolled(database, **filters) -> set:
+    # the LIKE scan the posting table replaced, matching whole "id!" entries
+    clauses, params = [], []
+    for column, key in (("topic_values", "topic_id"), ("method_values", "method_id"), ("contributors_values", "contributor_id")):
+        if filters.get(key) is not None:
+            clauses.append(f"' ' || s.{column} || ' ' LIKE ?")
+            params.append(f"% {filters[key]}! %")
+    if filters.get("sentiment") is not None:
+        clauses.append("s.sentiment = ?")
+        params.append(1 if filters["sentiment"] else 0)
+    with database.connections.connection() as c:
+        return set(
+            h for (h,) in c.execute(
+                "SELECT s.content_hash FROM sentiment_summaries s" + (" WHERE " + " AND ".join(clauses) if clauses else ""),
+                params,
+            )
+        )
+
+
+FILTERS = [
+    {"topic_id": "dog.n.01"},
+    {"topic_id": "animal.n.01"},
+    {"topic_id": "animal.n.01", "sentiment": False},
+    {"method_id": "run.v.01", "contributor_id": "ent.bob"},
+    {"contributor_id": "ent.ada"},
+    {"topic_id": "missing.n.01"},
+]
+
+
+def test_filters_match_the_unrolled_scan(database, add_content, make_summary):
+    _store(database, add_content, make_summary)
+    for filters in FILTERS:
+        assert set(database.lookup_sentiment_summaries(**filters)["content_hash"]) == _unrolled(database, **filters), filters
+    assert set(
+        database.lookup_sentiment_summaries(topic_id="dog.n.01", start_content_datetime="2024-02-01")["content_hash"]
+    ) == {"c"}
+
+
+def test_migration_backfills_summary_synsets(tmp_path, database, add_content, make_summary):
+    _store(database, add_content, make_summary)
+    with database.connections.connection() as c:
+        expected = c.execute("SELECT * FROM summary_synsets ORDER BY 1, 2, 3, 4, 5").fetchall()
+    # a database written before the posting table existed
+    raw = sqlite3.connect(database.db_file_path)
+    raw.execute("DELETE FROM summary_synsets")
+    raw.execute("PRAGMA user_version = 0")
+    raw.commit()
+    raw.close()
+
+    migrated = DatabaseSqlLite(database.db_file_path)
+    with migrated.connections.connection() as c:
+        assert c.execute("SELECT * FROM summary_synsets ORDER BY 1, 2, 3, 4, 5").fetchall() == expected
+    assert len(expected) == 12
+    for filters in FILTERS:
+        assert set(migrated.lookup_sentiment_summaries(**filters)["content_hash"]) == _unrolled(migrated, **filters)
@@ -0,0 +1,57 @@
+from csa_app.synset_database import LruCache, SynsetDatabaseWordNet
+from csa_app.wordnet_snapshot import WordNetSnapshot
+
+
+SYNSETS = {
+    "bank.n.01": ("sloping land beside a body of water", []),
+    "bank.n.02": ("a financial institution", ["institution.n.01"]),
+    "institution.n.01": ("an organization founded for a purpose", []),
+    "bank.v.01": ("do business with a bank", []),
+}
+LEMMA_INDEX = {
+    ("bank", "n"): ["bank.n.01", "bank.n.02"],
+    ("bank", "v"): ["bank.v.01"],
+    ("institution", "n"): ["institution.n.01"],
+}
+
+
+def _synset_database(tmp_path, cache_size=100) -> SynsetDatabaseWordNet:
+    WordNetSnapshot.build(str(tmp_path / "snapshot"), SYNSETS, LEMMA_INDEX, {"n": {}, "v": {}}, {"n": [["s", ""]], "v": [["s", ""]]})
+    return SynsetDatabaseWordNet(cache_size=cache_size, snapshot_path=str(tmp_path / "snapshot"))
+
+
+def test_lru_cache_evicts_least_recently_used():
+    cache = LruCache(max_size=2)
+    cache.put("a", 1)
+    cache.put("b", 2)
+    assert cache.get("a") == 1
+    cache.put("c", 3)
+    assert cache.get("b") is None
+    assert (cache.get("a"), cache.get("c")) == (1, 3)
+    assert cache.stats() == {"size": 2, "hits": 3, "misses": 1, "hit_rate": 0.75}
+
+
+def test_synset_lookups_are_cached(tmp_path):
+    synset_database = _synset_database(tmp_path)
+    first = synset_database.get_noun_synsets("banks")
+    assert [o.id for o in first] == ["bank.n.01", "bank.n.02"]
+    assert synset_database.get_noun_synsets("banks") is first
+    assert [o.id for o in synset_database.get_verb_synsets("banks")] == ["bank.v.01"]
+    assert synset_database.synset_cache.stats()["hits"] == 1
+    assert synset_database.get_parent_ids("bank.n.02") == ["institution.n.01"]
+
+
+def test_cache_is_bounded(tmp_path):
+    synset_database = _synset_database(tmp_path, cache_size=1)
+    synset_database.get_noun_synsets("bank")
+    synset_database.get_noun_synsets("institution")
+    synset_database.get_noun_synsets("bank")
+    assert synset_database.synset_cache.stats()["hits"] == 0
+
+
+def test_warm_cache_loads_frequent_lemmas(tmp_path, database, add_content, make_summary):
+    add_content(["a", "b"])
+    database.add_summaries([make_summary("a", topic_lemma="bank", method_lemma="bank"), make_summary("b", topic_lemma="bank", method_lemma=None)])
+    synset_database = _synset_database(tmp_path)
+    synset_database.warm_cache(database)
+    assert set(synset_database.synset_cache.entries) == {("bank", "n"), ("bank", "v")}
@@ -0,0 +1,70 @@
+import random
+
+from csa_app.synset_search import SynsetSearchIndex, normalize_lemma
+
+
+SYNSETS = [
+    ("bank.n.01", "sloping land beside a body of water", ["bank"]),
+    ("bank.n.02", "a financial institution that accepts deposits", ["bank", "banking_company"]),
+    ("bank.v.01", "do business with a bank", ["bank"]),
+    ("bankruptcy.n.01", "a state of complete lack of some abstract property", ["bankruptcy"]),
+    ("banker.n.01", "a financier who owns or is an executive in a bank", ["banker"]),
+    ("institution.n.01", "an organization founded for a specific purpose", ["institution", "establishment"]),
+    ("run.v.01", "move fast by using one's feet", ["run"]),
+]
+FREQUENCIES = {"topic": {"bank.n.02": 5, "banker.n.01": 2}, "method": {"bank.v.01": 7}}
+
+
+def _ids(options):
+    return [o.id for o in options]
+
+
+def _brute_force_prefix(synsets, weights, query, pos=None):
+    # every synset with a lemma starting with the query, exact lemmas first
+    exact, prefixed = {}, {}
+    for synset_id, _, lemmas in synsets:
+        if pos is not None and synset_id.split(".")[-2] not in pos:
+            continue
+        for lemma in map(normalize_lemma, lemmas):
+            if lemma == query:
+                exact[synset_id] = (-weights.get(synset_id, 0), synset_id)
+            elif lemma.startswith(query):
+                key = (-weights.get(synset_id, 0), len(lemma), synset_id)
+                prefixed[synset_id] = min(key, prefixed.get(synset_id, key))
+    ranked = sorted(exact, key=exact.get)
+    return ranked + [i for i in sorted(prefixed, key=prefixed.get) if i not in exact]
+
+
+def test_prefix_results_rank_by_role_frequency():
+    index = SynsetSearchIndex(SYNSETS, FREQUENCIES, top_k=3)
+    assert _ids(index.search("bank", role="topic")) == ["bank.n.02", "bank.n.01", "bank.v.01"]
+    assert _ids(index.search("bank", role="method")) == ["bank.v.01", "bank.n.01", "bank.n.02"]
+    assert _ids(index.search("Bank", role="topic", pos=("n",), k=5)) == [
+        "bank.n.02", "bank.n.01", "banker.n.01", "bankruptcy.n.01"
+    ]
+    assert index.search("   ") == []
+
+
+def test_misspellings_and_glosses_still_match():
+    index = SynsetSearchIndex(SYNSETS, FREQUENCIES)
+    assert _ids(index.search("instutition"))[0] == "institution.n.01"
+    assert _ids(index.search("financial deposits")) == ["bank.n.02"]
+    assert _ids(index.search("banking company")) == ["bank.n.02"]
+
+
+def test_prefixes_match_the_brute_force_ranking():
+    for seed in range(10):
+        rng = random.Random(seed)
+        synsets = []
+        for i in range(300):
+            lemmas = ["".join(rng.choice("abc") for _ in range(rng.randint(1, 6))) for _ in range(rng.randint(1, 3))]
+            synsets.append((f"s{i}.{rng.choice('nv')}.01", "gloss", lemmas))
+        weights = {s[0]: rng.randint(0, 20) for s in synsets if rng.random() < 0.5}
+        # the other role outweighs the searched one on most synsets
+        other = {s[0]: rng.randint(0, 40) for s in synsets}
+        index = SynsetSearchIndex(synsets, {"topic": weights, "method": other}, top_k=5)
+
+        for query in ["a", "b", "ab", "cab", "abca", "bbbb"]:
+            for pos in (None, ("v",)):
+                expected = _brute_force_prefix(synsets, weights, query, pos)
+                assert _ids(index.search(query, role="topic", pos=pos))[: len(expected)] == expected[:5], (seed, query, pos)
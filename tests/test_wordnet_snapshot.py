@@ -0,0 +1,77 @@
+import pytest
+from nltk.corpus.reader.wordnet import WordNetCorpusReader
+
+from csa_app.wordnet_snapshot import WordNetSnapshot, build_from_wordnet
+
+
+SYNSETS = {
+    "church.n.01": ("a place for public worship", []),
+    "church.n.02": ("a service conducted in a church", ["church.n.01"]),
+    "mouse.n.01": ("a small rodent", []),
+    "box.n.01": ("a rigid container", []),
+    "woman.n.01": ("an adult female person", []),
+    "run.v.01": ("move fast using one's feet", []),
+    "fly.v.01": ("travel through the air", []),
+}
+LEMMA_INDEX = {
+    ("church", "n"): ["church.n.01", "church.n.02"],
+    ("mouse", "n"): ["mouse.n.01"],
+    ("box", "n"): ["box.n.01"],
+    ("woman", "n"): ["woman.n.01"],
+    ("run", "v"): ["run.v.01"],
+    ("fly", "v"): ["fly.v.01"],
+}
+EXCEPTIONS = {"n": {"mice": ["mouse"]}, "v": {"ran": ["run"], "flew": ["fly"]}}
+SUBSTITUTIONS = {pos: list(WordNetCorpusReader.MORPHOLOGICAL_SUBSTITUTIONS[pos]) for pos in ("n", "v")}
+# "churcheses" needs the rules applied twice, which NLTK no longer does
+INFLECTED_FORMS = [
+    ("churches", "n"), ("church", "n"), ("Churches", "n"), ("churcheses", "n"), ("mice", "n"), ("boxes", "n"),
+    ("women", "n"), ("dogs", "n"), ("runs", "v"), ("ran", "v"), ("running", "v"), ("flies", "v"), ("flew", "v"),
+]
+
+
+def _offset_map() -> dict:
+    offset_map = {}
+    for (lemma, pos), ids in LEMMA_INDEX.items():
+        offset_map.setdefault(lemma, {})[pos] = ids
+    return offset_map
+
+
+class _Reader:
+    # the attributes WordNetCorpusReader._morphy reads, without the corpus
+    _exception_map = EXCEPTIONS
+    MORPHOLOGICAL_SUBSTITUTIONS = SUBSTITUTIONS
+    _lemma_pos_offset_map = _offset_map()
+
+
+@pytest.fixture
+def snapshot(tmp_path) -> WordNetSnapshot:
+    WordNetSnapshot.build(str(tmp_path), SYNSETS, LEMMA_INDEX, EXCEPTIONS, SUBSTITUTIONS)
+    return WordNetSnapshot(str(tmp_path))
+
+
+def test_morphology_matches_nltk(snapshot):
+    for form, pos in INFLECTED_FORMS:
+        expected = WordNetCorpusReader._morphy(_Reader(), form.lower(), pos)
+        assert snapshot._morphy(form.lower(), pos) == expected, form
+
+
+def test_synsets_in_sense_order(snapshot):
+    assert [snapshot.names[i] for i in snapshot.synsets("Churches", "n")] == ["church.n.01", "church.n.02"]
+    assert [snapshot.names[i] for i in snapshot.synsets("mice", "n")] == ["mouse.n.01"]
+    assert snapshot.synsets("mice", "v") == []
+    assert snapshot.get_parent_ids("church.n.02") == ["church.n.01"]
+
+
+def test_synsets_match_wordnet(tmp_path):
+    from nltk.corpus import wordnet as wn
+
+    try:
+        wn.ensure_loaded()
+    except LookupError:
+        pytest.skip("the WordNet corpus is not installed")
+    build_from_wordnet(str(tmp_path))
+    snapshot = WordNetSnapshot(str(tmp_path))
+    for lemma in ["dogs", "geese", "churches", "women", "running", "flew", "analyses", "boxes", "Bank", "mice"]:
+        for pos in (wn.NOUN, wn.VERB):
+            assert [snapshot.names[i] for i in snapshot.synsets(lemma, pos)] == [s.name() for s in wn.synsets(lemma, pos)]
@@ -0,0 +1,81 @@
+import json
+
+from csa_app.database import DatabaseSqlLite, WORK_FAILED, WORK_LEASED, WORK_PENDING
+
+
+MODEL_ID = "model"
+PROMPT_STRATEGY = "v1"
+
+
+def _database(tmp_path, number=3) -> DatabaseSqlLite:
+    database = DatabaseSqlLite(str(tmp_path / "data.db"))
+    database.add_content_rows(
+        [
+            (f"hash{i}", f"body {i}", "author", "forum", json.dumps({}), "2024-01-01 00:00:00", "region", None)
+            for i in range(number)
+        ]
+    )
+    database.enqueue_content(MODEL_ID, PROMPT_STRATEGY)
+    return database
+
+
+def _queue(database):
+    with database.connections.connection() as c:
+        return {
+            h: (state, owner, attempts)
+            for h, state, owner, attempts in c.execute(
+                "SELECT content_hash, state, lease_owner, attempts FROM work_queue"
+            )
+        }
+
+
+def _claim(database, worker_id, number=10, lease_seconds=600, max_attempts=3):
+    batch = database.claim_work(worker_id, MODEL_ID, PROMPT_STRATEGY, number, lease_seconds, max_attempts)
+    return set(batch.content_hash)
+
+
+def test_claims_do_not_overlap(tmp_path):
+    database = _database(tmp_path, number=5)
+    first = _claim(database, "a", number=3)
+    second = _claim(database, "b", number=3)
+
+    assert len(first) == 3
+    assert len(second) == 2
+    assert first.isdisjoint(second)
+    assert _claim(database, "c") == set()
+    assert all(state == WORK_LEASED for state, _, _ in _queue(database).values())
+
+
+def test_released_items_fail_after_max_attempts(tmp_path):
+    database = _database(tmp_path, number=1)
+    for attempt in range(3):
+        assert _claim(database, "a") == {"hash0"}
+        database.release_work("a", MODEL_ID, PROMPT_STRATEGY, ["hash0"])
+        assert _queue(database)["hash0"] == (WORK_PENDING, None, attempt + 1)
+
+    assert _claim(database, "a") == set()
+    assert _queue(database)["hash0"] == (WORK_FAILED, None, 3)
+
+
+def test_expired_leases_are_taken_over(tmp_path):
+    database = _database(tmp_path, number=1)
+    assert _claim(database, "a", lease_seconds=-1) == {"hash0"}
+    assert _claim(database, "b", lease_seconds=-1) == {"hash0"}
+    assert _queue(database)["hash0"] == (WORK_LEASED, "b", 2)
+
+    # the previous owner can neither release nor heartbeat the item any more
+    database.release_work("a", MODEL_ID, PROMPT_STRATEGY, ["hash0"])
+    assert database.heartbeat_work("a", MODEL_ID, PROMPT_STRATEGY) == 0
+    assert _queue(database)["hash0"] == (WORK_LEASED, "b", 2)
+
+    assert _claim(database, "c", lease_seconds=-1, max_attempts=3) == {"hash0"}
+    assert _claim(database, "d", max_attempts=3) == set()
+    assert _queue(database)["hash0"] == (WORK_FAILED, None, 3)
+
+
+def test_heartbeat_keeps_leases(tmp_path):
+    database = _database(tmp_path, number=2)
+    assert len(_claim(database, "a", lease_seconds=-1)) == 2
+    assert database.heartbeat_work("a", MODEL_ID, PROMPT_STRATEGY, lease_seconds=600) == 2
+    assert _claim(database, "b") == set()
+